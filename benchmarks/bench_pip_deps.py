@@ -0,0 +1,76 @@
+# bench_pip_deps.py
+"""Compare the native pip dependencies lookup (site-packages scan) with the
+`conda env export --no-builds` subprocess path.
+
+Usage:
+    python -m benchmarks.bench_pip_deps [-n_conda 600] [-n_pip 100] [-env NAME]
+                                        [-n_lines 5000]
+
+The native path is timed on a synthetic prefix; the subprocess path needs
+`-env`, the name of an existing env, on which both paths are then compared.
+The pip version policies (pipspec) are timed on a list of n_lines entries.
+"""
+import sys
+import time
+import tempfile
+from pathlib import Path
+from argparse import ArgumentParser
+
+from new_conda_env import processing as proc
+from new_conda_env import pipspec
+from benchmarks.fixtures import make_prefix
+
+
+def best_of(fn, repeat: int=5) -> float:
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return min(times)
+
+
+def main(argv=None):
+    p = ArgumentParser(prog="benchmarks.bench_pip_deps")
+    p.add_argument("-n_conda", type=int, default=600)
+    p.add_argument("-n_pip", type=int, default=100)
+    p.add_argument("-env", type=str, default="",
+                   help="Existing env to also time the export subprocess on.")
+    p.add_argument("-n_lines", type=int, default=5000)
+    args = p.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        prefix = make_prefix(Path(tmp), n_conda=args.n_conda, n_pip=args.n_pip)
+        t = best_of(lambda: proc.get_site_pip_deps(prefix))
+        print(f"native, synthetic ({args.n_conda} conda + {args.n_pip} pip): "
+              f"{t * 1000:.2f} ms")
+
+    forms = ["pkg{}=={}.2.3", "pkg{}[extra]>=1.{},<3 ; python_version >= '3.8'",
+             "pkg{}~=2.{}", "pkg{} @ https://example.com/pkg{}.whl"]
+    lines = [forms[i % len(forms)].format(i, i % 10) for i in range(args.n_lines)]
+    for policy in pipspec.PIP_POLICIES:
+        t = best_of(lambda: pipspec.normalize_requirements(lines, policy))
+        print(f"pip policy {policy!r}, {args.n_lines} entries: {t * 1000:.2f} ms")
+
+    if not args.env:
+        return 0
+
+    from conda.base.context import context
+    prefix = Path(context.envs_dirs[0]).joinpath(args.env)
+
+    def export():
+        cmd = f"conda env export -n {args.env} --no-builds"
+        return proc.get_pip_deps(proc.load_as_yml(proc.run_export(cmd)))
+
+    t_native = best_of(lambda: proc.get_site_pip_deps(prefix))
+    t_export = best_of(export, repeat=1)
+    print(f"native, {args.env}: {t_native * 1000:.2f} ms")
+    print(f"export, {args.env}: {t_export * 1000:.2f} ms")
+    same = proc.get_site_pip_deps(prefix) == export()
+    print(f"same pip deps: {same}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
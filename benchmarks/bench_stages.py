@@ -0,0 +1,120 @@
+# bench_stages.py
+"""Time each stage of CondaEnvir.get_new_env_yaml on synthetic env prefixes
+of increasing size & write the results as json, to be tracked across releases.
+
+Stages:
+- context: conda context initialization (CondaEnvir.get_conda_info)
+- export:  --from-history data (native conda-meta/history replay)
+- parse:   parse of an export stream of the same size (read-only path)
+- pip:     pip dependencies (native site-packages scan)
+- merge:   CondaEnvir.merge_export_data
+- save:    processing.save_to_yml
+A stage that cannot run here (e.g. conda not installed, or no activated base
+env for the context) is recorded as null.
+
+Usage:
+    python -m benchmarks.bench_stages [-sizes 10 100 1000 10000] [-out FILE]
+"""
+import sys
+import json
+import time
+import copy
+import platform
+import tempfile
+from pathlib import Path
+from argparse import ArgumentParser
+
+from new_conda_env import VERSION, envir, processing as proc
+from benchmarks.fixtures import make_basic_info, make_prefix, make_export_text
+
+
+SIZES = [10, 100, 1000, 10000]
+
+try:
+    import conda
+    HAS_CONDA = True
+except ImportError:
+    HAS_CONDA = False
+
+
+def timed(fn, repeat: int=3, errors: tuple=(ImportError,)):
+    """Return (best time in s, last result), or (None, None) if fn
+    raises one of errors, i.e. needs what is not installed here.
+    """
+    best, out = None, None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        try:
+            out = fn()
+        except errors:
+            return None, None
+        t = time.perf_counter() - t0
+        best = t if best is None else min(best, t)
+    return best, out
+
+
+def bench_size(root: Path, n: int, repeat: int=3) -> dict:
+    """Return {stage: seconds or None} for an env of n conda packages."""
+    n_pip = max(1, n // 5)
+    make_prefix(root.joinpath("envs", "bench"), n_conda=n, n_pip=n_pip)
+    ce = envir.CondaEnvir(old_ver="3.10", new_ver="3.11",
+                          env_to_clone="bench",
+                          basic_info=make_basic_info(root),
+                          display_new_yml=False, use_cache=False)
+    stages = {}
+    # get_conda_info raises ValueError (TypeError if no env is active) when
+    # not run from the activated base env
+    stages["context"], _ = timed(envir.CondaEnvir.get_conda_info, repeat,
+                                 errors=(ImportError, ValueError, TypeError))
+    if HAS_CONDA:
+        history_yml = ce.get_history_yml
+    else:
+        # same work, without conda's canonical spec formatting
+        def history_yml():
+            return {"name": ce.env_to_clone, "channels": ["conda-forge"],
+                    "dependencies": proc.get_history_specs(ce.old_prefix,
+                                                           canonical=False),
+                    "prefix": str(ce.old_prefix)}
+    stages["export"], yml_his = timed(history_yml, repeat)
+
+    text = make_export_text(n_deps=n, n_pip=n_pip)
+    stages["parse"], _ = timed(lambda: proc.load_as_yml(text, round_trip=False),
+                               repeat)
+    stages["pip"], clean_pips = timed(ce.get_site_pip_deps, repeat)
+    clean_pips = clean_pips[1] if clean_pips else None
+    stages["merge"], merged = timed(
+        lambda: ce.merge_export_data(copy.deepcopy(yml_his), clean_pips), repeat)
+    stages["save"], _ = timed(lambda: proc.save_to_yml(ce.new_yml, merged), repeat)
+
+    return stages
+
+
+def main(argv=None):
+    p = ArgumentParser(prog="benchmarks.bench_stages")
+    p.add_argument("-sizes", type=int, nargs="+", default=SIZES)
+    p.add_argument("-repeat", type=int, default=3)
+    p.add_argument("-out", type=str, default="bench_stages.json")
+    args = p.parse_args(argv)
+
+    results = []
+    for n in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            stages = bench_size(Path(tmp), n, args.repeat)
+        results.append({"n_packages": n, "stages": stages})
+        cells = "  ".join(f"{k}={'n/a' if v is None else f'{v * 1000:.2f}ms'}"
+                          for k, v in stages.items())
+        print(f"{n:>6}: {cells}")
+
+    report = {"version": VERSION,
+              "python": platform.python_version(),
+              "platform": platform.platform(),
+              "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+              "results": results}
+    Path(args.out).write_text(json.dumps(report, indent=2))
+    print(f"Results saved to {args.out}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
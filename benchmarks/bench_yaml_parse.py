@@ -0,0 +1,39 @@
+# bench_yaml_parse.py
+"""Compare the parse time of an export stream with the round-trip loader
+(ruamel object model), the safe loader & the fast export line parser.
+
+Usage:
+    python -m benchmarks.bench_yaml_parse [-n_deps 1000] [-n_pip 100]
+"""
+import sys
+from argparse import ArgumentParser
+
+from new_conda_env import processing as proc
+from benchmarks.fixtures import make_export_text
+from benchmarks.bench_pip_deps import best_of
+
+
+def main(argv=None):
+    p = ArgumentParser(prog="benchmarks.bench_yaml_parse")
+    p.add_argument("-n_deps", type=int, default=1000)
+    p.add_argument("-n_pip", type=int, default=100)
+    args = p.parse_args(argv)
+
+    text = make_export_text(n_deps=args.n_deps, n_pip=args.n_pip)
+    loaders = {"round-trip": proc.yaml_round_trip_load,
+               "safe": proc.yaml_safe_load,
+               "export line parser": proc.parse_export}
+    print(f"Export with {args.n_deps} deps & {args.n_pip} pip deps:")
+    for label, load in loaders.items():
+        try:
+            t = best_of(lambda: load(text))
+        except ImportError as err:
+            print(f"  {label:<20}: n/a ({err})")
+            continue
+        print(f"  {label:<20}: {t * 1000:8.2f} ms")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
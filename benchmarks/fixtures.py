@@ -0,0 +1,124 @@
+# fixtures.py
+"""Generator of synthetic conda env prefixes for the benchmarks:
+no network access or conda installation is needed.
+"""
+import json
+import hashlib
+from pathlib import Path
+
+jp = Path.joinpath
+
+
+CHANNEL = "https://conda.anaconda.org/conda-forge"
+
+
+def make_record(name: str, ver: str, build: str, subdir: str="noarch",
+                files: list=(), depends: list=()) -> dict:
+    """Return a conda-meta record (subset of the fields conda writes)."""
+    fn = f"{name}-{ver}-{build}.tar.bz2"
+    # stable across runs (hash() of a str is salted per process)
+    digest = hashlib.md5(fn.encode()).hexdigest()
+    return {"name": name, "version": ver, "build": build, "build_number": 0,
+            "channel": f"{CHANNEL}/{subdir}", "subdir": subdir, "fn": fn,
+            "url": f"{CHANNEL}/{subdir}/{fn}", "md5": digest,
+            "sha256": (digest * 2)[:64], "depends": list(depends),
+            "files": list(files)}
+
+
+def make_history(specs: list, py_ver: str="3.10", per_request: int=5) -> str:
+    """Return a conda-meta/history text: the env creation (python) then
+    one request per per_request specs, every 10th request also removing
+    & re-installing a package (so that the replay does some work).
+    """
+    lines = []
+    def request(i, cmd, action, req_specs):
+        lines.append(f"==> 2023-01-01 00:{i // 60 % 60:02d}:{i % 60:02d} <==")
+        lines.append(f"# cmd: conda {cmd} {' '.join(req_specs)}")
+        lines.append("# conda version: 23.1.0")
+        lines.extend(f"+conda-forge/noarch::{s}-1.0-py_0" for s in req_specs)
+        lines.append(f"# {action} specs: {req_specs!r}")
+
+    request(0, "create -n env", "update", [f"python={py_ver}"])
+    for i in range(0, len(specs), per_request):
+        batch = specs[i:i + per_request]
+        request(i + 1, "install", "update", batch)
+        if (i // per_request) % 10 == 9:
+            request(i + 2, "remove", "remove", batch[:1])
+            request(i + 3, "install", "update", batch[:1])
+    return "\n".join(lines) + "\n"
+
+
+def make_prefix(root: Path, n_conda: int=500, n_pip: int=100,
+                py_ver: str="3.10", hist_every: int=3) -> Path:
+    """Create a fake env prefix under root with:
+    - n_conda conda-meta records (+ python), each python package owning a
+      .dist-info dir in site-packages,
+    - a conda-meta/history requesting 1 package in hist_every,
+    - n_pip pip-installed .dist-info dirs.
+    """
+    prefix = Path(root)
+    meta = jp(prefix, "conda-meta")
+    meta.mkdir(parents=True, exist_ok=True)
+    sp_rel = f"lib/python{py_ver}/site-packages"
+    site = jp(prefix, sp_rel)
+    site.mkdir(parents=True, exist_ok=True)
+
+    py = make_record("python", f"{py_ver}.8", "h4a9ceb5_0_cpython", "linux-64",
+                     files=[f"bin/python{py_ver}"])
+    jp(meta, "python-{version}-{build}.json".format(**py)).write_text(json.dumps(py))
+
+    for i in range(n_conda):
+        name, ver = f"condapkg{i}", f"1.{i}.0"
+        dist = f"{name}-{ver}.dist-info"
+        files = [f"{sp_rel}/{name}/__init__.py",
+                 f"{sp_rel}/{dist}/METADATA",
+                 f"{sp_rel}/{dist}/INSTALLER"]
+        rec = make_record(name, ver, "pyhd8ed1ab_0", files=files,
+                          depends=[f"python >={py_ver}"])
+        jp(meta, f"{name}-{ver}-pyhd8ed1ab_0.json").write_text(json.dumps(rec))
+        # half of conda-built packages report 'pip' as installer
+        make_dist_info(site, name, ver, "pip" if i % 2 else "conda")
+
+    specs = [f"condapkg{i}" for i in range(0, n_conda, hist_every)]
+    jp(meta, "history").write_text(make_history(specs, py_ver))
+
+    for i in range(n_pip):
+        make_dist_info(site, f"pip_pkg{i}", f"0.{i}")
+
+    return prefix
+
+
+def make_dist_info(site: Path, name: str, ver: str, installer: str="pip",
+                   requires: list=()) -> Path:
+    dist = jp(site, f"{name}-{ver}.dist-info")
+    dist.mkdir(parents=True, exist_ok=True)
+    lines = ["Metadata-Version: 2.1", f"Name: {name}", f"Version: {ver}"]
+    lines += [f"Requires-Dist: {r}" for r in requires]
+    jp(dist, "METADATA").write_text("\n".join(lines) + "\n\nLong description.\n")
+    jp(dist, "INSTALLER").write_text(installer + "\n")
+    return dist
+
+
+def make_basic_info(root: Path) -> dict:
+    """Return the conda info (see CondaEnvir.get_conda_info) of a conda
+    root at root, whose envs are in root/envs.
+    """
+    return {"conda_prefix": root, "active_prefix": root,
+            "user_condarc": jp(root, ".condarc"),
+            "env_dir": jp(root, "envs"),
+            "channels": ["conda-forge", "defaults"], "pkgs_dirs": []}
+
+
+def make_export_text(n_deps: int=1000, n_pip: int=100, name: str="ds310",
+                     prefix: str="/home/user/miniconda3/envs/ds310") -> str:
+    """Return a `conda env export --no-builds` like text with n_deps conda
+    dependencies & n_pip pip dependencies.
+    """
+    lines = [f"name: {name}", "channels:", "  - conda-forge", "  - defaults",
+             "dependencies:"]
+    lines += [f"  - condapkg{i}=1.{i}.0" for i in range(n_deps)]
+    if n_pip:
+        lines.append("  - pip:")
+        lines += [f"    - pip-pkg{i}==0.{i}" for i in range(n_pip)]
+    lines.append(f"prefix: {prefix}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,161 @@
+# batch.py
+__doc__ = """Batch mode: 'lean clone' several environments in one invocation.
+The conda context is resolved once & shared by all the CondaEnvir instances,
+which run on a bounded thread pool (the work is mostly I/O & subprocesses).
+"""
+import time
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+import logging
+
+from new_conda_env import envir
+import new_conda_env.processing as proc
+# ..........................................................................
+
+log = logging.getLogger(__name__)
+log.setLevel(logging.ERROR)
+
+sh = logging.StreamHandler()
+formatter = logging.Formatter('%(name)-15s: %(levelname)-8s %(message)s')
+sh.setFormatter(formatter)
+log.addHandler(sh)
+
+
+def read_manifest(manifest: Path) -> list:
+    """Return the (env_to_clone, new_env_name) pairs listed in a manifest
+    file: one env per line, optionally followed by the new env name.
+    Blank lines and '#' comments are ignored.
+    """
+    pairs = []
+    for line in Path(manifest).read_text().splitlines():
+        line = line.split("#", 1)[0].split()
+        if not line:
+            continue
+        new_name = line[1] if len(line) > 1 else "default"
+        pairs.append((line[0], new_name))
+    return pairs
+
+
+def list_envs(envs, kernel: str="python", kernel_ver: str="") -> list:
+    """Return the names of the envs, sorted: envs is a dir of envs or a
+    {name: prefix} dict (e.g. locator.EnvLocator.envs()). If kernel_ver is
+    given, only the envs with that kernel version are returned.
+    """
+    if not isinstance(envs, dict):
+        envs = {p.name: p for p in Path(envs).iterdir()}
+    names = []
+    for name, prefix in sorted(envs.items()):
+        if not prefix.joinpath("conda-meta").is_dir():
+            continue
+        if kernel_ver and proc.get_installed_version(prefix, kernel) != kernel_ver:
+            continue
+        names.append(name)
+    return names
+
+
+def _run_envir(conda_vir, out: dict) -> None:
+    out["output"] = conda_vir.get_new_env_yaml(show_msg=False)
+    if conda_vir.check_report is not None:
+        out["check"] = conda_vir.check_report["ok"]
+    if conda_vir.timings.enabled:
+        out["timings"] = conda_vir.timings.report(env=out["env"])
+
+
+def clone_one(env_to_clone: str, new_env_name: str="default", **kwargs) -> dict:
+    """Lean-clone one env & return its result record:
+    {"env": ..., "output": Path or None, "error": str or None, "seconds": float},
+    with the "check" result (bool) & the "timings" report if requested.
+    """
+    t0 = time.perf_counter()
+    out = {"env": env_to_clone, "output": None, "error": None}
+    try:
+        conda_vir = envir.CondaEnvir(env_to_clone=env_to_clone,
+                                     new_env_name=new_env_name,
+                                     **kwargs)
+        _run_envir(conda_vir, out)
+    except Exception as err:
+        log.debug(f"{env_to_clone} failed", exc_info=True)
+        out["error"] = f"{type(err).__name__}: {err}"
+    out["seconds"] = time.perf_counter() - t0
+
+    return out
+
+
+def clone_targets(env_to_clone: str, new_env_name: str="default",
+                  new_vers: list=None, **kwargs) -> list:
+    """Lean-clone one env for each version in new_vers, from one export of
+    the env (see CondaEnvir.for_target), & return the result records (see
+    clone_one), whose "env" is '<env_to_clone> (<new_ver>)'.
+    Without several new_vers, return [clone_one(...)].
+    """
+    if not new_vers or len(new_vers) < 2:
+        if new_vers:
+            kwargs["new_ver"] = new_vers[0]
+        return [clone_one(env_to_clone, new_env_name, **kwargs)]
+
+    kwargs["new_ver"] = new_vers[0]
+    t0 = time.perf_counter()
+    try:
+        template = envir.CondaEnvir(env_to_clone=env_to_clone,
+                                    new_env_name=new_env_name,
+                                    **kwargs)
+    except Exception as err:
+        log.debug(f"{env_to_clone} failed", exc_info=True)
+        return [{"env": env_to_clone, "output": None,
+                 "error": f"{type(err).__name__}: {err}",
+                 "seconds": time.perf_counter() - t0}]
+
+    results = []
+    for i, ver in enumerate(new_vers):
+        out = {"env": f"{env_to_clone} ({ver})", "output": None, "error": None}
+        try:
+            _run_envir(template.for_target(ver, with_setup=not i), out)
+        except Exception as err:
+            log.debug(f"{env_to_clone} ({ver}) failed", exc_info=True)
+            out["error"] = f"{type(err).__name__}: {err}"
+        out["seconds"] = time.perf_counter() - t0
+        results.append(out)
+        t0 = time.perf_counter()
+
+    return results
+
+
+def run_batch(envs: list, max_workers: int=4, basic_info: dict=None,
+              new_vers: list=None, **kwargs) -> list:
+    """Lean-clone each env in envs, a list of env names or of
+    (env_to_clone, new_env_name) pairs, on a pool of max_workers threads,
+    for each version in new_vers if given (see clone_targets).
+    kwargs are passed on to CondaEnvir (display_new_yml is forced off).
+    Return the list of result records (see clone_one) in envs order.
+    """
+    basic_info = basic_info or envir.CondaEnvir.get_conda_info()
+    kwargs.update(basic_info=basic_info, display_new_yml=False)
+    pairs = [(e, "default") if isinstance(e, str) else tuple(e) for e in envs]
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        futures = [pool.submit(clone_targets, env, name, new_vers, **kwargs)
+                   for env, name in pairs]
+        return [r for f in futures for r in f.result()]
+
+
+def format_summary(results: list) -> str:
+    """Return the batch results as a text table."""
+    rows = [("env", "status", "time (s)", "output / error")]
+    for r in results:
+        status = "ok" if r["error"] is None else "FAILED"
+        if r.get("check") is False:
+            status = "unsat"
+        detail = r["error"] if r["error"] is not None else proc.path2str(r["output"])
+        rows.append((r["env"], status, f"{r['seconds']:.2f}", detail))
+
+    widths = [max(len(row[i]) for row in rows) for i in range(3)]
+    lines = []
+    for row in rows:
+        cells = [c.ljust(w) for c, w in zip(row, widths)] + [row[3]]
+        lines.append("  ".join(cells))
+    lines.insert(1, "  ".join("-" * w for w in widths + [len(rows[0][3])]))
+
+    n_ok = sum(r["error"] is None for r in results)
+    lines.append(f"\n{n_ok}/{len(results)} env(s) done.")
+
+    return "\n".join(lines)
@@ -0,0 +1,142 @@
+# cache.py
+__doc__ = """Persistent cache of the parsed export data of envs.
+An entry is keyed on the env prefix, the requested data & the env
+fingerprint, so any change to the env (conda or pip) is a cache miss.
+Entries are json files, evicted by age then least-recent use over a size cap.
+"""
+import os
+import json
+import time
+import hashlib
+from pathlib import Path
+import logging
+# ..........................................................................
+
+log = logging.getLogger(__name__)
+log.setLevel(logging.ERROR)
+
+sh = logging.StreamHandler()
+formatter = logging.Formatter('%(name)-15s: %(levelname)-8s %(message)s')
+sh.setFormatter(formatter)
+log.addHandler(sh)
+
+
+CACHE_DIRNAME = ".new_conda_env_cache"
+MAX_BYTES = 50 * 2**20   # 50 MiB
+MAX_AGE = 30 * 86400     # 30 days (seconds)
+
+jp = Path.joinpath
+
+
+def stat_sig(p: Path) -> str:
+    """Return 'name:mtime_ns:size' of p ('name:-' if missing)."""
+    try:
+        st = p.stat()
+    except OSError:
+        return f"{p.name}:-"
+    return f"{p.name}:{st.st_mtime_ns}:{st.st_size}"
+
+
+def env_fingerprint(prefix: Path) -> str:
+    """Return a hex digest of the state of the env at prefix: the
+    mtime & size of conda-meta/history & of each conda-meta/*.json record,
+    and the mtime of the site-packages dir(s) (pip installs).
+    Only stat calls are made: no file is read.
+    """
+    meta = jp(prefix, "conda-meta")
+    sigs = [stat_sig(jp(meta, "history"))]
+    with os.scandir(meta) as it:
+        sigs.extend(sorted(stat_sig(Path(e.path)) for e in it
+                           if e.name.endswith(".json")))
+    sigs.extend(stat_sig(sp) + sp.parent.name
+                for sp in jp(prefix, "lib").glob("python*/site-packages"))
+    sigs.append(stat_sig(jp(prefix, "Lib", "site-packages")))
+
+    return hashlib.sha1("\n".join(sigs).encode()).hexdigest()
+
+
+class ExportCache:
+    """Directory of json entries with LRU eviction.
+    Call: ExportCache(cache_dir: Path, max_bytes: int=MAX_BYTES,
+                      max_age: float=MAX_AGE)
+    Arguments:
+    - cache_dir (Path): created if needed
+    - max_bytes (int): total size above which the least recently used
+      entries are evicted
+    - max_age (float): entries not used for max_age seconds are evicted
+    """
+    def __init__(self, cache_dir: Path, max_bytes: int=MAX_BYTES,
+                 max_age: float=MAX_AGE):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        return hashlib.sha1("\0".join(map(str, parts)).encode()).hexdigest()
+
+
+    def _path(self, key: str) -> Path:
+        return jp(self.cache_dir, key + ".json")
+
+
+    def get(self, key: str):
+        """Return the data stored under key or None. A hit marks the
+        entry as recently used.
+        """
+        p = self._path(key)
+        try:
+            data = json.loads(p.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        try:
+            os.utime(p)
+        except OSError:
+            pass
+        log.debug(f"Cache hit: {p.name}")
+        return data
+
+
+    def put(self, key: str, data) -> None:
+        """Store the json-serializable data under key, then evict."""
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        p = self._path(key)
+        # atomic: concurrent writers (batch mode) never expose a partial file
+        tmp = p.with_suffix(f".{os.getpid()}.{id(data)}.tmp")
+        tmp.write_text(json.dumps(data), encoding="utf-8")
+        os.replace(tmp, p)
+        self.evict()
+
+
+    def evict(self) -> list:
+        """Remove the entries older than max_age, then the least recently
+        used ones until the cache size is under max_bytes.
+        Return the removed paths.
+        """
+        try:
+            entries = [(e.stat().st_mtime, e.stat().st_size, Path(e.path))
+                       for e in os.scandir(self.cache_dir) if e.name.endswith(".json")]
+        except OSError:
+            return []
+        entries.sort()
+        now = time.time()
+        total = sum(e[1] for e in entries)
+        removed = []
+        for mtime, size, p in entries:
+            if now - mtime <= self.max_age and total <= self.max_bytes:
+                break
+            try:
+                p.unlink()
+            except OSError:
+                continue
+            total -= size
+            removed.append(p)
+        if removed:
+            log.debug(f"Cache: evicted {len(removed)} entries.")
+        return removed
+
+
+    def clear(self) -> None:
+        for p in self.cache_dir.glob("*.json"):
+            p.unlink()
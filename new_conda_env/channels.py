@@ -0,0 +1,104 @@
+# channels.py
+__doc__ = """Pruning of the channels of the new env to those that supplied
+the user-requested (history) packages of the cloned env, according to the
+'channel' of their conda-meta records.
+The configured channels (.condarc) are kept in priority order if they
+supplied a package; a channel that supplied one without being configured
+(e.g. `conda install -c <channel>`) is added last.
+"""
+import re
+import json
+from pathlib import Path
+import logging
+
+import new_conda_env.processing as proc
+# ..........................................................................
+
+log = logging.getLogger(__name__)
+log.setLevel(logging.ERROR)
+
+sh = logging.StreamHandler()
+formatter = logging.Formatter('%(name)-15s: %(levelname)-8s %(message)s')
+sh.setFormatter(formatter)
+log.addHandler(sh)
+
+
+# trailing subdir of a channel url, e.g. /linux-64, /noarch
+rx_subdir = re.compile(r"/(?:noarch|[a-z]+-(?:32|64|aarch64|arm64|armv6l|armv7l|ppc64le|s390x))/?$")
+
+jp = Path.joinpath
+
+
+def strip_subdir(url: str) -> str:
+    return rx_subdir.sub("", url.rstrip("/"))
+
+
+def read_record_channels(prefix: Path, names) -> dict:
+    """Return {name: channel base url} from the conda-meta records of the
+    env at prefix for the package names given (only those are parsed).
+    """
+    names = set(names)
+    out = {}
+    for f in jp(Path(prefix), "conda-meta").glob("*.json"):
+        name = f.stem.rsplit("-", 2)[0]
+        if name not in names:
+            continue
+        try:
+            channel = json.loads(f.read_text(encoding="utf-8")).get("channel")
+        except (OSError, ValueError) as err:
+            log.warning(f"Unreadable record {f.name}: {err}")
+            continue
+        if channel:
+            out[name] = strip_subdir(channel)
+
+    return out
+
+
+def get_channel_bases(channels: list) -> dict:
+    """Return {channel: set of base urls} for the configured channels, as
+    expanded by conda (e.g. defaults -> pkgs/main, pkgs/r).
+    """
+    from conda.models.channel import Channel
+
+    return {c: {strip_subdir(u) for u in Channel(c).urls(with_credentials=False,
+                                                         subdirs=("noarch",))}
+            for c in channels}
+
+
+def canonical_name(url: str) -> str:
+    """Return conda's name of the channel at url (e.g. conda-forge)."""
+    from conda.models.channel import Channel
+
+    return Channel(url).canonical_name
+
+
+def select_channels(channels: list, bases: dict, used: set) -> tuple:
+    """Return (kept, dropped, extra): the configured channels whose base urls
+    supplied a package (used), in priority order, the others, & the used base
+    urls of no configured channel.
+    """
+    kept = [c for c in channels if bases.get(c, set()) & used]
+    dropped = [c for c in channels if c not in kept]
+    known = set().union(*bases.values()) if bases else set()
+
+    return kept, dropped, sorted(used - known)
+
+
+def prune_channels(prefix: Path, specs: list, channels: list) -> tuple:
+    """Return (kept, dropped): the channels that supplied the packages of
+    specs (the history specs of the env at prefix), configured ones first,
+    & the configured channels that did not.
+    """
+    names = {proc.spec_name(s) for s in specs if isinstance(s, str)}
+    used = set(read_record_channels(prefix, names).values())
+    if not used:
+        log.warning("No channel found in the records of the history specs: kept all.")
+        return list(channels), []
+    kept, dropped, extra = select_channels(channels, get_channel_bases(channels), used)
+    for url in extra:
+        name = canonical_name(url)
+        log.info(f"Channel used but not configured: {name}")
+        if name not in kept:
+            kept.append(name)
+
+    return kept, dropped
@@ -0,0 +1,112 @@
+# check.py
+__doc__ = """Pre-flight satisfiability check of a lean env spec.
+conda's solver runs in dry-run & offline mode, i.e. against the repodata
+already cached in pkgs_dirs or against local (file://) channels, so that
+unsatisfiable or unavailable specs are reported before the yml file is used.
+The pip dependencies are not checked (conda does not solve them).
+"""
+import os
+import json
+import tempfile
+import subprocess
+from pathlib import Path
+import logging
+# ..........................................................................
+
+log = logging.getLogger(__name__)
+log.setLevel(logging.ERROR)
+
+sh = logging.StreamHandler()
+formatter = logging.Formatter('%(name)-15s: %(levelname)-8s %(message)s')
+sh.setFormatter(formatter)
+log.addHandler(sh)
+
+
+NOT_FOUND = ("PackagesNotFoundError", "PackageNotFoundError",
+             "ResolvePackageNotFound")
+
+
+def conda_exe() -> str:
+    """The conda executable: CONDA_EXE (set by conda's activation), as
+    `conda` is a shell function on POSIX.
+    """
+    return os.getenv("CONDA_EXE", "conda")
+
+
+def is_local_channel(channel: str) -> bool:
+    return channel.startswith("file:") or Path(channel).is_absolute()
+
+
+def get_check_cmd(specs: list, channels: list, prefix: Path,
+                  offline: bool=True) -> list:
+    """Return the dry-run command. With only local channels, --offline is
+    not needed (no network) & is not used: conda would then ignore their
+    repodata unless already cached.
+    """
+    cmd = [conda_exe(), "create", "--dry-run", "--json", "--yes",
+           "--prefix", str(prefix)]
+    if offline and not (channels and all(map(is_local_channel, channels))):
+        cmd.append("--offline")
+    if channels:
+        cmd.append("--override-channels")
+        for ch in channels:
+            cmd.extend(["-c", ch])
+    return cmd + list(specs)
+
+
+def parse_check_output(out: str) -> dict:
+    """Return the check report from the json output of the dry-run:
+    {"ok": bool, "missing": [specs not found], "message": str}.
+    """
+    try:
+        res = json.loads(out)
+    except ValueError:
+        return {"ok": False, "missing": [], "message": out.strip()}
+
+    if res.get("success"):
+        return {"ok": True, "missing": [], "message": ""}
+
+    missing = []
+    if res.get("exception_name") in NOT_FOUND:
+        missing = [str(p) for p in res.get("packages") or []]
+    msg = res.get("message") or res.get("error") or ""
+
+    return {"ok": False, "missing": missing, "message": msg.strip()}
+
+
+def check_specs(specs: list, channels: list, offline: bool=True,
+                timeout: float=600) -> dict:
+    """Run conda's solver on specs (dry-run, offline) & return the check
+    report (see parse_check_output).
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        # a never-created prefix: nothing is installed or registered
+        cmd = get_check_cmd(specs, channels, Path(tmp).joinpath("check"), offline)
+        log.debug(f"Running cmd: {cmd}")
+        try:
+            res = subprocess.run(cmd, capture_output=True, text=True,
+                                 timeout=timeout)
+        except subprocess.TimeoutExpired:
+            return {"ok": False, "missing": [],
+                    "message": f"The check timed out after {timeout}s."}
+
+    return parse_check_output(res.stdout or res.stderr)
+
+
+def check_env_yml(data: dict, **kwargs) -> dict:
+    """Check the conda dependencies of the env yml data."""
+    specs = [d for d in data.get("dependencies") or [] if isinstance(d, str)]
+    return check_specs(specs, data.get("channels") or [], **kwargs)
+
+
+def format_report(report: dict, yml_file=None) -> str:
+    name = f" of {yml_file}" if yml_file else ""
+    if report["ok"]:
+        return f"\nSatisfiability check{name}: OK (offline dry-run).\n"
+    lines = [f"\nSatisfiability check{name}: FAILED"]
+    if report["missing"]:
+        lines.append("Unavailable specs:")
+        lines.extend(f"  - {s}" for s in report["missing"])
+    if report["message"]:
+        lines.append(report["message"])
+    return "\n".join(lines) + "\n"
@@ -7,9 +7,10 @@ of the (python) kernel and includes any pip dependencies."
 """
 import sys
 import logging
+from pathlib import Path
 from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
 
-from new_conda_env import envir
+from new_conda_env import envir, batch, locator, pins, repodata
 # ..........................................................................
 
 log = logging.getLogger(__name__)
@@ -41,9 +42,14 @@ def generate_parser():
         For example, 3.8 but not 38 (python kernel)."""
     )
     p.add_argument(
-        "-new_ver", type=str, required=True,
+        "-new_ver", type=str, nargs="+", required=True,
         help="""The kernel (python) version of the new env. 
-        For example, 3.8 but not 38 (python kernel)."""
+        For example, 3.8 but not 38 (python kernel).
+        'auto': the highest version with builds for all the packages
+        requested in the env (history), per the cached repodata of the
+        configured channels (with -no_cache, per the repodata index as
+        last refreshed).
+        Several versions: one yml file each, from a single export."""
     )
     p.add_argument(
         "-dotless_ver", choices=[1,0],
@@ -51,8 +57,30 @@ def generate_parser():
         help="Whether to remove any dot in the final yml (default) filename."
     )
     p.add_argument(
-        "-env_to_clone", type=str, required=True,
-        help="Name of an existing env to 'clone'."
+        "-env_to_clone", type=str, nargs="+",
+        help="""Name of an existing env to 'clone'. Several names run
+        the batch mode."""
+    )
+    p.add_argument(
+        "-prefix", type=str, nargs="+",
+        help="""Path of an existing env to 'clone' (e.g. an env outside of
+        the envs dirs). Several paths run the batch mode."""
+    )
+    p.add_argument(
+        "-manifest", type=str,
+        help="""Batch mode: a file listing the envs to 'clone', one per line,
+        optionally followed by the new env name."""
+    )
+    p.add_argument(
+        "-all_envs", choices=[1,0],
+        default=0, type=int,
+        help="""Batch mode: 'clone' all the envs whose kernel version
+        is old_ver."""
+    )
+    p.add_argument(
+        "-jobs", type=int,
+        default=4,
+        help="Batch mode: number of envs processed concurrently."
     )
     p.add_argument(
         "-new_env_name", type=str,
@@ -70,6 +98,136 @@ def generate_parser():
         default=1, type=bool,
         help="Wether to display the contents of the new yaml file."
     )
+    p.add_argument(
+        "-native_history", choices=[1,0],
+        default=1, type=int,
+        help="""Whether to read the env's conda-meta/history directly instead
+        of running `conda env export --from-history` (used as fallback)."""
+    )
+    p.add_argument(
+        "-native_pip", choices=[1,0],
+        default=1, type=int,
+        help="""Whether to find the pip dependencies in the env's site-packages
+        instead of running `conda env export --no-builds` (used as fallback)."""
+    )
+    p.add_argument(
+        "-no_cache", action="store_true",
+        help="""Do not use the cache of export data (stored next to the
+        user's .condarc); the repodata index is then only read, not
+        refreshed."""
+    )
+    p.add_argument(
+        "-refresh", action="store_true",
+        help="Recompute the export data & replace the cached ones."
+    )
+    p.add_argument(
+        "-explicit", choices=[1,0],
+        default=0, type=int,
+        help="""Same version only (new_ver == old_ver): also write a conda
+        explicit spec file (exact package urls & hashes) & a pip requirements
+        file, to create the env without solver."""
+    )
+    p.add_argument(
+        "-lock_hash", choices=["md5", "sha256"],
+        default="md5", type=str,
+        help="The package hash in the explicit spec file (sha256: recent conda)."
+    )
+    p.add_argument(
+        "-pip_versions", choices=["strip", "keep", "major"],
+        default="strip", type=str,
+        help="""Version policy of the pip dependencies: strip (none), keep
+        (as installed), or major (exact pins relaxed to the major version,
+        e.g. ==2.*)."""
+    )
+    p.add_argument(
+        "-prune_pips", choices=[1,0],
+        default=1, type=int,
+        help="""Whether to keep only the root pip dependencies, i.e. those no
+        other installed distribution requires (Requires-Dist), & not
+        provided by conda."""
+    )
+    p.add_argument(
+        "-prune_channels", choices=[1,0],
+        default=0, type=int,
+        help="""Whether to list only the channels that supplied the requested
+        packages of the env (conda-meta records); the dropped channels are
+        reported."""
+    )
+    p.add_argument(
+        "-pin_policy", choices=["none", "lower", "major", "exact"],
+        default="none", type=str,
+        help="""Version constraints derived from the versions installed in the
+        env to clone: none, lower (>=installed), major (installed major.*) or
+        exact; not applied to packages without build for new_ver in the
+        cached repodata."""
+    )
+    p.add_argument(
+        "-pin", nargs="+", metavar="NAME:RULE",
+        help="""Per-package overrides of -pin_policy, as <name>:<rule>, where
+        rule is a policy or a version constraint, e.g.: numpy:major
+        pandas:'>=1.5,<3'."""
+    )
+    p.add_argument(
+        "-promote_pips", choices=[1,0],
+        default=0, type=int,
+        help="""Whether to move the pip dependencies with a conda package built
+        for new_ver (cached repodata of the channels of the new env & PyPI
+        name aliases) onto the conda dependencies."""
+    )
+    p.add_argument(
+        "-incremental", choices=[1,0],
+        default=1, type=int,
+        help="""Whether to keep the new yml file as is when the source env is
+        unchanged (provenance header), or only patch the changed dependencies
+        (edits to the other lines are kept)."""
+    )
+    p.add_argument(
+        "-export_timeout", type=float,
+        default=60,
+        help="Seconds after which a `conda env export` subprocess is killed."
+    )
+    p.add_argument(
+        "-check", choices=[1,0],
+        default=0, type=int,
+        help="""Whether to check the satisfiability of the new env with
+        conda's solver (offline dry-run: cached repodata & local channels)."""
+    )
+    p.add_argument(
+        "-profile", choices=["json", "cprofile"],
+        default=None, type=str,
+        help="""Optional: 'json' outputs the duration of each step;
+        'cprofile' dumps the cProfile stats of the run."""
+    )
+    p.add_argument(
+        "-profile_out", type=str,
+        default="",
+        help="""Optional: the profile output file; default: json printed,
+        cprofile stats saved in new_conda_env.prof."""
+    )
+    p.add_argument(
+        "-watch", choices=[1,0],
+        default=0, type=int,
+        help="""Whether to keep running & regenerate the new yml file of an env
+        when its conda-meta/history changes (Ctrl+C to stop)."""
+    )
+    p.add_argument(
+        "-debounce", type=float,
+        default=2.0,
+        help="""Watch mode: seconds without history change before an env is
+        regenerated."""
+    )
+    p.add_argument(
+        "-use_server", choices=[1,0],
+        default=0, type=int,
+        help="""Whether to submit the request to a running server
+        (`new-conda-env-serve`), which keeps the conda context loaded."""
+    )
+    p.add_argument(
+        "-socket", type=str,
+        default="",
+        help="""Optional: the server's Unix socket; default:
+        $NEW_CONDA_ENV_SOCKET or ~/.new_conda_env_cache/serve.sock."""
+    )
     level_choices = list(logging._nameToLevel.keys())
     p.add_argument(
         "-log_level",  choices=level_choices,
@@ -119,22 +277,216 @@ def main(argv=None):
 
     # validation before instanciation
     o_ver = check_ver_num(args.old_ver) 
-    n_ver = check_ver_num(args.new_ver)
+    n_vers = []
+    for n_ver in args.new_ver:
+        if n_ver != repodata.AUTO:
+            n_ver = check_ver_num(n_ver)
+        if n_ver not in n_vers:
+            n_vers.append(n_ver)
+    args.new_ver = n_vers
     check_kernel(args.kernel)
     
-    # won't reach this stage if any step in validation fails
-    conda_vir = envir.CondaEnvir(old_ver=o_ver,
-                                 new_ver=n_ver, 
-                                 dotless_ver=args.dotless_ver,
-                                 env_to_clone=args.env_to_clone,
-                                 new_env_name=args.new_env_name,
-                                 kernel=args.kernel,
-                                 display_new_yml=args.display_new_yml,
-                                 log_level=args.log_level)
-            
-    conda_vir.get_new_env_yaml()
+    envs = list(args.env_to_clone or []) + list(args.prefix or [])
+    if args.manifest:
+        envs.extend(batch.read_manifest(args.manifest))
+    if not envs and not args.all_envs:
+        conda_env_parser.error("No env: use -env_to_clone, -prefix, -manifest or -all_envs.")
+
+    try:
+        pin_overrides = pins.parse_overrides(args.pin)
+    except ValueError as err:
+        conda_env_parser.error(str(err))
+
+    envir_kwargs = dict(old_ver=o_ver,
+                        new_ver=n_vers[0], 
+                        dotless_ver=args.dotless_ver,
+                        kernel=args.kernel,
+                        display_new_yml=args.display_new_yml,
+                        log_level=args.log_level,
+                        native_history=bool(args.native_history),
+                        native_pip=bool(args.native_pip),
+                        use_cache=not args.no_cache,
+                        refresh_cache=args.refresh,
+                        export_timeout=args.export_timeout,
+                        profile=args.profile == "json",
+                        check=bool(args.check),
+                        incremental=bool(args.incremental),
+                        explicit=bool(args.explicit),
+                        hash_type=args.lock_hash,
+                        pip_versions=args.pip_versions,
+                        prune_pips=bool(args.prune_pips),
+                        prune_channels=bool(args.prune_channels),
+                        pin_policy=args.pin_policy,
+                        pin_overrides=pin_overrides,
+                        promote_pips=bool(args.promote_pips))
+
+    if args.watch:
+        return run_watch(envs, args, envir_kwargs)
+
+    if args.use_server:
+        return run_client(envs, args, envir_kwargs)
+
+    if args.profile == "cprofile":
+        return run_cprofile(run_envs, args.profile_out or "new_conda_env.prof",
+                            envs, args, envir_kwargs)
+
+    return run_envs(envs, args, envir_kwargs)
+
+
+def run_cprofile(fn, out: str, *args, **kwargs):
+    import cProfile
+
+    prof = cProfile.Profile()
+    try:
+        return prof.runcall(fn, *args, **kwargs)
+    finally:
+        prof.dump_stats(out)
+        print(f"cProfile stats saved to {out}")
+
+
+def emit_timings(report, out: str="") -> None:
+    import json
+
+    text = json.dumps(report, indent=2)
+    if out:
+        with open(out, "w") as f:
+            f.write(text)
+        print(f"Timings saved to {out}")
+    else:
+        print(text)
+
+
+def run_envs(envs: list, args, envir_kwargs: dict) -> int:
+    if len(envs) == 1 and isinstance(envs[0], str) and not args.all_envs:
+        # won't reach this stage if any step in validation fails
+        conda_vir = envir.CondaEnvir(env_to_clone=envs[0],
+                                     new_env_name=args.new_env_name,
+                                     **envir_kwargs)
+        # several new versions: one export for all
+        targets = (conda_vir.get_targets(args.new_ver) if len(args.new_ver) > 1
+                   else [conda_vir])
+        for target in targets:
+            target.get_new_env_yaml()
+        if args.profile == "json":
+            if len(targets) > 1:
+                emit_timings([t.timings.report(env=f"{envs[0]} ({t.new_ver})")
+                              for t in targets], args.profile_out)
+            else:
+                emit_timings(conda_vir.timings.report(env=envs[0]), args.profile_out)
+        return int(any(t.check_report is not None and not t.check_report["ok"]
+                       for t in targets))
 
+    return run_batch(envs, args, envir_kwargs)
+
+
+def run_watch(envs: list, args, envir_kwargs: dict) -> int:
+    """Watch mode: generate the new yml files, then regenerate that of an
+    env after its history changes, until interrupted.
+    """
+    from new_conda_env import watch
+
+    basic_info = envir.CondaEnvir.get_conda_info()
+    env_locator = locator.get_locator(basic_info)
+    if args.all_envs:
+        envs.extend(batch.list_envs(env_locator.envs(),
+                                    kernel=args.kernel,
+                                    kernel_ver=envir_kwargs["old_ver"]))
+    if len(envs) == 1 and isinstance(envs[0], str):
+        envs = [(envs[0], args.new_env_name)]
+    new_names = dict((e, "default") if isinstance(e, str) else tuple(e) for e in envs)
+    prefixes = {env: env_locator.locate(env) for env in new_names}
+
+    kwargs = dict(envir_kwargs, basic_info=basic_info, display_new_yml=False)
+    # up to date first (no-op for unchanged envs, see -incremental)
+    results = batch.run_batch(list(new_names.items()), max_workers=args.jobs,
+                              new_vers=args.new_ver, **kwargs)
+    print(batch.format_summary(results))
+
+    def regenerate(env):
+        print(batch.format_summary(batch.clone_targets(env, new_names[env],
+                                                       args.new_ver, **kwargs)))
+
+    print(f"\nWatching {len(prefixes)} env(s) for changes (Ctrl+C to stop)...")
+    try:
+        watch.watch_envs(prefixes, regenerate, debounce=args.debounce)
+    except KeyboardInterrupt:
+        pass
     return 0
+
+
+def resolve_prefixes(envs: list) -> list:
+    """Return envs (names, prefix paths or (env, new_env_name) pairs) with
+    the prefix paths made absolute in the cwd of this process.
+    """
+    def resolve(env):
+        return str(Path(env).resolve()) if locator.is_prefix_path(env) else env
+
+    return [(resolve(e[0]), e[1]) if isinstance(e, (tuple, list)) else resolve(e)
+            for e in envs]
+
+
+def run_client(envs: list, args, envir_kwargs: dict) -> int:
+    """Submit the envs to the server; print the new yml (single env) &
+    the summary table. Return 1 if any env failed (or failed the check).
+    """
+    from new_conda_env import server
+
+    # the server would resolve relative prefixes in its own cwd
+    envs = resolve_prefixes(envs)
+    if len(envs) == 1 and isinstance(envs[0], str) and not args.all_envs:
+        envs = [(envs[0], args.new_env_name)]
+    request = {"envs": envs,
+               "all_envs": bool(args.all_envs),
+               "jobs": args.jobs,
+               "yml": bool(args.display_new_yml),
+               "new_vers": args.new_ver,
+               "kwargs": envir_kwargs}
+    response = server.submit(request, args.socket or None)
+    if "error" in response:
+        log.error(response["error"])
+        return 1
+
+    results = response["results"]
+    for r in results:
+        if r["output"] is not None:
+            r["output"] = Path(r["output"])
+    if len(results) == 1 and results[0].get("yml"):
+        print(results[0]["yml"])
+    print(batch.format_summary(results))
+    if args.profile == "json":
+        emit_timings([r["timings"] for r in results if r.get("timings")],
+                     args.profile_out)
+
+    return int(any(r["error"] is not None or r.get("check") is False
+                   for r in results))
+
+
+def run_batch(envs: list, args, envir_kwargs: dict) -> int:
+    """Batch mode: conda context resolved once; summary table printed.
+    Return 1 if any env failed (or failed the check), else 0.
+    """
+    if args.new_env_name != "default":
+        log.warning("-new_env_name is ignored in batch mode (use -manifest).")
+
+    basic_info = envir.CondaEnvir.get_conda_info()
+    if args.all_envs:
+        envs.extend(batch.list_envs(locator.get_locator(basic_info).envs(),
+                                    kernel=args.kernel,
+                                    kernel_ver=envir_kwargs["old_ver"]))
+    results = batch.run_batch(envs,
+                              max_workers=args.jobs,
+                              basic_info=basic_info,
+                              new_vers=args.new_ver,
+                              **envir_kwargs)
+    print(batch.format_summary(results))
+    if args.profile == "json":
+        emit_timings([r["timings"] for r in results if r.get("timings")],
+                     args.profile_out)
+    if any(r["output"] is not None for r in results):
+        print(envir.msg_warn)
+
+    return int(any(r["error"] is not None or r.get("check") is False
+                   for r in results))
     
 
 if __name__ == "__main__":
@@ -2,15 +2,22 @@
 
 import os
 import sys
+import copy
+import sqlite3
+import threading
 from pathlib import Path
 from enum import Enum
+from functools import partial
 import logging
 
-from conda.base.context import context, user_rc_path
 import new_conda_env.processing as proc
+from new_conda_env import (VERSION, cache, channels, check, locator, lockfile,
+                           pins, pipgraph, pipspec, provenance, pypimap,
+                           repodata)
+from new_conda_env.profiling import Timings
+from new_conda_env.leanspec import LeanSpec
 # ..........................................................................
 
-# unused:
 logr_envir = logging.getLogger(__name__)
 logr_envir.setLevel(logging.ERROR)
 
@@ -21,20 +28,48 @@ logr_envir.addHandler(sh)
 
 
 msgf_create_env = """
-    If necessary, you can open the file to tweak it (e.g. the networkx
-    package can be removed from the pip deps and added to the conda deps).
+    If necessary, you can open the file to tweak it (e.g. a pip package not
+    found in the cached repodata can be moved to the conda deps).
 
     You can now create the new environment with this command:
     `conda env create -f {}`
 """
 
 
+msgf_lockfiles = """
+    Same kernel version: the env can also be created without solver, with
+    the exact builds of {}:
+    `conda create -n {} --file {}`
+"""
+msgf_pip_lock = """    then, for the pip packages:
+    `conda run -n {} pip install -r {}`
+"""
+
+
+msgf_unchanged = """
+    {} is up to date (same source env & options): kept as is.
+"""
+
+
+msgf_dropped_channels = """
+    Channels dropped (they supplied none of the packages requested in {}):
+    {}
+"""
+
+
+msgf_promoted = """
+    Pip dependencies moved to the conda dependencies (built for {}):
+    {}
+"""
+
+
 msg_warn = """
     [ATTENTION]:
     Even if the new environmental yaml file creation is successful,
     that does not mean the env is satisfiable.
     The only way to find out at the moment* is by running the 
-    `conda env create -f` command with the file path.
+    `conda env create -f` command with the file path, or by using
+    the `-check` option (offline dry-run, with cached repodata only).
 
     * There is a feature request (github.com/conda issue #7495) to have
     `conda env create` do a dry-run, which is what would have been used 
@@ -57,21 +92,88 @@ class CondaEnvir:
                      new_env_name: str="default",
                      kernel: str="python",
                      display_new_yml: bool=True,
-                     log_level: str="ERROR")
+                     log_level: str="ERROR",
+                     native_history: bool=True,
+                     native_pip: bool=True,
+                     basic_info: dict=None,
+                     use_cache: bool=True,
+                     refresh_cache: bool=False,
+                     export_timeout: float=60,
+                     profile: bool=False,
+                     check: bool=False,
+                     incremental: bool=True,
+                     explicit: bool=False,
+                     hash_type: str="md5",
+                     pip_versions: str="strip",
+                     prune_pips: bool=True,
+                     prune_channels: bool=False,
+                     pin_policy: str="none",
+                     pin_overrides: dict=None,
+                     promote_pips: bool=False)
     [* see README.md]
     
     Arguments:
     - old_ver (str): Previous kernel (python) version
-    - new_ver (str): New kernel (python) version
+    - new_ver (str): New kernel (python) version; 'auto': the highest version
+      with builds for all the history specs in the cached repodata (see
+      repodata.RepodataIndex); for several versions from one export, see
+      for_target & get_targets
     - dotless_ver (bool): If True, period(s) in new_ver are removed when forming
       the default `new_env_name`
-    - env_to_clone (str): The existing conda environment to 'quick-clone'
+    - env_to_clone (str): The existing conda environment to 'quick-clone':
+      an env name, looked up in all the envs_dirs & in environments.txt,
+      or a prefix path
     - new_env_name (str, "default"): If called with default value, the name
       follows this pattern: env{self.kernel[:2]}{self.new_ver.replace('.','')}",
       e.g.: envpy311
     - kernel (str, "python"): current implementation is for python only
     - display_new_yml (bool, True): output contents?
     - log_level (str, "ERROR"): to set class logging level.
+    - native_history (bool, True): read the user-requested specs from
+      <env prefix>/conda-meta/history instead of running
+      `conda env export --from-history` (used as fallback).
+    - native_pip (bool, True): find the pip dependencies in the env's
+      site-packages instead of running `conda env export --no-builds`
+      (used as fallback).
+    - basic_info (dict, None): the output of CondaEnvir.get_conda_info(), to
+      reuse the conda context resolved once for several envs (batch mode).
+    - use_cache (bool, True): reuse the export data cached in
+      <user_dir>/.new_conda_env_cache while the env is unchanged.
+    - refresh_cache (bool, False): ignore, then replace the cached data.
+    - export_timeout (float, 60): seconds after which a `conda env export`
+      subprocess (fallback) is killed.
+    - profile (bool, False): record the duration of each step in
+      self.timings (see profiling.Timings).
+    - check (bool, False): run conda's solver (offline dry-run) on the new
+      env spec; the report is in self.check_report.
+    - incremental (bool, True): keep the new yml file as is if its provenance
+      header (source env fingerprint, versions) is unchanged, else only
+      patch the dependencies that changed since it was generated (as kept
+      in its sidecar file), keeping the user's edits to the other lines.
+    - explicit (bool, False): also write a conda explicit spec file (exact
+      package urls & hashes) & a pip requirements file (pinned), for a
+      solver-free creation; only valid if new_ver == old_ver.
+    - hash_type (str, "md5"): the package hash in the explicit file: "md5",
+      or "sha256" (needs a recent conda to create the env).
+    - pip_versions (str, "strip"): the version policy of the pip deps:
+      "strip" (none), "keep" (as installed) or "major" (exact pins relaxed
+      to the major version, e.g. ==2.*); see pipspec.
+    - prune_pips (bool, True): keep only the root pip dependencies (required
+      by no other installed distribution, nor provided by conda) using the
+      Requires-Dist graph of site-packages; see pipgraph.
+    - prune_channels (bool, False): list only the channels that supplied the
+      requested (history) packages, per their conda-meta records, in
+      priority order; the others are reported in self.dropped_channels.
+    - pin_policy (str, "none"): the version constraints derived from the
+      versions installed in env_to_clone: "none", "lower" (>=installed),
+      "major" (installed major.*) or "exact"; not applied to the packages
+      without build for new_ver in the cached repodata; see pins.
+    - pin_overrides (dict, None): {package name: policy or version
+      constraint}, e.g. {"numpy": "major", "pandas": ">=1.5,<3"}.
+    - promote_pips (bool, False): move the pip dependencies with a conda
+      package built for new_ver in the cached repodata of the channels of
+      the new env onto the conda dependencies (see pypimap); they are listed
+      in self.promoted.
     """
     
     def __init__(self,
@@ -82,12 +184,38 @@ class CondaEnvir:
                  new_env_name: str="default",
                  kernel: str="python",
                  display_new_yml: bool=True,
-                 log_level: str="ERROR"):
+                 log_level: str="ERROR",
+                 native_history: bool=True,
+                 native_pip: bool=True,
+                 basic_info: dict=None,
+                 use_cache: bool=True,
+                 refresh_cache: bool=False,
+                 export_timeout: float=60,
+                 profile: bool=False,
+                 check: bool=False,
+                 incremental: bool=True,
+                 explicit: bool=False,
+                 hash_type: str="md5",
+                 pip_versions: str="strip",
+                 prune_pips: bool=True,
+                 prune_channels: bool=False,
+                 pin_policy: str="none",
+                 pin_overrides: dict=None,
+                 promote_pips: bool=False):
         
+        self.timings = Timings(enabled=profile)
         self.log = logging.getLogger("new_conda_env.envir.CondaEnvir")
         self.log.setLevel(log_level)
         
         self.kernel = kernel.lower()
+        if pin_policy not in pins.PIN_POLICIES:
+            msg = f"pin_policy: one of {pins.PIN_POLICIES}"
+            self.log.error(msg)
+            raise ValueError(msg)
+        if pip_versions not in pipspec.PIP_POLICIES:
+            msg = f"pip_versions: one of {pipspec.PIP_POLICIES}"
+            self.log.error(msg)
+            raise ValueError(msg)
             
         if old_ver == "" or new_ver == "":
             msg = "Missing version: empty old_ver or new_ver str."
@@ -98,34 +226,65 @@ class CondaEnvir:
             # no problem: user wants a "lean" yml file
             self.log.warning("The old & new versions are identical.")
             
-        self.conda_root = Path(os.getenv("CONDA_ROOT"))
-        self.basic_info = self.get_conda_info()
+        with self.timings.stage("conda_info"):
+            self.basic_info = basic_info or self.get_conda_info()
+        self.conda_root = Path(os.getenv("CONDA_ROOT",
+                                         self.basic_info["conda_prefix"]))
         self.user_dir = self.basic_info["user_condarc"].parent
         
-        self.env_to_clone = env_to_clone
-        old_prefix = jp(self.basic_info["env_dir"], self.env_to_clone)
-        if not old_prefix.exists():
-            msg = "Typo in <env_to_clone>? "
-            msg = msg + f"Path not found: {old_prefix})"
-            self.log.error(msg)
-            raise FileNotFoundError
+        with self.timings.stage("locate"):
+            # raises FileNotFoundError if not found:
+            self.old_prefix = locator.get_locator(self.basic_info).locate(env_to_clone)
+        # a prefix path is named after its dir:
+        self.env_to_clone = (self.old_prefix.name if locator.is_prefix_path(env_to_clone)
+                             else env_to_clone)
             
         self.old_ver = old_ver
-        self.new_ver = new_ver
+        # before new_ver: 'auto' only reads the repodata index without cache
+        self.use_cache = use_cache
+        self.new_ver = self.resolve_new_ver(new_ver, explicit)
         self.dotless_ver = dotless_ver
+        self.env_name_arg = new_env_name
         self.new_env_name = self.get_new_env_name(new_env_name)
         self.new_prefix = jp(self.basic_info["env_dir"], self.new_env_name)
         self.new_yml = self.get_lean_yml_pathname()
         self.display_new_yml = display_new_yml 
-        self.user_rc = self.get_user_rc()
+        with self.timings.stage("user_rc"):
+            self.user_rc = self.get_user_rc()
         self.has_user_rc = self.user_rc is not None 
+        self.native_history = native_history
+        self.native_pip = native_pip
+        self.refresh_cache = refresh_cache
+        self.export_timeout = export_timeout
+        self.check = check
+        self.check_report = None
+        self.incremental = incremental
+        self.explicit = explicit
+        self.hash_type = hash_type
+        self.pip_versions = pip_versions
+        self.prune_pips = prune_pips
+        self.prune_channels = prune_channels
+        self.dropped_channels = []
+        self.pin_policy = pin_policy
+        self.pin_overrides = dict(pin_overrides or {})
+        self.promote_pips = promote_pips
+        self.promoted = []
+        self.lockfiles = []
+        # export data shared with the targets (see for_target); reentrant:
+        # the export data computation reads the owned dist-infos
+        self._shared = {}
+        self._shared_lock = threading.RLock()
 
 
-    def get_conda_info(self) -> dict:
+    @staticmethod
+    def get_conda_info() -> dict:
         """Return minimal number of conda-calculated 
         variables in a dict.
         All paths -> Path objects.
         """
+        # deferred: importing conda is the bulk of the startup time
+        from conda.base.context import context, user_rc_path
+
         # check first: active env == base?
         prefix_conda = Path(context.conda_prefix)
         prefix_active = Path(context.active_prefix)
@@ -133,7 +292,7 @@ class CondaEnvir:
             msg = "\n`new_cond_env` should be run in (base), but this "
             msg = msg + f"environment is activated: {prefix_active.name}\n"
             msg = msg + "Deactivate it & re-run `new_cond_env`."
-            self.log.error(msg)
+            logr_envir.error(msg)
             raise ValueError
         
         d = {"conda_prefix": prefix_conda,
@@ -141,6 +300,11 @@ class CondaEnvir:
              "user_condarc": Path(user_rc_path),
              # only consider user's .condarc, e.g.: <user path>\miniconda3\\envs
              "env_dir": Path(context.envs_dirs[0]),
+             # where existing envs are looked up (see locator.EnvLocator):
+             "envs_dirs": [Path(d) for d in context.envs_dirs],
+             "environments_txt": jp(Path.home(), ".conda", "environments.txt"),
+             "channels": list(context.channels),
+             "pkgs_dirs": [Path(p) for p in context.pkgs_dirs],
              #what about other kernels?
              "default_python": context.default_python # unused
             }
@@ -148,6 +312,124 @@ class CondaEnvir:
         return d
 
     
+    def get_repodata_index(self, read_only: bool=False):
+        db = jp(self.user_dir, cache.CACHE_DIRNAME, repodata.INDEX_FILENAME)
+        return repodata.RepodataIndex(db, self.basic_info.get("pkgs_dirs", []),
+                                      read_only=read_only)
+
+
+    def open_repodata_index(self):
+        """Return the repodata index for a lookup (new_ver auto, pins,
+        promotion): refreshed if use_cache (it is kept in the cache dir),
+        else opened read-only as last refreshed, so that no file is written.
+        Return None if it is unavailable (e.g. not built yet with use_cache
+        False).
+        """
+        index = None
+        try:
+            index = self.get_repodata_index(read_only=not self.use_cache)
+            if self.use_cache:
+                index.refresh()
+        except (OSError, sqlite3.Error) as err:
+            self.log.warning(f"Repodata index unavailable ({err}): the cached "
+                             "repodata are not used.")
+            if index is not None:
+                index.close()
+            return None
+        return index
+
+
+    @staticmethod
+    def get_channel_urls(chans: list) -> set:
+        """Return the base urls of the channels (names or urls), as expanded
+        by conda (e.g. defaults -> pkgs/main, pkgs/r).
+        """
+        return set().union(*channels.get_channel_bases([str(c) for c in chans]).values())
+
+
+    def get_best_new_ver(self) -> str:
+        """Return the highest kernel version for which every package in
+        the history specs of env_to_clone has a build in the cached
+        repodata of the configured channels (see open_repodata_index).
+        Raise ValueError if the repodata index is unavailable.
+        """
+        specs = proc.get_history_specs(self.old_prefix, canonical=False)
+        names = {proc.spec_name(s) for s in specs} - {self.kernel}
+        urls = self.get_channel_urls(self.basic_info["channels"])
+        index = self.open_repodata_index()
+        if index is None:
+            msg = "-new_ver auto needs the repodata index"
+            if not self.use_cache:
+                msg = msg + ", which -no_cache does not build: run once with the cache"
+            msg = msg + " or pass -new_ver explicitly."
+            self.log.error(msg)
+            raise ValueError(msg)
+        try:
+            best, unknown = index.best_python_version(names, channels=urls)
+        except sqlite3.Error as err:
+            msg = f"Repodata index unreadable ({err}): pass -new_ver explicitly."
+            self.log.error(msg)
+            raise ValueError(msg) from err
+        finally:
+            index.close()
+        if unknown:
+            self.log.warning("Not in the cached repodata (ignored): "
+                             + ", ".join(unknown))
+        if best is None:
+            msg = "No kernel version has builds for all the specs of "
+            msg = msg + f"{self.env_to_clone} in the cached repodata of its "
+            msg = msg + "channels: pass -new_ver explicitly."
+            self.log.error(msg)
+            raise ValueError(msg)
+        self.log.info(f"Selected new_ver: {best}")
+        return best
+
+
+    def resolve_new_ver(self, new_ver: str, explicit: bool) -> str:
+        """Return new_ver, or the best version if 'auto' (see
+        get_best_new_ver). Raise ValueError if explicit & new_ver != old_ver.
+        """
+        if new_ver == repodata.AUTO:
+            with self.timings.stage("auto_ver"):
+                new_ver = self.get_best_new_ver()
+        if explicit and new_ver != self.old_ver:
+            msg = "The explicit (exact builds) output needs new_ver == old_ver."
+            self.log.error(msg)
+            raise ValueError(msg)
+        return new_ver
+
+
+    def for_target(self, new_ver: str, with_setup: bool=False) -> "CondaEnvir":
+        """Return a CondaEnvir for another new version of env_to_clone: it
+        shares the conda setup & the export data of this one (exported &
+        parsed once), but has its own new_env_name, new_prefix, new_yml &
+        timings; those start with the stages of this one if with_setup (so
+        that they are reported once, with the first target).
+        A new_env_name given by the user is suffixed with new_ver.
+        """
+        target = copy.copy(self)
+        target.timings = Timings(enabled=self.timings.enabled)
+        if with_setup:
+            target.timings.records = list(self.timings.records)
+        target.new_ver = self.resolve_new_ver(new_ver, self.explicit)
+        name = self.env_name_arg
+        if name != "default":
+            name = f"{name}_{target.new_ver}"
+        target.new_env_name = target.get_new_env_name(name)
+        target.new_prefix = jp(self.basic_info["env_dir"], target.new_env_name)
+        target.new_yml = target.get_lean_yml_pathname()
+        target.check_report = None
+        target.dropped_channels = []
+        target.promoted = []
+        target.lockfiles = []
+        return target
+
+
+    def get_targets(self, new_vers: list) -> list:
+        """Return a CondaEnvir per version in new_vers (see for_target)."""
+        return [self.for_target(v, with_setup=not i) for i, v in enumerate(new_vers)]
+
+
     def get_user_rc(self):
         rc = self.basic_info["user_condarc"]
         if rc.exists():
@@ -165,13 +447,12 @@ class CondaEnvir:
         `create_default_packages` key will).
         Return the key value from user's rc if set False, else True.
         """
-        out = True
         if self.has_user_rc:
-            rc = proc.yaml_round_trip_load(self.user_rc)
-            out = rc.get("add_pip_as_python_dependency")
-            if out is not None and not out:
-                return out
-        return out
+            # a config file, not an export: typed scalars from the yaml loader
+            rc = proc.yaml_safe_load(self.user_rc.read_text()) or {}
+            if rc.get("add_pip_as_python_dependency") is False:
+                return False
+        return True
 
 
     def get_new_env_name(self, str_name):
@@ -196,10 +477,23 @@ class CondaEnvir:
         return jp(self.user_dir, n)
 
 
+    def get_lockfile_pathnames(self) -> tuple:
+        """Return the paths of the explicit spec & pip requirements files,
+        named after the new yml file: <lean yml stem>.explicit.txt &
+        <lean yml stem>.requirements.txt
+        """
+        return (self.new_yml.with_suffix(".explicit.txt"),
+                self.new_yml.with_suffix(".requirements.txt"))
+
+
     @staticmethod
-    def get_export_cmd(env_name:str, flag: str) -> str:
-        cmd = "conda env export -n {} {}"
-        return cmd.format(env_name, flag)
+    def get_export_cmd(prefix: Path, flag: str) -> str:
+        # by prefix: the env may not be in an envs dir
+        path = proc.path2str(prefix)
+        if " " in path:
+            path = f'"{path}"'
+        cmd = "conda env export -p {} {}"
+        return cmd.format(path, flag)
 
     
     def get_export_stream(self, cmd: str) -> str:
@@ -207,12 +501,179 @@ class CondaEnvir:
         conda env export cmd.
         """
         self.log.debug(f"Running cmd: {cmd}")
-        stream = proc.run_export(cmd)
+        stream = proc.run_export(cmd, timeout=self.export_timeout)
 
         return stream
 
 
-    def _show_final_msg(self):
+    def get_export_yml(self, cmd: str, round_trip: bool=True):
+        """Return the parsed output of the conda env export cmd, which
+        is parsed while it is streamed. Use round_trip=False for read-only
+        data (fast parser, plain python objects).
+        """
+        self.log.debug(f"Running cmd: {cmd}")
+        parse = partial(proc.load_as_yml, round_trip=round_trip)
+        return proc.stream_export(cmd, timeout=self.export_timeout, parse=parse)
+
+
+    def get_export_ymls(self, flags: list) -> dict:
+        """Run the `conda env export` commands for the given flags
+        concurrently & return their parsed streams as {flag: yml}.
+        """
+        cmds = {flag: self.get_export_cmd(self.old_prefix, flag) for flag in flags}
+        # only the --from-history data is written out: the others are
+        # read-only & skip the round-trip objects
+        round_trips = {cmd: flag == "--from-history" for flag, cmd in cmds.items()}
+        runner = lambda cmd: self.get_export_yml(cmd, round_trip=round_trips[cmd])
+        ymls = proc.run_exports(list(cmds.values()),
+                                timeout=self.export_timeout,
+                                runner=runner)
+
+        return {flag: ymls[cmd] for flag, cmd in cmds.items()}
+
+
+    def get_history_yml(self):
+        """Return the equivalent of the `--from-history` export data,
+        built in-process from <old_prefix>/conda-meta/history.
+        Return None if the history cannot be used, in which case the
+        export subprocess is the fallback.
+        """
+        try:
+            specs = proc.get_history_specs(self.old_prefix)
+        except FileNotFoundError:
+            self.log.debug(f"No history file in {self.old_prefix}.")
+            return None
+        except (ValueError, SyntaxError) as err:
+            self.log.warning(f"Unreadable history file ({err}): using export.")
+            return None
+
+        return {"name": self.env_to_clone,
+                "channels": list(self.basic_info["channels"]),
+                "dependencies": specs,
+                "prefix": proc.path2str(self.old_prefix)}
+
+
+    def get_env_fingerprint(self) -> str:
+        """Return cache.env_fingerprint(old_prefix), computed once for this
+        CondaEnvir & its targets (it stats every conda-meta record).
+        """
+        with self._shared_lock:
+            if "env_fp" not in self._shared:
+                self._shared["env_fp"] = cache.env_fingerprint(self.old_prefix)
+        return self._shared["env_fp"]
+
+
+    def get_owned_distinfos(self) -> set:
+        """Return the names of the conda-owned .dist-info dirs of old_prefix
+        (see processing.get_conda_owned_distinfos): the conda-meta records
+        are scanned once for this CondaEnvir & its targets.
+        """
+        with self._shared_lock:
+            if "owned" not in self._shared:
+                self._shared["owned"] = proc.get_conda_owned_distinfos(self.old_prefix)
+        return self._shared["owned"]
+
+
+    def get_site_pip_deps(self):
+        """Return a 2-tuple: (found, clean_pips), where clean_pips are the
+        pip dependencies (under the pip_versions policy) found in-process in the site-packages
+        of old_prefix. found is False if they could not be looked up, in which
+        case the export subprocess is the fallback.
+        """
+        try:
+            return True, proc.get_site_pip_deps(self.old_prefix,
+                                                policy=self.pip_versions,
+                                                get_owned=self.get_owned_distinfos)
+        except FileNotFoundError as err:
+            self.log.debug(f"{err} Using export.")
+            return False, None
+
+
+    def get_export_data(self) -> tuple:
+        """Return the 2-tuple (yml_his, clean_pips): the --from-history data
+        & the pip dependencies (under the pip_versions policy) of env_to_clone, read natively
+        if possible, else with (concurrent) exports.
+        """
+        NOBLD = "--no-builds"
+        HIST = "--from-history"
+
+        # pip deps from site-packages, else from --no-builds export stream
+        found = False
+        if self.native_pip:
+            with self.timings.stage("pip"):
+                found, clean_pips = self.get_site_pip_deps()
+
+        # --from-history data: native reader, else export stream
+        yml_his = None
+        if self.native_history:
+            with self.timings.stage("history"):
+                yml_his = self.get_history_yml()
+
+        # the needed (independent) exports run concurrently
+        flags = [NOBLD] if not found else []
+        if yml_his is None:
+            flags.append(HIST)
+        if flags:
+            with self.timings.stage("exports"):
+                ymls = self.get_export_ymls(flags)
+            if NOBLD in ymls:
+                clean_pips = proc.get_pip_deps(ymls[NOBLD], policy=self.pip_versions)
+            if HIST in ymls:
+                yml_his = ymls[HIST]
+
+        if self.prune_pips and clean_pips is not None:
+            with self.timings.stage("pip_graph"):
+                clean_pips = pipgraph.prune_pip_deps(clean_pips, self.old_prefix,
+                                                     self.get_owned_distinfos)
+
+        return yml_his, clean_pips
+
+
+    def get_cache(self):
+        return cache.ExportCache(jp(self.user_dir, cache.CACHE_DIRNAME))
+
+
+    def get_cached_export_data(self) -> tuple:
+        """Return get_export_data() from the cache if the env is unchanged
+        since it was stored, else compute & store it.
+        """
+        if not self.use_cache:
+            return self.get_export_data()
+
+        export_cache = self.get_cache()
+        # the data depends on the env state, the readers used & the channels
+        key = export_cache.make_key(self.old_prefix,
+                                    self.get_env_fingerprint(),
+                                    self.native_history, self.native_pip,
+                                    self.basic_info["channels"], self.pip_versions,
+                                    self.prune_pips)
+        if not self.refresh_cache:
+            with self.timings.stage("cache_get"):
+                data = export_cache.get(key)
+            if data is not None:
+                return data["yml_his"], data["clean_pips"]
+
+        yml_his, clean_pips = self.get_export_data()
+        with self.timings.stage("cache_put"):
+            export_cache.put(key, {"yml_his": yml_his, "clean_pips": clean_pips})
+
+        return yml_his, clean_pips
+
+
+    def get_shared_export_data(self) -> tuple:
+        """Return a copy of get_cached_export_data(), computed once for this
+        CondaEnvir & its targets (merge_export_data updates it in place).
+        """
+        with self._shared_lock:
+            if "export_data" not in self._shared:
+                self._shared["export_data"] = self.get_cached_export_data()
+        return copy.deepcopy(self._shared["export_data"])
+
+
+    def _show_final_msg(self, text: str=None, unchanged: bool=False):
+        """text: the content of the new file, read if not given;
+        unchanged: the file was up to date (kept as is).
+        """
         final_env = self.new_yml
         if not final_env.exists():
             msg = "Oops: final file not found!\n"
@@ -222,76 +683,297 @@ class CondaEnvir:
 
         if self.display_new_yml:
             print(f"\nFinal environment file: {final_env}\n")
-            print(final_env.read_text())
+            print(final_env.read_text() if text is None else text)
 
+        if unchanged:
+            print(msgf_unchanged.format(final_env.name))
         print(msgf_create_env.format(final_env))
-        print(msg_warn)
+        if self.lockfiles:
+            print(msgf_lockfiles.format(self.env_to_clone, self.new_env_name,
+                                        self.lockfiles[0]))
+            if len(self.lockfiles) > 1:
+                print(msgf_pip_lock.format(self.new_env_name, self.lockfiles[1]))
+        if self.promoted:
+            print(msgf_promoted.format(f"{self.kernel} {self.new_ver}",
+                                       ", ".join(self.promoted)))
+        if self.dropped_channels:
+            print(msgf_dropped_channels.format(self.env_to_clone,
+                                               ", ".join(self.dropped_channels)))
+        if self.check_report is None:
+            print(msg_warn)
+        else:
+            print(check.format_report(self.check_report, final_env))
 
     
-    def get_new_env_yaml(self) -> Path:
-        """Perform these step to create the final new_env_yaml:
-        1. Retrieve the pip dependencies dict from nobld_export stream & strip
-        their versions.
-        2. Update hist_export stream with data from .condarc (if found) and new env
-        3. Save the new data as per self.new_yml.name
+    def merge_export_data(self, yml_his: dict, clean_pips) -> dict:
+        """Return yml_his updated for the new env: name, prefix, new
+        kernel version, pip & the python deps from .condarc, and clean_pips;
+        channels pruned if prune_channels.
         """
-
-        # pip deps from --no-builds export stream
-        NOBLD = "--no-builds"
-        cmd = self.get_export_cmd(self.env_to_clone, NOBLD)
-        stream_nobld = self.get_export_stream(cmd)
-        yml_nobld = proc.load_as_yml(stream_nobld)
-
-        clean_pips = proc.get_pip_deps(yml_nobld)
-        #del yml_nobld
-                 
-        # update of --from-history export stream
-        HIST = "--from-history"
-        cmd = self.get_export_cmd(self.env_to_clone, HIST)
-        stream_hist = self.get_export_stream(cmd)
-        yml_his = proc.load_as_yml(stream_hist)
-
         self.log.debug(f"> yml_his:\n{yml_his}")
-                 
-        old_ker_name = self.kernel
-        new_ker_ver = old_ker_name + "=" + self.new_ver
-        old_ker_name = old_ker_name + "=" + self.old_ver 
 
         # reset name and prefix keys:
         yml_his["name"] = self.new_env_name
         yml_his["prefix"] = proc.path2str(self.new_prefix)
-                 
-        # add new kernel ver as 1st dep:
-        if yml_his["dependencies"][0] != new_ker_ver:
-            yml_his["dependencies"].insert(0, new_ker_ver)
-        # add pip:
-        yml_his["dependencies"].insert(1, "pip")
-
-        has_wheel = False
-        has_stt = False
-        for i, mapping in enumerate(yml_his["dependencies"]):
-            if mapping == old_ker_name:
-                 _ = yml_his["dependencies"].pop(i)
-            else:
-                 has_wheel = has_wheel or (mapping == "setuptools")
-                 has_stt = has_stt or (mapping == "wheel")
-        
-        if self.get_rc_python_deps():
-            if not has_stt:
-                yml_his["dependencies"].append("setuptools")
-            if not has_wheel:
-                yml_his["dependencies"].append("wheel")
 
-        # Finally add the pip deps from the 'long' yaml:
+        if self.prune_channels:
+            with self.timings.stage("channels"):
+                kept, self.dropped_channels = channels.prune_channels(
+                    self.old_prefix,
+                    yml_his.get("dependencies") or [],
+                    [str(c) for c in yml_his.get("channels") or self.basic_info["channels"]])
+            yml_his["channels"] = kept
+
         if clean_pips is not None:
             self.log.debug(f"> clean_pips:\n{clean_pips}")
-            yml_his["dependencies"].append(clean_pips)
         else:
             self.log.debug(f"> No pip deps found.")
 
-        proc.save_to_yml(self.new_yml, yml_his)
+        deps = yml_his.get("dependencies") or []
+        chans = yml_his.get("channels") or self.basic_info["channels"]
+        if self.pin_policy != "none" or self.pin_overrides:
+            with self.timings.stage("pins"):
+                deps, clean_pips = self.pin_export_data(deps, clean_pips, chans)
+        if self.promote_pips and clean_pips is not None:
+            with self.timings.stage("promote"):
+                self.promoted, clean_pips = self.promote_pip_deps(clean_pips, chans)
+            deps = list(deps) + self.promoted
+
+        # new kernel ver as 1st dep, pip, deduped deps, setuptools & wheel,
+        # and finally the pip deps from the 'long' yaml:
+        yml_his["dependencies"] = proc.merge_deps(deps,
+                                                  self.kernel,
+                                                  self.new_ver,
+                                                  self.get_rc_python_deps(),
+                                                  clean_pips)
+        return yml_his
+
+
+    def get_new_minor(self) -> str:
+        """Return new_ver as <major.minor>, or None if it is not numeric."""
+        m = repodata.rx_ver_minor.match(self.new_ver)
+        return None if m is None else f"{m.group(1)}.{m.group(2)}"
+
+
+    def get_incompatible(self, names, chans: list=None) -> set:
+        """Return the names without build for new_ver in the cached repodata
+        of the channels chans (default: the configured ones), per the index
+        (see open_repodata_index); names not in the index are not included.
+        """
+        target = self.get_new_minor()
+        if self.new_ver == self.old_ver or target is None:
+            return set()
+        index = self.open_repodata_index()
+        if index is None:
+            return set()
+        try:
+            urls = self.get_channel_urls(chans or self.basic_info["channels"])
+            pymins = index.get_pymins(set(names) - {self.kernel}, urls)
+        except sqlite3.Error as err:
+            self.log.warning(f"Repodata index unavailable ({err}): no package excluded.")
+            return set()
+        finally:
+            index.close()
+
+        return {n for n, p in pymins.items() if not repodata.supports(p, target)}
+
+
+    def promote_pip_deps(self, clean_pips: dict, chans: list=None) -> tuple:
+        """Return (conda_specs, clean_pips): the conda specs of the pip
+        dependencies with a conda package built for new_ver in the cached
+        repodata of the channels chans (default: the configured ones), per
+        the index (see open_repodata_index), & the remaining pip dependencies.
+        """
+        target = self.get_new_minor()
+        if target is None:
+            return [], clean_pips
+        index = self.open_repodata_index()
+        if index is None:
+            return [], clean_pips
+        try:
+            urls = self.get_channel_urls(chans or self.basic_info["channels"])
+            name_map = pypimap.get_name_map(index, urls)
+        except sqlite3.Error as err:
+            self.log.warning(f"Repodata index unavailable ({err}): no pip dependency moved.")
+            return [], clean_pips
+        finally:
+            index.close()
+        conda_specs, clean_pips = pypimap.promote_pip_deps(clean_pips, name_map, target)
+        if conda_specs:
+            self.log.info("Pip dependencies moved to conda: " + ", ".join(conda_specs))
+
+        return conda_specs, clean_pips
+
+
+    def pin_export_data(self, deps: list, clean_pips, chans: list=None) -> tuple:
+        """Return (deps, clean_pips) with the version constraints of
+        pin_policy & pin_overrides, from the installed versions; chans: the
+        channels of the new env (see get_incompatible).
+        """
+        names = {proc.spec_name(d) for d in deps if isinstance(d, str)}
+        incompatible = self.get_incompatible(names, chans)
+        if incompatible:
+            self.log.info("No build for the new version (unpinned): "
+                          + ", ".join(sorted(incompatible)))
+        deps = pins.pin_specs(deps, pins.read_conda_versions(self.old_prefix),
+                              self.pin_policy, self.pin_overrides,
+                              skip={self.kernel}, incompatible=incompatible)
+        if clean_pips is not None:
+            installed = pins.read_pip_versions(self.old_prefix, self.get_owned_distinfos)
+            clean_pips = dict(pip=pins.pin_specs(clean_pips["pip"], installed,
+                                                 self.pin_policy, self.pin_overrides,
+                                                 pip=True))
+        return deps, clean_pips
+
+
+    def get_repodata_sig(self):
+        """Return the state of the cached repodata used by the merge (pins
+        for a new version, promoted pip deps), or None if they are not used:
+        the stat signatures of the repodata files if use_cache (the index is
+        refreshed from them), else the sources of the read-only index (None
+        if there is none).
+        """
+        pinned = self.pin_policy != "none" or bool(self.pin_overrides)
+        if not (self.promote_pips or pinned and self.new_ver != self.old_ver):
+            return None
+        if self.use_cache:
+            return [f"{f.parent}/{cache.stat_sig(f)}" for f in
+                    repodata.iter_repodata_files(self.basic_info.get("pkgs_dirs", []))]
+        try:
+            index = self.get_repodata_index(read_only=True)
+        except (OSError, sqlite3.Error):
+            return None
+        try:
+            return list(index.get_sig())
+        finally:
+            index.close()
+
+
+    def get_provenance(self) -> str:
+        """Return the provenance header of the new yml file. Its fingerprint
+        covers the source env, the user's .condarc, the channels, the
+        options of the outputs (including the hash of the explicit file) &
+        the cached repodata they use. Only stat calls are made: one per
+        conda-meta record (shared with the export cache key) & per repodata
+        file.
+        """
+        fp = cache.ExportCache.make_key(self.get_env_fingerprint(),
+                                        cache.stat_sig(self.basic_info["user_condarc"]),
+                                        self.basic_info["channels"],
+                                        self.native_history, self.native_pip,
+                                        self.pip_versions, self.prune_pips,
+                                        self.prune_channels, self.pin_policy,
+                                        sorted(self.pin_overrides.items()),
+                                        self.promote_pips,
+                                        self.hash_type if self.explicit else None,
+                                        self.get_repodata_sig())
+        return provenance.format_header(VERSION, self.env_to_clone,
+                                        self.old_ver, self.new_ver, fp[:16])
+
+
+    def save_new_yml(self, spec: LeanSpec) -> str:
+        """Save the spec to self.new_yml & return the text written. If
+        incremental & the file was generated before, only the changed
+        dependencies are patched in the existing file. The generated
+        dependencies, the base of the next patch, are saved in its sidecar
+        file (see provenance.write_sidecar) with the channels, the promoted
+        pip deps & the dropped channels.
+        """
+        # plain (json) copy
+        deps = spec.dependencies
+        sidecar = provenance.read_sidecar(self.new_yml) if self.incremental else None
+        patched = None
+        # only the dependencies are patched: new channels, new file
+        if sidecar is not None and sidecar.get("channels") == spec.channels:
+            lines = self.new_yml.read_text(encoding="utf-8").splitlines()
+            patched = provenance.patch_deps(lines[1:], sidecar["dependencies"], deps)
+        if patched is not None:
+            self.log.info(f"Patched: {self.new_yml.name}")
+            text = "\n".join([spec.header] + patched) + "\n"
+        else:
+            text = spec.to_yaml()
+        self.new_yml.write_text(text, encoding="utf-8")
+        provenance.write_sidecar(self.new_yml, spec.header, deps,
+                                 channels=spec.channels,
+                                 promoted=self.promoted,
+                                 dropped_channels=self.dropped_channels)
+
+        return text
+
+
+    def get_lean_spec(self, header: str=None) -> LeanSpec:
+        """Return the lean spec of the new env, in memory: nothing is
+        printed or written (but the cache entries, if use_cache: export data
+        & repodata index).
+        header: the provenance header, if already computed.
+        """
+        if header is None:
+            with self.timings.stage("provenance"):
+                header = self.get_provenance()
+
+        with self.timings.stage("export_data"):
+            yml_his, clean_pips = self.get_shared_export_data()
+
+        with self.timings.stage("merge"):
+            yml_his = self.merge_export_data(yml_his, clean_pips)
 
-        self._show_final_msg()
+        return LeanSpec(yml_his, header=header, source=self.env_to_clone)
+
+
+    def get_new_env_yaml(self, show_msg: bool=True) -> Path:
+        """Perform these step to create the final new_env_yaml:
+        1. Retrieve the pip dependencies dict from site-packages (or from the
+        nobld_export stream) & strip their versions.
+        2. Update the history data (conda-meta/history or hist_export stream)
+        with data from .condarc (if found) and new env
+        3. Save the new data as per self.new_yml.name
+        If incremental, steps 1-3 are skipped when the provenance header of
+        an existing new_env_yaml is unchanged.
+        Return the path of the new yml file; the final message is only
+        printed if show_msg. (See get_lean_spec for the in-memory spec.)
+        """
+        with self.timings.stage("provenance"):
+            header = self.get_provenance()
+            up_to_date = (self.incremental and not self.refresh_cache
+                          and provenance.read_header(self.new_yml) == header)
+
+        text = None
+        if up_to_date:
+            self.log.info(f"Source env unchanged: {self.new_yml.name} kept as is.")
+            # the reports of the generation the file still reflects
+            sidecar = provenance.read_sidecar(self.new_yml) or {}
+            self.promoted = sidecar.get("promoted") or []
+            self.dropped_channels = sidecar.get("dropped_channels") or []
+            if self.check:
+                yml_his = proc.yaml_safe_load(self.new_yml.read_text(encoding="utf-8"))
+        else:
+            spec = self.get_lean_spec(header)
+            yml_his = spec.data
+            with self.timings.stage("save"):
+                text = self.save_new_yml(spec)
+
+        if self.explicit:
+            with self.timings.stage("lockfiles"):
+                explicit_file, requirements_file = self.get_lockfile_pathnames()
+                if up_to_date and explicit_file.exists():
+                    self.lockfiles = [p for p in (explicit_file, requirements_file)
+                                      if p.exists()]
+                else:
+                    self.lockfiles = lockfile.write_lockfiles(self.old_prefix,
+                                                              explicit_file,
+                                                              requirements_file,
+                                                              self.hash_type,
+                                                              self.get_owned_distinfos)
+
+        if self.check:
+            with self.timings.stage("check"):
+                self.check_report = check.check_env_yml(yml_his)
+
+        if show_msg:
+            with self.timings.stage("display"):
+                self._show_final_msg(text, unchanged=up_to_date)
+
+        return self.new_yml
         
 
     def __repr__(self):
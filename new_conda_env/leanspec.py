@@ -0,0 +1,102 @@
+# leanspec.py
+__doc__ = """In-memory lean env spec (library API).
+LeanSpec holds the data of a new env yml file; serialization, file writing
+& display are done on demand, so specs can be generated in-process without
+touching the filesystem, e.g.:
+    from new_conda_env.envir import CondaEnvir
+    spec = CondaEnvir(old_ver="3.10", new_ver="3.11", env_to_clone="ds310",
+                      display_new_yml=False, use_cache=False).get_lean_spec()
+    spec.pip_deps, spec.to_dict(), spec.to_yaml()
+"""
+from pathlib import Path
+import logging
+
+import new_conda_env.processing as proc
+from new_conda_env import provenance
+# ..........................................................................
+
+log = logging.getLogger(__name__)
+log.setLevel(logging.ERROR)
+
+sh = logging.StreamHandler()
+formatter = logging.Formatter('%(name)-15s: %(levelname)-8s %(message)s')
+sh.setFormatter(formatter)
+log.addHandler(sh)
+
+
+class LeanSpec:
+    """The lean spec of a new env.
+    Call: LeanSpec(data: dict, header: str="", source: str="")
+    Arguments:
+    - data (dict): the env document (name, channels, dependencies, prefix),
+      as merged by CondaEnvir.merge_export_data (round-trip objects, dumped
+      as is by to_yaml)
+    - header (str, ""): the provenance header, written as the first line
+    - source (str, ""): the name of the env it was cloned from
+    """
+    def __init__(self, data: dict, header: str="", source: str=""):
+        self.data = data
+        self.header = header
+        self.source = source
+
+
+    @property
+    def name(self) -> str:
+        return self.data.get("name")
+
+
+    @property
+    def channels(self) -> list:
+        return [str(c) for c in self.data.get("channels") or []]
+
+
+    @property
+    def dependencies(self) -> list:
+        """Plain copy of the dependencies: conda specs, then {"pip": [...]}."""
+        return [{k: [str(s) for s in v] for k, v in d.items()}
+                if isinstance(d, dict) else str(d)
+                for d in self.data.get("dependencies") or []]
+
+
+    @property
+    def conda_deps(self) -> list:
+        return provenance.split_deps(self.dependencies)[0]
+
+
+    @property
+    def pip_deps(self) -> list:
+        return provenance.split_deps(self.dependencies)[1]
+
+
+    @property
+    def prefix(self) -> str:
+        return self.data.get("prefix")
+
+
+    def to_dict(self) -> dict:
+        """Return the spec as plain python objects (json-serializable)."""
+        d = {"name": self.name, "channels": self.channels,
+             "dependencies": self.dependencies}
+        if self.prefix is not None:
+            d["prefix"] = str(self.prefix)
+        return d
+
+
+    def to_yaml(self) -> str:
+        """Return the yml file text (with the provenance header)."""
+        text = proc.yaml_round_trip_dump(self.data)
+        return f"{self.header}\n{text}" if self.header else text
+
+
+    def write(self, yml_file: Path) -> Path:
+        """Write the yml file text to yml_file & return its path."""
+        yml_file = Path(yml_file)
+        yml_file.write_text(self.to_yaml(), encoding="utf-8")
+        log.debug(f"File saved to yml: {proc.path2str(yml_file)}")
+        return yml_file
+
+
+    def __repr__(self):
+        return (f"{self.__class__.__name__}(name={self.name!r}, "
+                f"source={self.source!r}, {len(self.conda_deps)} conda & "
+                f"{len(self.pip_deps)} pip deps)")
@@ -0,0 +1,164 @@
+# locator.py
+__doc__ = """Env locator: name -> prefix index over all the envs_dirs & the
+envs registered in ~/.conda/environments.txt, built in one pass.
+The index is shared by the CondaEnvir instances of a process (batch & server
+modes) & only rebuilt when an envs dir or environments.txt changes, so a
+lookup costs a few stat calls, whatever the number of envs.
+"""
+import os
+import threading
+from pathlib import Path
+import logging
+# ..........................................................................
+
+log = logging.getLogger(__name__)
+log.setLevel(logging.ERROR)
+
+sh = logging.StreamHandler()
+formatter = logging.Formatter('%(name)-15s: %(levelname)-8s %(message)s')
+sh.setFormatter(formatter)
+log.addHandler(sh)
+
+
+ROOT_ENV_NAME = "base"
+
+jp = Path.joinpath
+
+
+def is_prefix_path(env: str) -> bool:
+    """Whether env is given as a path rather than as an env name."""
+    return os.sep in env or "/" in env or env in (".", "..")
+
+
+def is_env(prefix: Path) -> bool:
+    return jp(Path(prefix), "conda-meta").is_dir()
+
+
+def read_environments_txt(environments_txt: Path) -> list:
+    """Return the prefixes listed in environments.txt ([] if missing)."""
+    try:
+        text = Path(environments_txt).read_text(encoding="utf-8")
+    except OSError:
+        return []
+    return [Path(line.strip()) for line in text.splitlines() if line.strip()]
+
+
+def _dir_sig(p: Path):
+    try:
+        st = os.stat(p)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+class EnvLocator:
+    """Name -> prefix index of the conda envs.
+    Call: EnvLocator(envs_dirs: list, environments_txt: Path=None,
+                     root_prefix: Path=None)
+    Arguments:
+    - envs_dirs (list): conda's envs_dirs, in priority order: as with
+      `conda -n`, the first dir holding a name wins
+    - environments_txt (Path, None): the user's registry of env prefixes;
+      its envs are found by their dir name, unless shadowed
+    - root_prefix (Path, None): the base env, found as 'base'
+    """
+    def __init__(self, envs_dirs: list, environments_txt: Path=None,
+                 root_prefix: Path=None):
+        self.envs_dirs = [Path(d) for d in envs_dirs]
+        self.environments_txt = environments_txt
+        self.root_prefix = root_prefix
+        self.lock = threading.Lock()
+        self.sig = None
+        self.index = {}
+
+
+    def get_sig(self) -> tuple:
+        """Return the state of the envs dirs & environments.txt: creating
+        or removing an env changes its dir's mtime.
+        """
+        paths = self.envs_dirs + [self.environments_txt] * bool(self.environments_txt)
+        return tuple(_dir_sig(p) for p in paths)
+
+
+    def build(self) -> dict:
+        """Return the name -> prefix index (one scandir per envs dir)."""
+        index = {}
+        if self.root_prefix is not None:
+            index[ROOT_ENV_NAME] = Path(self.root_prefix)
+        for envs_dir in self.envs_dirs:
+            try:
+                with os.scandir(envs_dir) as it:
+                    for e in it:
+                        if not e.name.startswith(".") and e.is_dir():
+                            index.setdefault(e.name, Path(e.path))
+            except OSError:
+                continue
+        if self.environments_txt:
+            for prefix in read_environments_txt(self.environments_txt):
+                index.setdefault(prefix.name, prefix)
+        log.debug(f"Env index: {len(index)} names.")
+
+        return index
+
+
+    def get_index(self, refresh: bool=False) -> dict:
+        """Return the index, rebuilt if the envs dirs changed."""
+        with self.lock:
+            sig = self.get_sig()
+            if refresh or sig != self.sig:
+                self.index = self.build()
+                self.sig = sig
+            return self.index
+
+
+    def envs(self) -> dict:
+        """Return {name: prefix} of the known envs (conda-meta checked),
+        base excluded.
+        """
+        return {name: p for name, p in self.get_index().items()
+                if name != ROOT_ENV_NAME and is_env(p)}
+
+
+    def locate(self, env: str) -> Path:
+        """Return the prefix of env, an env name or a prefix path.
+        Raise FileNotFoundError if env is not a conda env.
+        """
+        if is_prefix_path(env):
+            prefix = Path(os.path.abspath(Path(env).expanduser()))
+            if is_env(prefix):
+                return prefix
+            msg = f"Not a conda env (no conda-meta): {prefix}"
+        else:
+            prefix = self.get_index().get(env)
+            if prefix is None or not is_env(prefix):
+                # stale index (e.g. env created in the same second): rebuild
+                prefix = self.get_index(refresh=True).get(env)
+            if prefix is not None and is_env(prefix):
+                return prefix
+            searched = [str(d) for d in self.envs_dirs]
+            if self.environments_txt:
+                searched.append(str(self.environments_txt))
+            msg = "Typo in <env_to_clone>? "
+            msg = msg + f"Env not found: {env} (searched: {', '.join(searched)})"
+        log.error(msg)
+        raise FileNotFoundError(msg)
+
+
+_locators = {}
+_locators_lock = threading.Lock()
+
+
+def get_locator(basic_info: dict) -> EnvLocator:
+    """Return the EnvLocator of the conda setup in basic_info (see
+    CondaEnvir.get_conda_info), shared in the process.
+    """
+    envs_dirs = basic_info.get("envs_dirs") or [basic_info["env_dir"]]
+    key = (tuple(map(str, envs_dirs)),
+           str(basic_info.get("environments_txt")),
+           str(basic_info.get("conda_prefix")))
+    with _locators_lock:
+        if key not in _locators:
+            _locators[key] = EnvLocator(envs_dirs,
+                                        basic_info.get("environments_txt"),
+                                        basic_info.get("conda_prefix"))
+        return _locators[key]
@@ -0,0 +1,149 @@
+# lockfile.py
+__doc__ = """Exact ('locked') outputs for same-version clones: a conda
+explicit spec file (@EXPLICIT: package urls with their md5 or sha256, from
+the conda-meta records) & a pip requirements file (pinned versions).
+`conda create --file <explicit file>` runs no solver: the packages are
+downloaded & linked as listed.
+"""
+import re
+import json
+import os
+from pathlib import Path
+import logging
+
+import new_conda_env.processing as proc
+from new_conda_env import VERSION
+# ..........................................................................
+
+log = logging.getLogger(__name__)
+log.setLevel(logging.ERROR)
+
+sh = logging.StreamHandler()
+formatter = logging.Formatter('%(name)-15s: %(levelname)-8s %(message)s')
+sh.setFormatter(formatter)
+log.addHandler(sh)
+
+
+HASH_TYPES = ("md5", "sha256")
+RECORD_FIELDS = ("name", "fn", "url", "md5", "sha256", "subdir", "depends")
+
+msgf_explicit_head = """# This file may be used to create an environment using:
+# $ conda create --name <env> --file <this file>
+# platform: {}
+# created-by: new_conda_env {}
+@EXPLICIT
+"""
+
+# credentials in urls: anaconda.org tokens & user:password@
+rx_url_token = re.compile(r"/t/[A-Za-z0-9-]+(?=/)")
+rx_url_auth = re.compile(r"(?<=://)[^/@]+@")
+
+jp = Path.joinpath
+
+
+def read_prefix_records(prefix: Path) -> list:
+    """Return the conda-meta records of the env at prefix (RECORD_FIELDS
+    only), sorted by name.
+    """
+    records = []
+    meta = jp(Path(prefix), "conda-meta")
+    for f in sorted(meta.glob("*.json")):
+        try:
+            data = json.loads(f.read_text(encoding="utf-8"))
+        except (OSError, ValueError) as err:
+            log.warning(f"Unreadable record {f.name}: {err}")
+            continue
+        records.append({k: data.get(k) for k in RECORD_FIELDS})
+
+    return sorted(records, key=lambda r: r["name"] or "")
+
+
+def sort_records(records: list) -> list:
+    """Return the records in dependency order (a package after its
+    dependencies; by name otherwise), as conda lists them.
+    """
+    by_name = {r["name"]: r for r in records}
+    deps = {r["name"]: {proc.spec_name(d) for d in r["depends"] or ()} & by_name.keys()
+            for r in records}
+    done, out = set(), []
+    while len(done) < len(by_name):
+        ready = [n for n in sorted(by_name) if n not in done and deps[n] <= done]
+        if not ready:
+            # dependency cycle: the rest by name
+            ready = [n for n in sorted(by_name) if n not in done]
+        for n in ready:
+            out.append(by_name[n])
+            done.add(n)
+
+    return out
+
+
+def remove_auth(url: str) -> str:
+    return rx_url_auth.sub("", rx_url_token.sub("", url))
+
+
+def explicit_lines(records: list, hash_type: str="md5") -> list:
+    """Return the @EXPLICIT lines: '<url>#<md5>' or '<url>#sha256:<sha256>'
+    (no hash if the record has none); records without url are commented.
+    """
+    if hash_type not in HASH_TYPES:
+        raise ValueError(f"hash_type: one of {HASH_TYPES}")
+    lines = []
+    for r in sort_records(records):
+        url = r["url"]
+        if not url or url.startswith("<unknown>"):
+            lines.append(f"# no URL for: {r['fn'] or r['name']}")
+            continue
+        url = remove_auth(url)
+        h = r[hash_type]
+        if h:
+            url = url + (f"#{h}" if hash_type == "md5" else f"#sha256:{h}")
+        lines.append(url)
+
+    return lines
+
+
+def get_platform(records: list) -> str:
+    subdirs = {r["subdir"] for r in records} - {None, "noarch"}
+    return sorted(subdirs)[0] if subdirs else "noarch"
+
+
+def get_explicit_text(prefix: Path, hash_type: str="md5") -> str:
+    """Return the explicit spec file text of the env at prefix."""
+    records = read_prefix_records(prefix)
+    head = msgf_explicit_head.format(get_platform(records), VERSION)
+    return head + "\n".join(explicit_lines(records, hash_type)) + "\n"
+
+
+def get_requirements_text(prefix: Path, get_owned=None) -> str:
+    """Return the pip requirements text (name==version) of the pip-installed
+    packages of the env at prefix, or "" if there are none.
+    """
+    try:
+        pip_deps = proc.get_site_pip_deps(prefix, strip_ver=False, get_owned=get_owned)
+    except FileNotFoundError:
+        log.warning(f"No site-packages in {prefix}: no pip requirements.")
+        return ""
+    if pip_deps is None:
+        return ""
+    return "\n".join(pip_deps["pip"]) + "\n"
+
+
+def write_lockfiles(prefix: Path, explicit_file: Path, requirements_file: Path,
+                    hash_type: str="md5", get_owned=None) -> list:
+    """Write the explicit spec file & (if there are pip packages) the
+    requirements file of the env at prefix. Return the paths written.
+    get_owned: as in processing.iter_pip_distinfos.
+    """
+    explicit_file = Path(explicit_file)
+    explicit_file.write_text(get_explicit_text(prefix, hash_type), encoding="utf-8")
+    written = [explicit_file]
+    requirements = get_requirements_text(prefix, get_owned)
+    if requirements:
+        Path(requirements_file).write_text(requirements, encoding="utf-8")
+        written.append(Path(requirements_file))
+    elif os.path.exists(requirements_file):
+        # stale: from a previous run
+        os.remove(requirements_file)
+
+    return written
@@ -0,0 +1,141 @@
+# pins.py
+__doc__ = """Pin relaxation policy: version constraints for the specs of the
+new env, derived from the versions installed in the cloned env (conda-meta
+records & pip .dist-info dirs), to narrow the solver's search:
+- 'none': no constraint (the default of new_conda_env)
+- 'lower': the installed version as lower bound (numpy>=1.24.1)
+- 'major': the installed major version (numpy=1.*; pip: numpy==1.*)
+- 'exact': the installed version (numpy==1.24.1)
+Per-package overrides take a policy or a version constraint (e.g. '>=1.9,<2').
+Specs with a constraint (e.g. 'numpy>=1.24' in the history) are kept as is,
+and policy-derived constraints are not applied to the packages known to have
+no build for the new kernel version.
+"""
+from pathlib import Path
+import logging
+
+import new_conda_env.processing as proc
+from new_conda_env import pipspec
+# ..........................................................................
+
+log = logging.getLogger(__name__)
+log.setLevel(logging.ERROR)
+
+sh = logging.StreamHandler()
+formatter = logging.Formatter('%(name)-15s: %(levelname)-8s %(message)s')
+sh.setFormatter(formatter)
+log.addHandler(sh)
+
+
+PIN_POLICIES = ("none", "lower", "major", "exact")
+CONSTRAINT_START = tuple("<>=!~")
+
+jp = Path.joinpath
+
+
+def read_conda_versions(prefix: Path) -> dict:
+    """Return {name: version} of the conda packages of the env at prefix,
+    from the conda-meta record filenames (<name>-<version>-<build>).
+    """
+    versions = {}
+    for f in jp(Path(prefix), "conda-meta").glob("*.json"):
+        parts = f.stem.rsplit("-", 2)
+        if len(parts) == 3:
+            versions[parts[0]] = parts[1]
+    return versions
+
+
+def read_pip_versions(prefix: Path, get_owned=None) -> dict:
+    """Return {normalized name: version} of the pip-installed distributions
+    of the env at prefix ({} if it has no site-packages).
+    """
+    try:
+        pip_deps = proc.get_site_pip_deps(prefix, strip_ver=False, get_owned=get_owned)
+    except FileNotFoundError:
+        return {}
+    versions = {}
+    for line in (pip_deps or {}).get("pip", []):
+        name, _, ver = line.partition("==")
+        versions[name] = ver
+    return versions
+
+
+def parse_overrides(items) -> dict:
+    """Return {name: rule} from 'name:rule' strings, where rule is a policy
+    or a version constraint. Raise ValueError on an invalid item.
+    """
+    overrides = {}
+    for item in items or ():
+        name, sep, rule = item.partition(":")
+        name, rule = name.strip(), rule.strip()
+        if not sep or not name or not (rule in PIN_POLICIES or rule.startswith(CONSTRAINT_START)):
+            msg = f"Invalid pin override {item!r}: expected <name>:<rule>, "
+            msg = msg + f"rule: one of {PIN_POLICIES} or a version constraint."
+            raise ValueError(msg)
+        overrides[name] = rule
+    return overrides
+
+
+def version_constraint(version: str, rule: str, pip: bool=False) -> str:
+    """Return the constraint of rule (policy or constraint) for the
+    installed version ("" if none).
+    """
+    if rule.startswith(CONSTRAINT_START):
+        return rule
+    if rule == "none" or not version:
+        return ""
+    if rule == "lower":
+        return f">={version}"
+    if rule == "exact":
+        return f"=={version}"
+    m = pipspec.rx_major.match(version)
+    if m is None:
+        # e.g. a date or letter version: lower bound instead
+        return f">={version}"
+    return f"=={m.group(1)}.*" if pip else f"={m.group(1)}.*"
+
+
+def _conda_unpinned(spec: str) -> bool:
+    return spec.rpartition("::")[2] == proc.spec_name(spec)
+
+
+def pin_specs(specs: list, versions: dict, policy: str="none", overrides: dict=None,
+              skip=(), incompatible=(), pip: bool=False) -> list:
+    """Return the conda specs (pip entries if pip) with the constraints of
+    the policy or of their override, from the installed versions; the names
+    in skip (e.g. the kernel) & the specs with a constraint are kept as is;
+    the names in incompatible only take a constraint override.
+    """
+    if policy not in PIN_POLICIES:
+        raise ValueError(f"pin policy: one of {PIN_POLICIES}")
+    overrides = overrides or {}
+    if policy == "none" and not overrides:
+        return specs
+    out = []
+    for spec in specs:
+        if not isinstance(spec, str):
+            out.append(spec)
+            continue
+        if pip:
+            req = pipspec.parse_requirement(spec)
+            name = req["name"]
+            unpinned = name is not None and not (req["specifier"] or req["url"])
+            key = proc.norm_dist_name(name) if name else None
+        else:
+            name = key = proc.spec_name(spec)
+            unpinned = _conda_unpinned(spec)
+        if not unpinned or key in skip:
+            out.append(spec)
+            continue
+        rule = overrides.get(name, overrides.get(key, policy))
+        if name in incompatible and not rule.startswith(CONSTRAINT_START):
+            log.info(f"No build of {name} for the new kernel version: unpinned.")
+            rule = "none"
+        constraint = version_constraint(versions.get(key, ""), rule, pip)
+        if pip:
+            req["specifier"] = constraint
+            out.append(pipspec.format_requirement(req, "keep"))
+        else:
+            out.append(spec + constraint)
+
+    return out
@@ -0,0 +1,135 @@
+# pipgraph.py
+__doc__ = """Pip dependency graph of an env, from the Requires-Dist headers
+of the .dist-info dirs of its site-packages.
+Only the root pip distributions, i.e. those no other installed distribution
+requires, are kept in the lean yml: pip reinstalls their dependencies. Roots
+also provided by a conda package of the env are dropped.
+Requirements conditional on an extra (`; extra == "..."`) are ignored: the
+extras requested at install time are not recorded, so such a dependency is
+kept as a root rather than lost.
+"""
+import re
+from pathlib import Path
+import logging
+
+import new_conda_env.processing as proc
+from new_conda_env import pipspec
+# ..........................................................................
+
+log = logging.getLogger(__name__)
+log.setLevel(logging.ERROR)
+
+sh = logging.StreamHandler()
+formatter = logging.Formatter('%(name)-15s: %(levelname)-8s %(message)s')
+sh.setFormatter(formatter)
+log.addHandler(sh)
+
+
+META_FIELDS = ("Name", "Requires-Dist")
+
+rx_extra_marker = re.compile(r"\bextra\s*==")
+
+jp = Path.joinpath
+
+
+def get_conda_names(prefix: Path) -> set:
+    """Return the normalized names of the conda packages of the env at
+    prefix, from the conda-meta record filenames (<name>-<version>-<build>).
+    """
+    return {proc.norm_dist_name(f.stem.rsplit("-", 2)[0])
+            for f in jp(Path(prefix), "conda-meta").glob("*.json")}
+
+
+def read_requires(dist_info: Path) -> tuple:
+    """Return (name, requires): the normalized name of the distribution &
+    the set of the normalized names it requires unconditionally of extras.
+    """
+    meta = proc.read_dist_metadata(dist_info, META_FIELDS)
+    name = meta.get("Name", [""])[0]
+    if not name:
+        name = dist_info.name[:-len(".dist-info")].partition("-")[0]
+    requires = set()
+    for req in pipspec.parse_requirements(meta.get("Requires-Dist", [])):
+        if req["name"] and not rx_extra_marker.search(req["marker"]):
+            requires.add(proc.norm_dist_name(req["name"]))
+
+    return proc.norm_dist_name(name), requires
+
+
+def build_graph(prefix: Path, get_owned=None) -> tuple:
+    """Return (pips, required): the names of the pip-installed distributions
+    of the env at prefix & {name: requirers} over all its distributions
+    (conda-owned ones included).
+    get_owned: as in processing.iter_pip_distinfos.
+    Raise FileNotFoundError if the env has no site-packages dir.
+    """
+    pip_infos = {d.name for d in proc.iter_pip_distinfos(prefix, get_owned)}
+    pips, required = set(), {}
+    for sp in proc.get_site_packages(prefix):
+        for dist_info in sp.glob("*.dist-info"):
+            name, requires = read_requires(dist_info)
+            if dist_info.name in pip_infos:
+                pips.add(name)
+            for r in requires - {name}:
+                required.setdefault(r, set()).add(name)
+
+    return pips, required
+
+
+def get_pip_roots(prefix: Path, get_owned=None) -> set:
+    """Return the names of the root pip distributions of the env at prefix
+    (see module doc). Of a cycle of pip distributions required by no other
+    one, the first by name is kept as root.
+    Raise FileNotFoundError if the env has no site-packages dir.
+    """
+    pips, required = build_graph(prefix, get_owned)
+    roots = {p for p in pips if not required.get(p)}
+    # pip dists only required within a cycle: not reachable from a root or
+    # from a non-pip (conda-owned) requirer
+    requires = {}
+    for r, by in required.items():
+        for b in by:
+            requires.setdefault(b, set()).add(r)
+    seen = set()
+
+    def visit(starts):
+        stack = [s for s in starts if s not in seen]
+        seen.update(stack)
+        while stack:
+            for r in requires.get(stack.pop(), ()):
+                if r not in seen:
+                    seen.add(r)
+                    stack.append(r)
+
+    visit(roots | (set(requires) - pips))
+    for p in sorted(pips - seen):
+        if p not in seen:
+            roots.add(p)
+            visit([p])
+
+    conda_names = get_conda_names(prefix)
+    log.debug(f"{len(pips)} pip dists: {len(roots)} roots, "
+              f"{len(roots & conda_names)} provided by conda.")
+    return roots - conda_names
+
+
+def prune_pip_deps(pip_deps: dict, prefix: Path, get_owned=None):
+    """Return the {"pip": [...]} mapping with the root pip distributions of
+    the env at prefix only (None if none is left); entries without a name
+    (e.g. urls) are kept. Return pip_deps as is if the env has no
+    site-packages dir.
+    """
+    if not pip_deps:
+        return pip_deps
+    try:
+        roots = get_pip_roots(prefix, get_owned)
+    except FileNotFoundError as err:
+        log.debug(f"{err} Pip deps not pruned.")
+        return pip_deps
+    kept = []
+    for line in pip_deps["pip"]:
+        name = pipspec.parse_requirement(str(line))["name"]
+        if name is None or proc.norm_dist_name(name) in roots:
+            kept.append(line)
+
+    return dict(pip=kept) if kept else None
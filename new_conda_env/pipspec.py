@@ -0,0 +1,127 @@
+# pipspec.py
+__doc__ = """Pip requirements normalizer (PEP 508 & pip's requirement lines).
+The entries of a pip dependencies list are parsed into records
+(name, extras, specifier, marker, url, editable) with module-level compiled
+patterns, then formatted according to a version policy:
+- 'strip': no version specifier (the default of new_conda_env)
+- 'keep': the specifiers as found
+- 'major': exact pins (==, ===, ~=) relaxed to their major version (==1.*)
+Direct references (name @ url), urls & editable installs keep their url:
+the policy does not apply to them.
+"""
+import re
+import logging
+# ..........................................................................
+
+log = logging.getLogger(__name__)
+log.setLevel(logging.ERROR)
+
+sh = logging.StreamHandler()
+formatter = logging.Formatter('%(name)-15s: %(levelname)-8s %(message)s')
+sh.setFormatter(formatter)
+log.addHandler(sh)
+
+
+PIP_POLICIES = ("strip", "keep", "major")
+
+rx_named = re.compile(r"""
+    ^\s*(?P<name>[A-Za-z0-9](?:[A-Za-z0-9._-]*[A-Za-z0-9])?)
+    \s*(?:\[(?P<extras>[^\]]*)\])?
+    \s*(?:@\s*(?P<url>[^\s;]+)\s*        # direct reference
+         |\(?(?P<spec>[^;()@]*?)\)?)     # version specifiers
+    \s*(?:;\s*(?P<marker>.*?))?\s*$
+    """, re.X)
+rx_editable = re.compile(r"^\s*(?:-e|--editable)(?:\s+|=)(?P<url>\S+)\s*$")
+rx_url = re.compile(r"^\s*(?P<url>(?:[A-Za-z][A-Za-z0-9+.-]*://|\.{0,2}/|[A-Za-z]:[\\/])\S*)"
+                    r"\s*(?:;\s*(?P<marker>.*?))?\s*$")
+rx_egg = re.compile(r"[#&]egg=([A-Za-z0-9._-]+)")
+rx_archive_name = re.compile(r"/([A-Za-z0-9_.]+?)-\d[^/]*\.(?:whl|tar\.gz|zip)$")
+rx_clause = re.compile(r"^\s*(===|==|~=|!=|<=|>=|<|>)\s*(\S+?)\s*$")
+rx_major = re.compile(r"^((?:\d+!)?\d+)")
+rx_space = re.compile(r"\s+")
+
+
+def _url_name(url: str) -> str:
+    m = rx_egg.search(url) or rx_archive_name.search(url)
+    return m.group(1) if m is not None else None
+
+
+def parse_requirement(line: str) -> dict:
+    """Return the record of a pip requirement line:
+    {"name", "extras" (list), "specifier", "marker", "url", "editable", "raw"};
+    name is None if it is unknown (e.g. url without #egg=), and all fields
+    but raw are empty if the line is not understood (kept verbatim).
+    """
+    req = {"name": None, "extras": [], "specifier": "", "marker": "",
+           "url": "", "editable": False, "raw": line.strip()}
+    m = rx_editable.match(line)
+    if m is not None:
+        req.update(url=m.group("url"), editable=True, name=_url_name(m.group("url")))
+        return req
+    m = rx_url.match(line)
+    if m is not None:
+        req.update(url=m.group("url"), marker=m.group("marker") or "",
+                   name=_url_name(m.group("url")))
+        return req
+    m = rx_named.match(line)
+    if m is None:
+        log.debug(f"Unparsed pip requirement (kept): {line!r}")
+        return req
+    extras = m.group("extras")
+    req.update(name=m.group("name"),
+               extras=[e.strip() for e in extras.split(",") if e.strip()] if extras else [],
+               specifier=rx_space.sub("", m.group("spec") or ""),
+               marker=m.group("marker") or "",
+               url=m.group("url") or "")
+    return req
+
+
+def parse_requirements(lines) -> list:
+    """Return the records of the pip requirement lines (blank lines &
+    comments skipped), in one pass.
+    """
+    return [parse_requirement(line) for line in map(str, lines)
+            if line.strip() and not line.lstrip().startswith("#")]
+
+
+def relax_specifier(specifier: str, policy: str="strip") -> str:
+    """Return the version specifier under policy (see module doc)."""
+    if policy not in PIP_POLICIES:
+        raise ValueError(f"pip version policy: one of {PIP_POLICIES}")
+    if policy == "strip" or not specifier:
+        return ""
+    if policy == "keep":
+        return specifier
+    for clause in specifier.split(","):
+        m = rx_clause.match(clause)
+        if m is None or m.group(1) not in ("==", "===", "~=") or "*" in m.group(2):
+            continue
+        major = rx_major.match(m.group(2))
+        if major is not None:
+            return f"=={major.group(1)}.*"
+    return specifier
+
+
+def format_requirement(req: dict, policy: str="strip") -> str:
+    """Return the requirement line of the record under policy."""
+    if req["editable"]:
+        return f"-e {req['url']}"
+    if req["name"] is None and not req["url"]:
+        return req["raw"]
+    bare_url = bool(req["url"]) and req["raw"].startswith(req["url"])
+    if req["name"] is None or bare_url:
+        line = req["url"]
+    else:
+        line = req["name"]
+        if req["extras"]:
+            line += f"[{','.join(req['extras'])}]"
+        line += f" @ {req['url']}" if req["url"] else relax_specifier(req["specifier"], policy)
+    if req["marker"]:
+        # a url needs a space before ';'
+        line += f" ; {req['marker']}" if req["url"] else f"; {req['marker']}"
+    return line
+
+
+def normalize_requirements(lines, policy: str="strip") -> list:
+    """Return the pip requirement lines normalized under policy."""
+    return [format_requirement(req, policy) for req in parse_requirements(lines)]
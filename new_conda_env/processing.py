@@ -1,13 +1,22 @@
 # processing.py
 
+import os
 import sys
+import shlex
+import signal
+import threading
 from pathlib import Path
 import re
+from ast import literal_eval
 from functools import partial
+from concurrent.futures import ThreadPoolExecutor, wait
 import subprocess
 import logging
 
-from conda.common.serialize import yaml_round_trip_load, yaml_round_trip_dump
+from new_conda_env import pipspec
+
+# conda (& ruamel) imports are deferred to the functions using them: they
+# are the bulk of the startup time (e.g. `new-conda-env --help`).
 # ..........................................................................
 
 log = logging.getLogger(__name__)
@@ -21,6 +30,8 @@ log.addHandler(sh)
 
 winOS = sys.platform == "win32"
 
+jp = Path.joinpath
+
 
 def path2str0(p: Path, win_os: bool=True):
     s = str(p) if win_os else p.as_posix()
@@ -29,48 +40,273 @@ def path2str0(p: Path, win_os: bool=True):
 path2str = partial(path2str0, win_os=winOS)
 
 
-def run_export(args: str, timout: int=60):
-
-    proc = subprocess.run(args, capture_output=True, text=True)
-    try:   
-        proc.check_returncode()
-        
-        if proc.returncode == 0:
-            outs = proc.stdout
-            
-            if not outs:
-                msg = "No output. If this is a surprise, "
-                msg = msg + "perhaps the command redirected results "
-                msg = msg + "to a file?\n"
-                msg = msg + "The `run` command used these args= {}".format(*args)
-                log.debug(msg)
-                print(msg)
-
-    except subprocess.TimeoutExpired:
-        proc.kill()
+def _split_cmd(args):
+    """Popen needs a list on POSIX (no shell is used)."""
+    if isinstance(args, str) and not winOS:
+        return shlex.split(args)
+    return args
+
+
+def kill_process_group(proc: subprocess.Popen) -> None:
+    """Kill proc & its children (e.g. the python process behind the
+    conda launcher).
+    """
+    try:
+        if winOS:
+            subprocess.run(["taskkill", "/F", "/T", "/PID", str(proc.pid)],
+                           capture_output=True)
+        else:
+            os.killpg(proc.pid, signal.SIGKILL)
+    except OSError:
+        pass
+    proc.kill()
+
+
+def stream_export(args, timeout: float=60, parse=None):
+    """Run the export command & return parse(stdout), where parse consumes
+    the stdout stream while it is produced (memory is bounded by the parser,
+    not by the size of the export). parse defaults to reading the whole text.
+    The command runs in its own process group, which is killed if it has
+    not completed within timeout seconds; stderr is drained by a thread so
+    that neither pipe can deadlock.
+    Raise subprocess.TimeoutExpired or subprocess.CalledProcessError (with
+    the captured stderr) on failure.
+    """
+    parse = parse or (lambda stream: stream.read())
+    group = {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP} if winOS \
+        else {"start_new_session": True}
+    proc = subprocess.Popen(_split_cmd(args),
+                            stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE,
+                            text=True, **group)
+    errs = []
+    t_err = threading.Thread(target=lambda: errs.append(proc.stderr.read()),
+                             daemon=True)
+    t_err.start()
+    expired = threading.Event()
+    def on_deadline():
+        expired.set()
+        kill_process_group(proc)
+    timer = threading.Timer(timeout, on_deadline)
+    timer.daemon = True
+    timer.start()
+
+    try:
+        outs = parse(proc.stdout)
+    except Exception:
+        if not expired.is_set():
+            log.debug(f"Parsing of `{args}` output failed.")
+            kill_process_group(proc)
+            raise
+        outs = None
+    finally:
+        proc.wait()
+        timer.cancel()
+        t_err.join()
+        proc.stdout.close()
+        proc.stderr.close()
+
+    errs = "".join(errs)
+    if expired.is_set():
         log.debug("The `run` command timed out!")
-        
-    except Exception as err:
-        errs = proc.stderr
-        log.debug(f"Unexpected err {errs}, {type(err)}")
-        raise
-        
+        raise subprocess.TimeoutExpired(args, timeout, stderr=errs)
+    if proc.returncode != 0:
+        log.debug(f"Unexpected err {errs}")
+        raise subprocess.CalledProcessError(proc.returncode, args, stderr=errs)
+
+    if not outs:
+        msg = "No output. If this is a surprise, "
+        msg = msg + "perhaps the command redirected results "
+        msg = msg + "to a file?\n"
+        msg = msg + f"The `run` command used these args= {args}"
+        log.debug(msg)
+        print(msg)
+
     return outs
 
 
+def run_export(args, timeout: float=60) -> str:
+    """Return the stdout text of the export command (see stream_export)."""
+    return stream_export(args, timeout=timeout)
+
+
+class ExportError(Exception):
+    """Raised by run_exports when some export commands failed.
+    The errors attribute maps each failed command to its exception
+    (subprocess.TimeoutExpired for those that timed out).
+    """
+    def __init__(self, errors: dict):
+        self.errors = errors
+        msg = "Failed export(s):\n"
+        msg = msg + "\n".join(f"\t{cmd}: {type(err).__name__}: {err}"
+                              for cmd, err in errors.items())
+        super().__init__(msg)
+
+
+def run_exports(cmds: list, timeout: float=60, runner=None) -> dict:
+    """Run the export commands concurrently (one thread each), parse their
+    streams as they are produced & return {cmd: parsed yml}.
+    runner(cmd) -> parsed yml defaults to stream_export with load_as_yml,
+    which kills a command after timeout seconds.
+    Raise ExportError listing each command that failed or timed out.
+    """
+    run_and_load = runner or partial(stream_export, timeout=timeout,
+                                     parse=load_as_yml)
+
+    pool = ThreadPoolExecutor(max_workers=max(len(cmds), 1))
+    futures = {cmd: pool.submit(run_and_load, cmd) for cmd in cmds}
+    # the runners enforce the deadline; this is a safety net:
+    wait(futures.values(), timeout=timeout + 5)
+    # don't block on hung commands:
+    pool.shutdown(wait=False, cancel_futures=True)
+
+    ymls, errors = {}, {}
+    for cmd, fut in futures.items():
+        if not fut.done():
+            errors[cmd] = subprocess.TimeoutExpired(cmd, timeout)
+        elif fut.exception() is not None:
+            errors[cmd] = fut.exception()
+        else:
+            ymls[cmd] = fut.result()
+    for cmd, err in errors.items():
+        log.error(f"Export failed: {cmd}: {err}")
+    if errors:
+        raise ExportError(errors)
+
+    return ymls
+
+
+def yaml_round_trip_load(*args, **kwargs):
+    from conda.common.serialize import yaml_round_trip_load as rt_load
+    return rt_load(*args, **kwargs)
+
+
+def yaml_round_trip_dump(*args, **kwargs):
+    from conda.common.serialize import yaml_round_trip_dump as rt_dump
+    return rt_dump(*args, **kwargs)
+
+
 def save_to_yml(yml_filepath, data):
     with open(yml_filepath, 'wb') as f:
         yaml_round_trip_dump(data, f)
     log.debug(f"File saved to yml: {path2str(yml_filepath)}\n")
 
 
-def load_as_yml(yml_stream):
-    data = yaml_round_trip_load(yml_stream)
+def load_as_yml(yml_stream, round_trip: bool=True):
+    """Parse a yaml text or stream.
+    If round_trip, return ruamel's round-trip objects (needed for the data
+    written by save_to_yml), else plain python objects from the fast
+    parse_export, which is meant for read-only data.
+    """
+    if round_trip:
+        return yaml_round_trip_load(yml_stream)
+    return parse_export(yml_stream)
+
+
+def yaml_safe_load(yml_stream):
+    """Plain python objects with ruamel's safe loader, which uses the C
+    extension when available.
+    """
+    try:
+        from ruamel.yaml import YAML
+    except ImportError:
+        from ruamel_yaml import YAML
+    return YAML(typ="safe").load(yml_stream)
+
+
+# fast parser of `conda env export` streams ..................................
+# top-level key or 'pip:' item: the colon must end the line or be followed
+# by a space ('conda-forge::numpy' is a scalar)
+rx_yml_key = re.compile(r"^([\w.-]+):(?:\s+(.*))?$")
+YML_SPECIAL = tuple("[{&*!|>%@`")
+
+
+class _NotExportLayout(Exception):
+    pass
+
+
+def _yml_scalar(val: str) -> str:
+    val = val.strip()
+    if val[:1] in ("'", '"'):
+        if len(val) < 2 or val[-1] != val[0] or "\\" in val:
+            raise _NotExportLayout(val)
+        return val[1:-1].replace("''", "'") if val[0] == "'" else val[1:-1]
+    if val.startswith(YML_SPECIAL) or " #" in val:
+        raise _NotExportLayout(val)
+    return val
+
+
+def _parse_export_lines(lines, data: dict) -> None:
+    """Fill data from the lines of a `conda env export` stream:
+    top-level scalars & lists of scalars, with one level of '- pip:' sublist.
+    Raise _NotExportLayout on any other yaml construct.
+    """
+    key = None
+    sub, sub_indent = None, -1
+    for line in lines:
+        stripped = line.strip()
+        if not stripped or stripped.startswith("#") or stripped == "---":
+            continue
+        indent = len(line) - len(line.lstrip())
+
+        if stripped[0] != "-" and indent == 0:
+            m = rx_yml_key.match(stripped)
+            if m is None:
+                raise _NotExportLayout(line)
+            key, val = m.groups()
+            data[key] = _yml_scalar(val) if val else []
+            sub = None
+            continue
+
+        if not stripped.startswith("- ") or key is None or not isinstance(data[key], list):
+            raise _NotExportLayout(line)
+        item = stripped[2:]
+        if sub is not None and indent > sub_indent:
+            sub.append(_yml_scalar(item))
+            continue
+        sub = None
+        m = rx_yml_key.match(item)
+        if m is not None:
+            if m.group(2):
+                raise _NotExportLayout(line)
+            sub, sub_indent = [], indent
+            data[key].append({m.group(1): sub})
+        else:
+            data[key].append(_yml_scalar(item))
+
+
+def parse_export(yml_stream) -> dict:
+    """Parse the output of `conda env export` (text or stream) into plain
+    python objects with a line parser for its fixed layout: no yaml object
+    model is built. Other yaml documents fall back to yaml_safe_load.
+    """
+    if isinstance(yml_stream, str):
+        yml_stream = yml_stream.splitlines(True)
+    lines = iter(yml_stream)
+    seen = []
+
+    data = {}
+    try:
+        _parse_export_lines(_tee(lines, seen), data)
+    except _NotExportLayout as err:
+        log.debug(f"Not an export layout ({err}): using the yaml loader.")
+        # lines: the part of the stream not read yet
+        return yaml_safe_load("".join(seen) + "".join(lines))
+
     return data
 
 
-def get_pip_deps(data, strip_ver=True):
+def _tee(lines, seen: list):
+    """Yield the lines & keep them (for the fallback parser)."""
+    for line in lines:
+        seen.append(line)
+        yield line
+
+
+def get_pip_deps(data, strip_ver=True, policy=None):
     """Retrieve pip dict from standard yml file.
+    policy: the pip version policy (see pipspec.PIP_POLICIES); default:
+    'strip' if strip_ver, else 'keep'.
     """
 
     pip_deps = None
@@ -78,11 +314,298 @@ def get_pip_deps(data, strip_ver=True):
         if isinstance(d, dict) and d.get("pip") is not None:
             pip_deps = d
             break
-    if not strip_ver or pip_deps is None:
+    policy = policy or ("strip" if strip_ver else "keep")
+    if policy == "keep" or pip_deps is None:
         return pip_deps
     
-    # else remove versions
-    regex = r"(?<=)==\d+(?:\.\d*){0,}"
-    cleaned = dict(pip=[re.sub(regex,"",p) for p in pip_deps["pip"]])
-        
-    return cleaned
+    return apply_pip_policy(pip_deps, policy)
+
+
+def apply_pip_policy(pip_deps, policy="strip"):
+    """Normalize the entries of a {"pip": [...]} mapping under the pip
+    version policy, in one pass (see pipspec).
+    """
+    return dict(pip=pipspec.normalize_requirements(pip_deps["pip"], policy))
+
+
+def strip_pip_versions(pip_deps):
+    """Remove the version specifiers from a {"pip": [...]} mapping."""
+    return apply_pip_policy(pip_deps, "strip")
+
+
+# pip distributions in site-packages .........................................
+# dist-info dirs named in a conda-meta record 'files' list are conda-owned
+rx_meta_distinfo = re.compile(r'([^/"\\]+\.dist-info)[/\\]')
+
+
+def get_site_packages(prefix: Path) -> list:
+    """Return the site-packages dir(s) of the env at prefix."""
+    if winOS:
+        sp = jp(prefix, "Lib", "site-packages")
+        return [sp] if sp.is_dir() else []
+    return sorted(jp(prefix, "lib").glob("python*/site-packages"))
+
+
+def get_conda_owned_distinfos(prefix: Path) -> set:
+    """Return the names of the .dist-info dirs listed in the 'files' of the
+    conda-meta records of the env at prefix.
+    The records are scanned as text: no json parsing is needed.
+    """
+    owned = set()
+    for rec in jp(prefix, "conda-meta").glob("*.json"):
+        owned.update(rx_meta_distinfo.findall(rec.read_text(encoding="utf-8")))
+    return owned
+
+
+def norm_dist_name(name: str) -> str:
+    """Normalize a distribution name as conda does for the pip records."""
+    return name.replace(".", "-").replace("_", "-").lower()
+
+
+def read_dist_metadata(dist_info: Path, fields: tuple=("Name", "Version")) -> dict:
+    """Return the values of the requested header fields of <dist_info>/METADATA
+    as {field: [values]}. Reading stops at the end of the headers.
+    """
+    out = {}
+    try:
+        f = open(jp(dist_info, "METADATA"), encoding="utf-8", errors="replace")
+    except OSError:
+        return out
+    with f:
+        for line in f:
+            if not line.strip():
+                break
+            key, _, val = line.partition(":")
+            if key in fields:
+                out.setdefault(key, []).append(val.strip())
+    return out
+
+
+def iter_pip_distinfos(prefix: Path, get_owned=None):
+    """Yield the .dist-info dirs of the env at prefix that were not
+    installed by conda, i.e. whose INSTALLER is not 'conda' and which are
+    not listed in the conda-meta records.
+    get_owned: callable returning the conda-owned .dist-info names, to
+    reuse a scan of the records (default: get_conda_owned_distinfos).
+    Raise FileNotFoundError if the env has no site-packages dir.
+    """
+    site_dirs = get_site_packages(prefix)
+    if not site_dirs:
+        raise FileNotFoundError(f"No site-packages dir in {prefix}.")
+
+    owned = None
+    for sp in site_dirs:
+        for dist_info in sp.glob("*.dist-info"):
+            try:
+                installer = jp(dist_info, "INSTALLER").read_text().strip()
+            except OSError:
+                installer = ""
+            if installer == "conda":
+                continue
+            if owned is None:
+                # only loaded when a candidate is found
+                owned = get_owned() if get_owned else get_conda_owned_distinfos(prefix)
+            if dist_info.name in owned:
+                continue
+            yield dist_info
+
+
+def get_site_pip_deps(prefix: Path, strip_ver: bool=True, policy: str=None,
+                      get_owned=None):
+    """Return the pip dependencies of the env at prefix as the {"pip": [...]}
+    mapping found in a `conda env export` stream, but without the subprocess:
+    the pip-installed .dist-info dirs of site-packages are read directly.
+    Return None if there are no pip dependencies.
+    policy: as in get_pip_deps; get_owned: as in iter_pip_distinfos.
+    Raise FileNotFoundError if the env has no site-packages dir.
+    """
+    pips = []
+    for dist_info in iter_pip_distinfos(prefix, get_owned):
+        meta = read_dist_metadata(dist_info)
+        name, ver = meta.get("Name", [""])[0], meta.get("Version", [""])[0]
+        if not name or not ver:
+            # fallback on the dir name: <name>-<version>.dist-info
+            name, _, ver = dist_info.name[:-len(".dist-info")].partition("-")
+        pips.append(f"{norm_dist_name(name)}=={ver}")
+
+    if not pips:
+        return None
+    pip_deps = dict(pip=sorted(pips))
+    policy = policy or ("strip" if strip_ver else "keep")
+    if policy == "keep":
+        return pip_deps
+
+    return apply_pip_policy(pip_deps, policy)
+
+
+# conda-meta/history ........................................................
+# A request starts with a '==> <date> <==' header, followed by its comment
+# lines ('# cmd: ...', '# update specs: [...]') and its +/- dists lines.
+rx_hist_head = re.compile(r"^==>\s*(.+?)\s*<==$")
+rx_hist_cmd = re.compile(r"^#\s*cmd:\s*(.+)")
+rx_hist_specs = re.compile(r"^#\s*(\w+)\s*specs:\s*(.+)?")
+# name of a match spec: optional 'channel::' then up to the 1st version char
+rx_spec_name = re.compile(r"^(?:.*::)?\s*([^\s=<>!~\[\(,]+)")
+
+SPEC_ACTIONS = {"update": "update_specs", "install": "update_specs",
+                "create": "update_specs", "remove": "remove_specs",
+                "uninstall": "remove_specs", "neutered": "neutered_specs"}
+
+
+def spec_name(spec: str) -> str:
+    """Return the package name of a conda match spec, e.g.:
+    'conda-forge::numpy>=1.20' -> 'numpy'.
+    """
+    m = rx_spec_name.match(spec)
+    return m.group(1) if m is not None else spec
+
+
+PY_DEPS = ("setuptools", "wheel")
+
+
+def merge_deps(deps: list, kernel: str, new_ver: str, add_py_deps: bool=True,
+               pip_deps: dict=None) -> list:
+    """Return the dependencies list of the new env, built in one pass over
+    deps with a name-keyed (insertion-ordered) mapping:
+    - the new kernel spec comes first, then pip;
+    - every spec of the kernel is replaced, whatever its form (python=3.10,
+      python>=3.10, python=3.10.4, conda-forge::python);
+    - specs are de-duplicated by name (first one kept);
+    - setuptools & wheel are added if add_py_deps & missing;
+    - the pip dependencies (from deps & pip_deps) come last, de-duplicated
+      by normalized project name (by line if it has none, e.g. a url).
+    """
+    merged = {kernel: f"{kernel}={new_ver}", "pip": "pip"}
+    pips = {}
+    for dep in list(deps) + [pip_deps or {}]:
+        if isinstance(dep, dict):
+            for p in dep.get("pip") or ():
+                req = pipspec.parse_requirement(str(p))
+                pips.setdefault(norm_dist_name(req["name"]) if req["name"] else req["raw"], p)
+            continue
+        name = spec_name(dep)
+        if name not in merged:
+            merged[name] = dep
+    if add_py_deps:
+        for name in PY_DEPS:
+            merged.setdefault(name, name)
+
+    out = list(merged.values())
+    if pips:
+        out.append({"pip": list(pips.values())})
+
+    return out
+
+
+def get_installed_names(prefix: Path) -> set:
+    """Return the names of the packages recorded in <prefix>/conda-meta.
+    The names are read from the record filenames (<name>-<ver>-<build>.json),
+    so no json parsing is needed.
+    """
+    meta = jp(prefix, "conda-meta")
+    return {f.name.rsplit("-", 2)[0] for f in meta.glob("*.json")}
+
+
+def get_installed_version(prefix: Path, name: str="python", minor: bool=True) -> str:
+    """Return the version of the package installed in the env at prefix
+    (as <major.minor> if minor), or "" if it is not installed.
+    """
+    for rec in jp(prefix, "conda-meta").glob(f"{name}-*.json"):
+        rec_name, ver, _ = rec.stem.rsplit("-", 2)
+        if rec_name == name:
+            return ".".join(ver.split(".")[:2]) if minor else ver
+    return ""
+
+
+def _parse_old_format_specs(specs_str: str) -> list:
+    """Split a conda<4.5 specs string, e.g.
+    "python>=3.5.1,jupyter >=1.0.0,<2.0" -> ["python>=3.5.1", "jupyter >=1.0.0,<2.0"]
+    """
+    specs = []
+    for spec in specs_str.split(","):
+        if spec[:1] in "=<>!~" and specs:
+            specs[-1] = ",".join([specs[-1], spec])
+        else:
+            specs.append(spec)
+    return specs
+
+
+def _parse_hist_comment(line: str, request: dict) -> None:
+    """Update the request dict with the data in a history comment line."""
+    m = rx_hist_cmd.match(line)
+    if m is not None:
+        request["cmd"] = m.group(1)
+        return
+
+    m = rx_hist_specs.match(line)
+    if m is None:
+        return
+    action, specs_str = m.groups()
+    key = SPEC_ACTIONS.get(action)
+    specs_str = (specs_str or "").strip()
+    if key is None or not specs_str:
+        return
+    if specs_str.startswith("["):
+        specs = literal_eval(specs_str)
+    elif "[" not in specs_str:
+        specs = _parse_old_format_specs(specs_str)
+    else:
+        return
+    specs = [s.strip() for s in specs if s and not s.endswith("@")]
+    if specs:
+        request[key] = specs
+
+
+def _replay_request(request: dict, specs_map: dict) -> None:
+    """Apply a user request to specs_map (name: spec) in conda's order:
+    removals first, then updates, then neutered specs.
+    """
+    if "cmd" not in request:
+        return
+    for spec in request.get("remove_specs", ()):
+        specs_map.pop(spec_name(spec), None)
+    for key in ("update_specs", "neutered_specs"):
+        for spec in request.get(key, ()):
+            specs_map[spec_name(spec)] = spec
+
+
+def canonical_spec(spec: str) -> str:
+    """Return the spec as formatted by `conda env export`: with
+    MatchSpec.conda_env_form (conda>=25.7, e.g. 'conda=25.7.0' for
+    'conda==25.7.0'), else str(MatchSpec).
+    """
+    from conda.models.match_spec import MatchSpec
+    ms = MatchSpec(spec)
+    env_form = getattr(ms, "conda_env_form", None)
+    return env_form() if env_form is not None else str(ms)
+
+
+def get_history_specs(prefix: Path, canonical: bool=True) -> list:
+    """Return the user-requested specs of the env at prefix by replaying
+    the records of <prefix>/conda-meta/history, i.e. the 'dependencies'
+    list of `conda env export --from-history`, without the subprocess.
+    Specs of packages that are no longer installed are dropped (as conda does).
+    If canonical, the specs are formatted by conda's MatchSpec, as in the export.
+    Raise FileNotFoundError if the history file is missing.
+    """
+    hist = jp(prefix, "conda-meta", "history")
+    specs_map = {}
+    request = {}
+    with open(hist, encoding="utf-8", errors="replace") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if rx_hist_head.match(line):
+                _replay_request(request, specs_map)
+                request = {}
+            elif line.startswith("#"):
+                _parse_hist_comment(line, request)
+    _replay_request(request, specs_map)
+
+    installed = get_installed_names(prefix)
+    specs = [s for n, s in specs_map.items() if n in installed]
+    if canonical:
+        specs = [canonical_spec(s) for s in specs]
+
+    return specs
@@ -0,0 +1,67 @@
+# profiling.py
+__doc__ = """Structured per-stage timings of a CondaEnvir run.
+When disabled, Timings.stage returns a shared no-op context manager, so the
+instrumentation can stay in place at near-zero cost.
+"""
+import time
+import json
+from contextlib import nullcontext
+# ..........................................................................
+
+_NO_OP = nullcontext()
+
+
+class _Stage:
+    __slots__ = ("timings", "name", "t0")
+
+    def __init__(self, timings, name: str):
+        self.timings = timings
+        self.name = name
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.timings.add(self.name, time.perf_counter() - self.t0)
+        return False
+
+
+class Timings:
+    """Recorder of named stage durations, in call order.
+    Call: Timings(enabled: bool=False)
+    Usage:
+        with timings.stage("save"):
+            ...
+    Nested stages are recorded with a dotted name, e.g. "export_data.history".
+    """
+    def __init__(self, enabled: bool=False):
+        self.enabled = enabled
+        self.records = []
+        self._stack = []
+
+
+    def stage(self, name: str):
+        if not self.enabled:
+            return _NO_OP
+        self._stack.append(name)
+        return _Stage(self, ".".join(self._stack))
+
+
+    def add(self, name: str, seconds: float) -> None:
+        self._stack.pop()
+        self.records.append({"stage": name, "seconds": seconds})
+
+
+    def report(self, **info) -> dict:
+        """Return the timings as a json-serializable dict; info items
+        (e.g. env=...) are added at the top level.
+        """
+        top = [r["seconds"] for r in self.records if "." not in r["stage"]]
+        out = dict(info)
+        out.update(total=sum(top), stages=list(self.records))
+        return out
+
+
+    def to_json(self, **info) -> str:
+        return json.dumps(self.report(**info), indent=2)
@@ -0,0 +1,233 @@
+# provenance.py
+__doc__ = """Provenance header of the lean yml files & incremental update.
+The first line of a lean yml file records what it was generated from:
+tool version, source env & its fingerprint, old & new kernel versions.
+On a rerun with an identical header, the file is left as is; otherwise only
+the dependency lines that changed since the last generation are patched, so
+the user's edits to the other lines survive.
+The generated dependencies (the base of the next patch) are kept in a hidden
+sidecar json file next to the yml file, with the header they were generated
+under: a sidecar of another header (e.g. the yml file was replaced) is not
+used.
+"""
+import re
+import json
+from pathlib import Path
+import logging
+
+import new_conda_env.processing as proc
+# ..........................................................................
+
+log = logging.getLogger(__name__)
+log.setLevel(logging.ERROR)
+
+sh = logging.StreamHandler()
+formatter = logging.Formatter('%(name)-15s: %(levelname)-8s %(message)s')
+sh.setFormatter(formatter)
+log.addHandler(sh)
+
+
+headerf = "# new_conda_env {version}: {env} ({old_ver} -> {new_ver}), fingerprint {fingerprint}"
+rx_header = re.compile(r"^# new_conda_env (?P<version>\S+): (?P<env>\S+) "
+                       r"\((?P<old_ver>\S+) -> (?P<new_ver>\S+)\), "
+                       r"fingerprint (?P<fingerprint>[0-9a-f]+)\s*$")
+# sequence item: '  - numpy  # comment'
+rx_item = re.compile(r"^(?P<indent>\s*)-\s+(?P<spec>.*?)(?P<comment>\s+#.*)?$")
+rx_pip_name = re.compile(r"^\s*([A-Za-z0-9][A-Za-z0-9._-]*)")
+YML_INDICATORS = "!&*{}[],#|>@`\"'%"
+
+
+def format_header(version: str, env: str, old_ver: str, new_ver: str,
+                  fingerprint: str) -> str:
+    return headerf.format(version=version, env=env, old_ver=old_ver,
+                          new_ver=new_ver, fingerprint=fingerprint)
+
+
+def read_header(yml_file: Path) -> str:
+    """Return the provenance header of yml_file or None (no file or no
+    header): only the first line is read.
+    """
+    try:
+        with open(yml_file, encoding="utf-8") as f:
+            line = f.readline().rstrip("\n")
+    except OSError:
+        return None
+    return line if rx_header.match(line) else None
+
+
+def sidecar_path(yml_file: Path) -> Path:
+    """Return the path of the sidecar file of yml_file: .<name>.base.json."""
+    yml_file = Path(yml_file)
+    return yml_file.with_name(f".{yml_file.name}.base.json")
+
+
+def write_sidecar(yml_file: Path, header: str, dependencies: list, **info) -> Path:
+    """Save the generation record of yml_file in its sidecar file: the
+    header, the generated dependencies & the info items (json values).
+    """
+    path = sidecar_path(yml_file)
+    record = dict(info, header=header, dependencies=dependencies)
+    path.write_text(json.dumps(record), encoding="utf-8")
+    return path
+
+
+def read_sidecar(yml_file: Path) -> dict:
+    """Return the generation record of yml_file (see write_sidecar), or None
+    if there is none or if it is not that of the current file (header).
+    """
+    header = read_header(yml_file)
+    if header is None:
+        return None
+    try:
+        record = json.loads(sidecar_path(yml_file).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    if not isinstance(record, dict) or record.get("header") != header:
+        log.debug(f"Sidecar of another generation (not used): {yml_file}")
+        return None
+    return record
+
+
+def split_deps(deps: list) -> tuple:
+    """Return the (conda specs, pip specs) lists of a dependencies list."""
+    conda, pip = [], []
+    for d in deps:
+        if isinstance(d, dict):
+            pip.extend(str(s) for s in d.get("pip") or [])
+        else:
+            conda.append(str(d))
+    return conda, pip
+
+
+def pip_name(spec: str) -> str:
+    m = rx_pip_name.match(spec)
+    return proc.norm_dist_name(m.group(1)) if m is not None else spec
+
+
+def _scalar(spec: str) -> str:
+    """Quote spec (json string = yaml double-quoted) if not a plain scalar."""
+    if (not spec or spec[0] in YML_INDICATORS or spec.endswith(":")
+        or ": " in spec or " #" in spec):
+        return json.dumps(spec)
+    return spec
+
+
+def _unquote(spec: str) -> str:
+    if len(spec) > 1 and spec[0] == spec[-1] and spec[0] in "'\"":
+        return spec[1:-1]
+    return spec
+
+
+def _parse_deps_block(lines: list):
+    """Return (start, end, entries) for the 'dependencies:' block of the
+    yml lines, with entries: [kind, key, spec, line] where kind is 'conda',
+    'pipkey', 'pip' or 'other' (kept verbatim); or None if not found.
+    """
+    try:
+        start = next(i for i, line in enumerate(lines)
+                     if line.rstrip() == "dependencies:") + 1
+    except StopIteration:
+        return None
+    end = start
+    while end < len(lines):
+        line = lines[end]
+        if line.strip() and not line[0].isspace() and line[0] not in "#-":
+            break
+        end += 1
+
+    entries = []
+    top = None   # indent of the conda items
+    for line in lines[start:end]:
+        m = rx_item.match(line)
+        if m is None:
+            entries.append(["other", None, None, line])
+            continue
+        indent = len(m.group("indent"))
+        spec = _unquote(m.group("spec"))
+        if top is None:
+            top = indent
+        if indent > top:
+            entries.append(["pip", pip_name(spec), spec, line])
+        elif spec == "pip:":
+            entries.append(["pipkey", None, spec, line])
+        else:
+            entries.append(["conda", proc.spec_name(spec), spec, line])
+
+    return start, end, entries
+
+
+def _item_line(like: str, spec: str, default_indent: str, comment: bool=False) -> str:
+    """Return the item line of spec, indented as the line like; its
+    comment is kept if comment.
+    """
+    m = rx_item.match(like) if like else None
+    indent = m.group("indent") if m is not None else default_indent
+    tail = (m.group("comment") or "") if m is not None and comment else ""
+    return f"{indent}- {_scalar(spec)}{tail}"
+
+
+def _patch_kind(entries: list, kind: str, base: list, new: list) -> list:
+    """Apply the base -> new changes of one kind of specs to entries:
+    lines of removed or updated specs are only changed if the user did not
+    edit them; new specs are returned (to be inserted).
+    """
+    keyf = proc.spec_name if kind == "conda" else pip_name
+    b = {keyf(s): s for s in base}
+    n = {keyf(s): s for s in new}
+    present = set()
+    for e in entries:
+        if e[0] != kind:
+            continue
+        key, spec = e[1], e[2]
+        present.add(key)
+        if key not in b or spec != b[key]:
+            continue   # not generated or edited by the user: kept
+        if key not in n:
+            e[0] = "drop"
+        elif n[key] != spec:
+            e[2] = n[key]
+            e[3] = _item_line(e[3], n[key], "", comment=True)
+
+    return [s for k, s in n.items() if k not in b and k not in present]
+
+
+def patch_deps(lines: list, base: list, new: list) -> list:
+    """Return the yml lines with the 'dependencies' block updated from the
+    base dependencies (those generated last time) to the new ones, or None
+    if the block is not found.
+    """
+    parsed = _parse_deps_block(lines)
+    if parsed is None:
+        return None
+    start, end, entries = parsed
+    (base_conda, base_pip), (new_conda, new_pip) = split_deps(base), split_deps(new)
+
+    add_conda = _patch_kind(entries, "conda", base_conda, new_conda)
+    add_pip = _patch_kind(entries, "pip", base_pip, new_pip)
+    entries = [e for e in entries if e[0] != "drop"]
+
+    def last(*kinds):
+        idx = [i for i, e in enumerate(entries) if e[0] in kinds]
+        return idx[-1] if idx else None
+
+    top = next((rx_item.match(e[3]).group("indent") for e in entries
+                if e[0] in ("conda", "pipkey")), "  ")
+    if add_conda:
+        i = last("conda")
+        like = entries[i][3] if i is not None else ""
+        pos = i + 1 if i is not None else 0
+        entries[pos:pos] = [["conda", None, s, _item_line(like, s, top)]
+                            for s in add_conda]
+    if add_pip:
+        i = last("pip", "pipkey")
+        if i is None:
+            entries.append(["pipkey", None, "pip:", f"{top}- pip:"])
+            i = len(entries) - 1
+        like = entries[i][3] if entries[i][0] == "pip" else ""
+        entries[i + 1:i + 1] = [["pip", None, s, _item_line(like, s, top + "    ")]
+                                for s in add_pip]
+    if last("pip") is None:
+        # an empty 'pip:' item is invalid
+        entries = [e for e in entries if e[0] != "pipkey"]
+
+    return lines[:start] + [e[3] for e in entries] + lines[end:]
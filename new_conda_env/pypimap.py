@@ -0,0 +1,160 @@
+# pypimap.py
+__doc__ = """PyPI -> conda name mapping, to move the pip dependencies that
+have a conda package for the new kernel version onto the conda dependencies.
+The lookup index (normalized name -> conda name & python minors) is built in
+one pass over the repodata index (see repodata.RepodataIndex: the parsed
+repodata are cached on disk) for the channels of the new env, & kept for the
+process until their indexed repodata change.
+Bundled aliases cover the projects packaged under another name on conda
+(e.g. torch -> pytorch), or whose PyPI name is another conda package (e.g.
+graphviz: the python bindings are python-graphviz).
+"""
+import threading
+import logging
+
+import new_conda_env.processing as proc
+from new_conda_env import pipspec, repodata
+# ..........................................................................
+
+log = logging.getLogger(__name__)
+log.setLevel(logging.ERROR)
+
+sh = logging.StreamHandler()
+formatter = logging.Formatter('%(name)-15s: %(levelname)-8s %(message)s')
+sh.setFormatter(formatter)
+log.addHandler(sh)
+
+
+# normalized PyPI name -> conda name (conda-forge & defaults)
+ALIASES = {
+    "blosc": "python-blosc",
+    "build": "python-build",
+    "docker": "docker-py",
+    "duckdb": "python-duckdb",
+    "flatbuffers": "python-flatbuffers",
+    "graphviz": "python-graphviz",
+    "igraph": "python-igraph",
+    "kaleido": "python-kaleido",
+    "libarchive-c": "python-libarchive-c",
+    "lmdb": "python-lmdb",
+    "msgpack": "msgpack-python",
+    "opencv-python": "py-opencv",
+    "opencv-python-headless": "py-opencv",
+    "psycopg2-binary": "psycopg2",
+    "pyqt5": "pyqt",
+    "tables": "pytables",
+    "torch": "pytorch",
+    "tzdata": "python-tzdata",
+    "xxhash": "python-xxhash",
+}
+# pip specifiers without conda equivalent: such entries stay on pip
+PIP_ONLY_OPS = ("~=", "===")
+
+
+class CondaNameMap:
+    """Lookup of the conda package of a PyPI project.
+    Call: CondaNameMap(rows, aliases: dict=None)
+    Arguments:
+    - rows (iterable): the (conda name, pymin) pairs of the repodata index
+    - aliases (dict, None): {normalized PyPI name: conda name}; default:
+      ALIASES
+    """
+    def __init__(self, rows, aliases: dict=None):
+        self.aliases = dict(ALIASES if aliases is None else aliases)
+        self.pymins = {}
+        for name, pymin in rows:
+            self.pymins.setdefault(name, set()).add(pymin)
+        # typing-extensions -> typing_extensions, ruamel-yaml -> ruamel.yaml
+        self.names = {}
+        for name in self.pymins:
+            self.names.setdefault(proc.norm_dist_name(name), name)
+
+
+    def __len__(self):
+        return len(self.pymins)
+
+
+    def lookup(self, pip_name: str, target: str) -> str:
+        """Return the conda name of pip_name if it has a build for the
+        target python minor ('3.11'), else None.
+        """
+        norm = proc.norm_dist_name(pip_name)
+        name = self.aliases.get(norm)
+        if name is None:
+            name = norm if norm in self.pymins else self.names.get(norm)
+        pymins = self.pymins.get(name)
+        if pymins is None or not repodata.supports(pymins, target):
+            return None
+        return name
+
+
+_maps = {}
+_maps_lock = threading.Lock()
+
+
+def get_name_map(index: repodata.RepodataIndex, channels=None) -> CondaNameMap:
+    """Return the CondaNameMap of the index for the channels (base urls;
+    default: all), shared in the process & only rebuilt when their indexed
+    repodata change.
+    """
+    sig = index.get_sig(channels)
+    key = (str(index.db_path), None if channels is None else frozenset(channels))
+    with _maps_lock:
+        cached = _maps.get(key)
+        if cached is None or cached[0] != sig:
+            cached = (sig, CondaNameMap(index.iter_pymins(channels)))
+            _maps[key] = cached
+            log.debug(f"PyPI map: {len(cached[1])} conda names.")
+        return cached[1]
+
+
+def conda_specifier(specifier: str) -> str:
+    """Return the conda form of a pip version specifier, or None if it has
+    none (pip-only operator, wildcard of an ordered comparison). The pip
+    wildcard equality ==X.* is =X.* for conda (see pins.version_constraint).
+    """
+    clauses = []
+    for clause in filter(None, specifier.split(",")):
+        m = pipspec.rx_clause.match(clause)
+        if m is None or m.group(1) in PIP_ONLY_OPS:
+            return None
+        op, ver = m.groups()
+        if ver.endswith(".*"):
+            if op == "==":
+                op = "="
+            elif op != "!=":
+                return None
+        clauses.append(op + ver)
+    return ",".join(clauses)
+
+
+def to_conda_spec(req: dict, conda_name: str) -> str:
+    """Return the conda spec of a pip requirement record, or None if it
+    cannot be expressed (extras, marker, url, pip-only specifier).
+    """
+    if req["extras"] or req["marker"] or req["url"] or req["editable"]:
+        return None
+    spec = conda_specifier(req["specifier"])
+    if spec is None:
+        return None
+    return conda_name + spec
+
+
+def promote_pip_deps(pip_deps: dict, name_map: CondaNameMap, target: str) -> tuple:
+    """Return (conda_specs, pip_deps): the conda specs of the pip entries
+    with a conda package for the target python minor, & the {"pip": [...]}
+    mapping of the others (None if none is left).
+    """
+    if not pip_deps:
+        return [], pip_deps
+    conda_specs, kept = [], []
+    for line in pip_deps["pip"]:
+        req = pipspec.parse_requirement(str(line))
+        conda_name = name_map.lookup(req["name"], target) if req["name"] else None
+        spec = to_conda_spec(req, conda_name) if conda_name else None
+        if spec is None:
+            kept.append(line)
+        else:
+            conda_specs.append(spec)
+
+    return conda_specs, (dict(pip=kept) if kept else None)
@@ -0,0 +1,291 @@
+# repodata.py
+__doc__ = """Compact on-disk index of the cached repodata: package name -> python
+minor versions with available builds.
+The index is a SQLite file in the cache dir (next to the user's .condarc),
+built from the repodata json files conda caches in <pkgs_dir>/cache; each
+file is re-parsed only when its mtime or size changes, so queries take
+milliseconds even with a 200 MB conda-forge repodata in the cache.
+Each file is recorded with the base url of its channel, so that the queries
+can be restricted to the channels of an env.
+"""
+import re
+import json
+import sqlite3
+import threading
+from pathlib import Path
+import logging
+
+from new_conda_env.channels import strip_subdir
+# ..........................................................................
+
+log = logging.getLogger(__name__)
+log.setLevel(logging.ERROR)
+
+sh = logging.StreamHandler()
+formatter = logging.Formatter('%(name)-15s: %(levelname)-8s %(message)s')
+sh.setFormatter(formatter)
+log.addHandler(sh)
+
+
+INDEX_FILENAME = "repodata_index.sqlite"
+AUTO = "auto"  # -new_ver value selecting the version from the index
+ANY = "*"     # noarch or python-independent builds
+
+jp = Path.joinpath
+
+# build strings: py310h..., np126py39_0, cp311...
+rx_build_py = re.compile(r"(?<![a-z])(?:py|cp)(\d)(\d{1,2})(?=[a-z_]|$)")
+# depends: 'python >=3.10,<3.11.0a0', 'python 3.10.*', 'python_abi 3.10.* *_cp310'
+rx_dep_py = re.compile(r"^python(?:_abi)?\s+(?:>=|=|==)?\s*(\d+)\.(\d+)(.*)$")
+rx_ver_minor = re.compile(r"^(\d+)\.(\d+)")
+# repodata filename & token of a channel url
+rx_repodata_fn = re.compile(r"/(?:current_)?repodata\.json$")
+rx_token = re.compile(r"/t/[^/]+(?=/)")
+
+SCHEMA_VERSION = 2  # 2: channel of the sources
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sources (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    channel TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS pkgs (
+    name TEXT NOT NULL,
+    pymin TEXT NOT NULL,
+    source INTEGER NOT NULL,
+    PRIMARY KEY (name, pymin, source)) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS pkgs_source ON pkgs (source);
+"""
+
+_refresh_lock = threading.Lock()
+
+
+def ver_key(ver: str) -> tuple:
+    return tuple(int(x) for x in ver.split("."))
+
+
+def record_pymins(rec: dict) -> set:
+    """Return the python minors ('3.10') a repodata record is built for:
+    ANY for noarch or python-independent builds, '>=3.8' for a noarch
+    python build with a lower bound.
+    """
+    name = rec.get("name", "")
+    if name == "python":
+        m = rx_ver_minor.match(rec.get("version", ""))
+        return {f"{m.group(1)}.{m.group(2)}"} if m else set()
+
+    m = rx_build_py.search(rec.get("build", ""))
+    if m is not None:
+        return {f"{m.group(1)}.{m.group(2)}"}
+
+    noarch = rec.get("noarch")
+    for dep in rec.get("depends") or ():
+        m = rx_dep_py.match(dep)
+        if m is None:
+            continue
+        major, minor, rest = m.groups()
+        if noarch or dep.split()[1].startswith(">") and "<" not in rest:
+            return {f">={major}.{minor}"}
+        return {f"{major}.{minor}"}
+
+    return {ANY}
+
+
+def supports(pymins: set, target: str) -> bool:
+    """Whether a package with these pymins has a build for target."""
+    if target in pymins or ANY in pymins:
+        return True
+    t = ver_key(target)
+    return any(p.startswith(">=") and t >= ver_key(p[2:]) for p in pymins)
+
+
+def read_source_channel(f: Path, data: dict) -> str:
+    """Return the base url of the channel of the cached repodata file f
+    (parsed: data), from the 'url' of its .info.json state file (conda>=23.1),
+    else from the '_url' key of older caches; '' if unknown.
+    """
+    url = ""
+    try:
+        info = json.loads(f.with_name(f.stem + ".info.json").read_text(encoding="utf-8"))
+        url = info.get("url") or ""
+    except (OSError, ValueError):
+        pass
+    url = url or data.get("_url") or ""
+    if not url:
+        return ""
+    return strip_subdir(rx_token.sub("", rx_repodata_fn.sub("", url)))
+
+
+def channel_filter(channels) -> tuple:
+    """Return (sql condition, params) restricting the pkgs rows to the
+    sources of channels (base urls); no restriction if channels is None.
+    """
+    if channels is None:
+        return "", []
+    channels = sorted(set(channels))
+    q = " AND source IN (SELECT id FROM sources WHERE channel IN ({}))"
+    return q.format(",".join("?" * len(channels))), channels
+
+
+def iter_repodata_files(pkgs_dirs: list):
+    """Yield the cached repodata json files of the pkgs dirs (the .info.json
+    state files are skipped).
+    """
+    for pkgs_dir in pkgs_dirs:
+        cache_dir = jp(Path(pkgs_dir), "cache")
+        if not cache_dir.is_dir():
+            continue
+        for f in sorted(cache_dir.glob("*.json")):
+            if not f.name.endswith(".info.json"):
+                yield f
+
+
+class RepodataIndex:
+    """SQLite index: package name -> python minors with builds.
+    Call: RepodataIndex(db_path: Path, pkgs_dirs: list)
+    Arguments:
+    - db_path (Path): the index file (created if needed)
+    - pkgs_dirs (list): conda's pkgs_dirs, whose cache subdir holds the
+      repodata json files
+    - read_only (bool, False): open an existing index as last refreshed,
+      without writing any file (sqlite3.Error if there is none)
+    The queries take an optional channels argument: the base urls of the
+    channels whose repodata are considered (default: all).
+    """
+    def __init__(self, db_path: Path, pkgs_dirs: list, read_only: bool=False):
+        self.db_path = Path(db_path)
+        self.pkgs_dirs = [Path(p) for p in pkgs_dirs]
+        self.read_only = read_only
+        if read_only:
+            uri = self.db_path.resolve().as_uri() + "?mode=ro"
+            self.con = sqlite3.connect(uri, uri=True, timeout=30,
+                                       check_same_thread=False)
+            if self.con.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+                self.con.close()
+                raise sqlite3.DatabaseError(f"Index of an older layout: {self.db_path}")
+            return
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.con = sqlite3.connect(str(self.db_path), timeout=30,
+                                   check_same_thread=False)
+        with _refresh_lock:
+            if self.con.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+                # older layout: rebuilt from the repodata files
+                self.con.executescript("DROP TABLE IF EXISTS pkgs;\n"
+                                       "DROP TABLE IF EXISTS sources;\n"
+                                       f"PRAGMA user_version = {SCHEMA_VERSION};")
+            self.con.executescript(SCHEMA)
+
+
+    def close(self):
+        self.con.close()
+
+
+    def refresh(self) -> list:
+        """Re-index the repodata files added or changed (mtime, size) since
+        the last refresh & drop those removed. Return the re-indexed paths.
+        """
+        if self.read_only:
+            raise sqlite3.OperationalError(f"Read-only index: {self.db_path}")
+        with _refresh_lock, self.con:
+            known = {path: (sid, mtime, size) for sid, path, mtime, size
+                     in self.con.execute("SELECT id, path, mtime_ns, size FROM sources")}
+            done = []
+            for f in iter_repodata_files(self.pkgs_dirs):
+                st = f.stat()
+                old = known.pop(str(f), None)
+                if old is not None and old[1:] == (st.st_mtime_ns, st.st_size):
+                    continue
+                if old is not None:
+                    self._drop_source(old[0])
+                self._add_source(f, st)
+                done.append(f)
+            for sid, _, _ in known.values():
+                self._drop_source(sid)
+        if done:
+            log.debug(f"Re-indexed {len(done)} repodata file(s).")
+        return done
+
+
+    def _drop_source(self, sid: int) -> None:
+        self.con.execute("DELETE FROM pkgs WHERE source = ?", (sid,))
+        self.con.execute("DELETE FROM sources WHERE id = ?", (sid,))
+
+
+    def _add_source(self, f: Path, st) -> None:
+        try:
+            with open(f, "rb") as fh:
+                data = json.load(fh)
+        except (OSError, ValueError) as err:
+            log.debug(f"Skipping {f}: {err}")
+            data = None
+        # recorded even if unreadable: not re-parsed until it changes
+        cur = self.con.execute(
+            "INSERT INTO sources (path, mtime_ns, size, channel) VALUES (?, ?, ?, ?)",
+            (str(f), st.st_mtime_ns, st.st_size, read_source_channel(f, data or {})))
+        sid = cur.lastrowid
+        if data is None:
+            return
+        rows = set()
+        for key in ("packages", "packages.conda"):
+            for rec in (data.get(key) or {}).values():
+                name = rec.get("name")
+                if name:
+                    rows.update((name, p, sid) for p in record_pymins(rec))
+        self.con.executemany("INSERT OR IGNORE INTO pkgs VALUES (?, ?, ?)", rows)
+
+
+    def get_sig(self, channels=None) -> tuple:
+        """Return the state of the indexed repodata files of the channels
+        (changed by a refresh that re-indexed or dropped one).
+        """
+        q = "SELECT id, mtime_ns, size, channel FROM sources ORDER BY id"
+        rows = self.con.execute(q)
+        if channels is None:
+            return tuple(rows)
+        channels = set(channels)
+        return tuple(r for r in rows if r[3] in channels)
+
+
+    def iter_pymins(self, channels=None):
+        """Yield the (name, pymin) pairs of the index."""
+        cond, params = channel_filter(channels)
+        q = "SELECT DISTINCT name, pymin FROM pkgs WHERE 1" + cond
+        yield from self.con.execute(q, params)
+
+
+    def get_pymins(self, names, channels=None) -> dict:
+        """Return {name: set of pymins} for the names found in the index."""
+        out = {}
+        names = list(names)
+        cond, params = channel_filter(channels)
+        for i in range(0, len(names), 500):
+            chunk = names[i:i + 500]
+            q = "SELECT DISTINCT name, pymin FROM pkgs WHERE name IN ({})" + cond
+            q = q.format(",".join("?" * len(chunk)))
+            for name, pymin in self.con.execute(q, chunk + params):
+                out.setdefault(name, set()).add(pymin)
+        return out
+
+
+    def python_minors(self, channels=None) -> list:
+        """Return the python minors with a python build, highest first."""
+        cond, params = channel_filter(channels)
+        q = "SELECT DISTINCT pymin FROM pkgs WHERE name = 'python'" + cond
+        rows = self.con.execute(q, params)
+        return sorted((r[0] for r in rows), key=ver_key, reverse=True)
+
+
+    def best_python_version(self, names, candidates: list=None, channels=None) -> tuple:
+        """Return (best, unknown): best is the highest python minor among
+        candidates (default: all indexed python minors) for which every
+        package in names has a build, or None; unknown lists the names not
+        in the index (not used in the choice).
+        """
+        names = {n for n in names if n != "python"}
+        pymins = self.get_pymins(names, channels)
+        unknown = sorted(names - set(pymins))
+        for ver in candidates or self.python_minors(channels):
+            if all(supports(p, ver) for p in pymins.values()):
+                return ver, unknown
+        return None, unknown
@@ -0,0 +1,236 @@
+# server.py
+__doc__ = """Server mode: a long-lived process keeping the conda context warm
+& serving lean-clone requests over a local Unix socket (run it in (base)
+with `new-conda-env-serve`; submit requests with `new-conda-env -use_server 1`).
+Requests are served concurrently. The conda context is reloaded when the
+user's .condarc changes; the export data of an env are taken from the cache,
+which is keyed on the env fingerprint (conda-meta & site-packages stats).
+Protocol: one json request line per connection, one json response line.
+"""
+import os
+import sys
+import json
+import signal
+import socket
+import threading
+import socketserver
+from pathlib import Path
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+import logging
+
+from new_conda_env import batch, cache, locator
+from new_conda_env.envir import CondaEnvir
+# ..........................................................................
+
+log = logging.getLogger(__name__)
+log.setLevel(logging.ERROR)
+
+sh = logging.StreamHandler()
+formatter = logging.Formatter('%(name)-15s: %(levelname)-8s %(message)s')
+sh.setFormatter(formatter)
+log.addHandler(sh)
+
+
+SOCKET_ENV_VAR = "NEW_CONDA_ENV_SOCKET"
+SOCKET_FILENAME = "serve.sock"
+
+msgf_no_server = """
+    No new_conda_env server at {}:
+    start one in (base) with `new-conda-env-serve`.
+"""
+
+jp = Path.joinpath
+
+
+def default_socket() -> Path:
+    """Return the socket path: $NEW_CONDA_ENV_SOCKET if set, else
+    ~/.new_conda_env_cache/serve.sock.
+    """
+    path = os.getenv(SOCKET_ENV_VAR)
+    if path:
+        return Path(path)
+    return jp(Path.home(), cache.CACHE_DIRNAME, SOCKET_FILENAME)
+
+
+def _check_unix_sockets() -> None:
+    if not hasattr(socket, "AF_UNIX"):
+        msg = "The server mode needs Unix domain sockets (not available)."
+        log.error(msg)
+        raise NotImplementedError(msg)
+
+
+class CondaInfo:
+    """Holder of CondaEnvir.get_conda_info(), reloaded when the user's
+    .condarc changes (mtime, size).
+    Call: CondaInfo(loader=CondaEnvir.get_conda_info)
+    Arguments:
+    - loader (callable): returns the basic_info dict
+    """
+    def __init__(self, loader=CondaEnvir.get_conda_info):
+        self.loader = loader
+        self.lock = threading.Lock()
+        self.info = loader()
+        self.rc_sig = self.get_rc_sig()
+
+
+    def get_rc_sig(self) -> str:
+        return cache.stat_sig(self.info["user_condarc"])
+
+
+    def get(self) -> dict:
+        with self.lock:
+            if self.get_rc_sig() != self.rc_sig:
+                log.info(".condarc changed: reloading the conda context.")
+                self.reset_context()
+                self.info = self.loader()
+                self.rc_sig = self.get_rc_sig()
+            return self.info
+
+
+    @staticmethod
+    def reset_context() -> None:
+        from conda.base.context import reset_context
+
+        reset_context()
+
+
+def handle_request(request: dict, basic_info: dict) -> dict:
+    """Run a request & return the response (json-serializable).
+    request: {"envs": [env or [env, new_env_name], ...],
+              "all_envs": bool, "jobs": int, "yml": bool,
+              "new_vers": [new_ver, ...] (optional, see batch.clone_targets),
+              "kwargs": CondaEnvir kwargs}
+    response: {"results": [result records, see batch.clone_one]}, with the
+    new yml text under "yml" if requested; or {"error": str}.
+    """
+    kwargs = dict(request.get("kwargs") or {})
+    envs = list(request.get("envs") or [])
+    if request.get("all_envs"):
+        envs.extend(batch.list_envs(locator.get_locator(basic_info).envs(),
+                                    kernel=kwargs.get("kernel", "python"),
+                                    kernel_ver=kwargs.get("old_ver", "")))
+    if not envs:
+        return {"error": "No env to clone."}
+
+    results = batch.run_batch(envs, max_workers=request.get("jobs", 4),
+                              basic_info=basic_info,
+                              new_vers=request.get("new_vers"), **kwargs)
+    for r in results:
+        if r["output"] is not None:
+            if request.get("yml"):
+                r["yml"] = r["output"].read_text()
+            r["output"] = str(r["output"])
+
+    return {"results": results}
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline())
+            response = handle_request(request, self.server.conda_info.get())
+        except Exception as err:
+            log.debug("Request failed", exc_info=True)
+            response = {"error": f"{type(err).__name__}: {err}"}
+        self.wfile.write(json.dumps(response).encode() + b"\n")
+
+
+class EnvServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Threaded Unix socket server; each connection is handled in its own
+    thread.
+    Call: EnvServer(socket_path: Path, conda_info: CondaInfo=None)
+    """
+    daemon_threads = True
+
+    def __init__(self, socket_path: Path, conda_info: CondaInfo=None):
+        _check_unix_sockets()
+        self.socket_path = Path(socket_path)
+        self.socket_path.parent.mkdir(parents=True, exist_ok=True)
+        if self.socket_path.exists():
+            if is_serving(self.socket_path):
+                msg = f"A server is already running at {self.socket_path}."
+                log.error(msg)
+                raise RuntimeError(msg)
+            self.socket_path.unlink()   # stale
+        self.conda_info = conda_info or CondaInfo()
+        super().__init__(str(self.socket_path), RequestHandler)
+        os.chmod(self.socket_path, 0o600)
+
+
+    def server_close(self):
+        super().server_close()
+        try:
+            self.socket_path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def is_serving(socket_path: Path) -> bool:
+    """Whether a server accepts connections at socket_path."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        try:
+            s.connect(str(socket_path))
+        except OSError:
+            return False
+    return True
+
+
+def submit(request: dict, socket_path: Path=None, timeout: float=None) -> dict:
+    """Send a request to the server & return its response (thin client:
+    conda is not imported).
+    Raise ConnectionError if no server listens at socket_path.
+    """
+    _check_unix_sockets()
+    socket_path = Path(socket_path or default_socket())
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        s.settimeout(timeout)
+        try:
+            s.connect(str(socket_path))
+        except (FileNotFoundError, ConnectionRefusedError) as err:
+            msg = msgf_no_server.format(socket_path)
+            log.error(msg)
+            raise ConnectionError(msg) from err
+        s.sendall(json.dumps(request).encode() + b"\n")
+        s.shutdown(socket.SHUT_WR)
+        with s.makefile("rb") as f:
+            return json.loads(f.readline())
+
+
+def generate_parser():
+    p = ArgumentParser(prog="new_conda_env.server",
+        description = __doc__,
+        formatter_class = ArgumentDefaultsHelpFormatter
+    )
+    p.add_argument(
+        "-socket", type=str,
+        default=str(default_socket()),
+        help=f"The Unix socket path (or set ${SOCKET_ENV_VAR})."
+    )
+    level_choices = list(logging._nameToLevel.keys())
+    p.add_argument(
+        "-log_level",  choices=level_choices,
+        default="ERROR", type=str,
+        help="Optional: log with debug mode."
+    )
+    return p
+
+
+def main(argv=None):
+    args = generate_parser().parse_args(argv)
+    log.setLevel(args.log_level)
+    # exit cleanly (socket removed) on `kill`
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    with EnvServer(Path(args.socket)) as server:
+        print(f"new_conda_env server listening at {args.socket} (Ctrl+C to stop)")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+    return 0
+
+
+if __name__ == "__main__":
+
+    sys.exit(main())
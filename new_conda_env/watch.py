@@ -0,0 +1,188 @@
+# watch.py
+__doc__ = """Watch mode: regenerate the lean yml of an env when its
+conda-meta/history changes (i.e. after a `conda install/remove/update`).
+The conda-meta dirs are watched with inotify on Linux (no activity while
+idle), else their history files are polled (one stat per env & interval).
+Bursts of changes are debounced: an env is regenerated once its history
+has been quiet for `debounce` seconds.
+"""
+import os
+import sys
+import time
+import errno
+import select
+import struct
+from pathlib import Path
+import logging
+
+from new_conda_env import cache
+# ..........................................................................
+
+log = logging.getLogger(__name__)
+log.setLevel(logging.ERROR)
+
+sh = logging.StreamHandler()
+formatter = logging.Formatter('%(name)-15s: %(levelname)-8s %(message)s')
+sh.setFormatter(formatter)
+log.addHandler(sh)
+
+
+HISTORY = "history"
+STOP_CHECK = 0.5   # seconds between checks of the stop event
+
+# inotify (linux/inotify.h)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_CLOEXEC = 0o2000000
+IN_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+EVENT_HEAD = struct.Struct("iIII")   # wd, mask, cookie, len
+
+jp = Path.joinpath
+
+
+def history_path(prefix: Path) -> Path:
+    return jp(Path(prefix), "conda-meta", HISTORY)
+
+
+class PollingWatcher:
+    """Detect history changes by polling their stats.
+    Call: PollingWatcher(envs: dict, interval: float=2.0)
+    Arguments:
+    - envs (dict): {name: prefix} of the watched envs
+    - interval (float, 2.0): seconds between polls
+    """
+    def __init__(self, envs: dict, interval: float=2.0):
+        self.envs = dict(envs)
+        self.interval = interval
+        self.sigs = {name: cache.stat_sig(history_path(p)) for name, p in self.envs.items()}
+
+
+    def poll(self) -> set:
+        changed = set()
+        for name, prefix in self.envs.items():
+            sig = cache.stat_sig(history_path(prefix))
+            if sig != self.sigs[name]:
+                self.sigs[name] = sig
+                changed.add(name)
+        return changed
+
+
+    def wait(self, timeout: float=None) -> set:
+        """Return the names of the envs whose history changed, waiting up
+        to timeout seconds (None: until a change).
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            changed = self.poll()
+            if changed:
+                return changed
+            left = self.interval if deadline is None else deadline - time.monotonic()
+            if left <= 0:
+                return changed
+            time.sleep(min(self.interval, left))
+
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """Detect history changes with inotify watches on the conda-meta dirs
+    (Linux only; libc via ctypes).
+    Call: InotifyWatcher(envs: dict)
+    Arguments:
+    - envs (dict): {name: prefix} of the watched envs
+    Raise OSError if inotify is not available or a watch cannot be added.
+    """
+    def __init__(self, envs: dict):
+        import ctypes
+        import ctypes.util
+
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6",
+                           use_errno=True)
+        self.fd = libc.inotify_init1(IN_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self.wds = {}
+        for name, prefix in envs.items():
+            meta = os.fsencode(str(jp(Path(prefix), "conda-meta")))
+            wd = libc.inotify_add_watch(self.fd, meta, IN_MASK)
+            if wd < 0:
+                err = ctypes.get_errno()
+                self.close()
+                raise OSError(err, f"{os.strerror(err)}: {meta.decode()}")
+            self.wds.setdefault(wd, set()).add(name)
+
+
+    def wait(self, timeout: float=None) -> set:
+        """Return the names of the envs whose history changed, waiting up
+        to timeout seconds (None: until an event in a conda-meta dir).
+        """
+        try:
+            ready, _, _ = select.select([self.fd], [], [], timeout)
+        except InterruptedError:
+            return set()
+        if not ready:
+            return set()
+        data = os.read(self.fd, 64 * 1024)
+        changed = set()
+        i = 0
+        while i + EVENT_HEAD.size <= len(data):
+            wd, mask, cookie, n = EVENT_HEAD.unpack_from(data, i)
+            i += EVENT_HEAD.size
+            name = data[i:i + n].rstrip(b"\0")
+            i += n
+            if name == HISTORY.encode():
+                changed.update(self.wds.get(wd, ()))
+        return changed
+
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+def make_watcher(envs: dict, interval: float=2.0, backend: str="auto"):
+    """Return an InotifyWatcher if backend is 'auto' or 'inotify' & inotify
+    works here, else a PollingWatcher.
+    """
+    if backend != "poll" and sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(envs)
+        except (OSError, AttributeError) as err:
+            # e.g. ENOSPC: max_user_watches reached
+            level = logging.WARNING if getattr(err, "errno", None) == errno.ENOSPC else logging.INFO
+            log.log(level, f"inotify unavailable ({err}): polling instead.")
+    return PollingWatcher(envs, interval)
+
+
+def watch_envs(envs: dict, on_change, debounce: float=2.0, interval: float=2.0,
+               backend: str="auto", stop=None) -> None:
+    """Call on_change(name) for each env in envs ({name: prefix}) after a
+    burst of changes to its history, once quiet for debounce seconds.
+    Run until the stop event (threading.Event) is set, or KeyboardInterrupt.
+    """
+    watcher = make_watcher(envs, interval, backend)
+    log.info(f"Watching {len(envs)} env(s) with {type(watcher).__name__}.")
+    pending = set()
+    deadline = None
+    try:
+        while stop is None or not stop.is_set():
+            timeout = None if deadline is None else max(0, deadline - time.monotonic())
+            if stop is not None:
+                timeout = STOP_CHECK if timeout is None else min(timeout, STOP_CHECK)
+            changed = watcher.wait(timeout)
+            now = time.monotonic()
+            if changed:
+                pending |= changed
+                deadline = now + debounce
+            elif deadline is not None and now >= deadline:
+                for name in sorted(pending):
+                    on_change(name)
+                pending.clear()
+                deadline = None
+    finally:
+        watcher.close()
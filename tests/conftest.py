@@ -0,0 +1,128 @@
+# conftest.py
+"""Factories of fake env prefixes & conda caches shared by the test modules
+(no conda installation is needed).
+"""
+import json
+from pathlib import Path
+
+import pytest
+
+
+HISTORY = """\
+==> 2023-01-10 10:00:00 <==
+# cmd: conda create -n ds310 python=3.10 numpy
+# conda version: 22.11.1
++conda-forge/linux-64::python-3.10.8-h4a9ceb5_0_cpython
++conda-forge/linux-64::numpy-1.24.1-py310h08bbf29_0
+# update specs: ['python=3.10', 'numpy']
+==> 2023-01-11 10:00:00 <==
+# cmd: conda install pandas conda-forge::scipy
+# conda version: 22.11.1
++conda-forge/linux-64::pandas-1.5.2-py310h769672d_2
++conda-forge/linux-64::scipy-1.10.0-py310h8deb116_0
+# update specs: ['pandas', 'conda-forge::scipy']
+==> 2023-01-12 10:00:00 <==
+# cmd: conda remove pandas
+# conda version: 22.11.1
+-conda-forge/linux-64::pandas-1.5.2-py310h769672d_2
+# remove specs: ['pandas']
+==> 2023-01-13 10:00:00 <==
+# cmd: conda install numpy>=1.24 seaborn
+# conda version: 22.11.1
+# update specs: ['numpy>=1.24', 'seaborn']
+==> 2023-01-14 10:00:00 <==
++conda-forge/linux-64::ipython-8.8.0-pyh41d4057_0
+# update specs: ['ipython']
+"""
+
+INSTALLED = ["python-3.10.8-h4a9ceb5_0_cpython", "numpy-1.24.1-py310h08bbf29_0",
+             "scipy-1.10.0-py310h8deb116_0"]
+
+
+def _make_prefix(root: Path, history: str=HISTORY, installed: list=INSTALLED) -> Path:
+    meta = root.joinpath("conda-meta")
+    meta.mkdir(parents=True)
+    meta.joinpath("history").write_text(history)
+    for rec in installed:
+        meta.joinpath(rec + ".json").write_text("{}")
+    return root
+
+
+def _make_env(prefix: Path, py_ver: str=None) -> Path:
+    meta = prefix.joinpath("conda-meta")
+    meta.mkdir(parents=True)
+    meta.joinpath("history").write_text("==> 2023-01-10 10:00:00 <==\n")
+    if py_ver is not None:
+        meta.joinpath(f"python-{py_ver}.8-h123_0.json").write_text("{}")
+        prefix.joinpath("lib", f"python{py_ver}", "site-packages").mkdir(parents=True)
+    return prefix
+
+
+def _make_dist_info(site: Path, name: str, ver: str, installer: str="pip",
+                    requires: list=()) -> Path:
+    dist = site.joinpath(f"{name}-{ver}.dist-info")
+    dist.mkdir(parents=True, exist_ok=True)
+    lines = ["Metadata-Version: 2.1", f"Name: {name}", f"Version: {ver}"]
+    lines += [f"Requires-Dist: {r}" for r in requires]
+    dist.joinpath("METADATA").write_text("\n".join(lines) + "\n\nLong description.\n")
+    dist.joinpath("INSTALLER").write_text(installer + "\n")
+    return dist
+
+
+def _fake_basic_info(root: Path, channels: list=("conda-forge",),
+                     pkgs_dirs: list=()) -> dict:
+    return {"conda_prefix": root, "active_prefix": root,
+            "user_condarc": root.joinpath(".condarc"),
+            "env_dir": root.joinpath("envs"),
+            "channels": list(channels), "pkgs_dirs": list(pkgs_dirs)}
+
+
+def _make_repodata(pkgs_dir: Path, name: str, records: list, url: str) -> Path:
+    cache_dir = pkgs_dir.joinpath("cache")
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    pkgs = {f"{r['name']}-{r['version']}-{r['build']}.conda": r for r in records}
+    f = cache_dir.joinpath(f"{name}.json")
+    f.write_text(json.dumps({"info": {}, "packages.conda": pkgs}))
+    cache_dir.joinpath(f"{name}.info.json").write_text(json.dumps({"url": url}))
+    return f
+
+
+@pytest.fixture
+def make_prefix():
+    """make_prefix(root, history=HISTORY, installed=INSTALLED): an env with
+    a conda-meta/history & (empty) records of the installed packages.
+    """
+    return _make_prefix
+
+
+@pytest.fixture
+def make_env():
+    """make_env(prefix, py_ver=None): an env with a one-request history; if
+    py_ver, a python record & an empty site-packages.
+    """
+    return _make_env
+
+
+@pytest.fixture
+def make_dist_info():
+    """make_dist_info(site, name, ver, installer="pip", requires=()): a
+    .dist-info dir (METADATA & INSTALLER) in site.
+    """
+    return _make_dist_info
+
+
+@pytest.fixture
+def fake_basic_info():
+    """fake_basic_info(root, channels=("conda-forge",), pkgs_dirs=()): the
+    conda info (see CondaEnvir.get_conda_info) of a conda root at root,
+    whose envs are in root/envs.
+    """
+    return _fake_basic_info
+
+
+@pytest.fixture
+def make_repodata():
+    """make_repodata(pkgs_dir, name, records, url): a repodata json of the
+    records (dicts) cached by conda for the channel subdir url.
+    """
+    return _make_repodata
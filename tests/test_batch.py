@@ -0,0 +1,67 @@
+# test_batch.py
+
+import importlib.util
+from pathlib import Path
+
+import pytest
+
+from new_conda_env import batch, envir
+
+
+HAS_CONDA = importlib.util.find_spec("conda") is not None
+
+
+def test_read_manifest(tmp_path):
+    manifest = tmp_path.joinpath("envs.txt")
+    manifest.write_text("# envs to re-target\nds310\n\ngeo310  geo311 # renamed\n")
+    assert batch.read_manifest(manifest) == [("ds310", "default"),
+                                             ("geo310", "geo311")]
+
+
+def test_list_envs(tmp_path, make_prefix):
+    for env, ver in [("ds310", "3.10.8"), ("geo310", "3.10.9"), ("old39", "3.9.1")]:
+        make_prefix(tmp_path.joinpath(env),
+                    installed=[f"python-{ver}-h123_0_cpython", "python-dateutil-2.8.2-pyhd8ed1ab_0"])
+    tmp_path.joinpath("not_an_env").mkdir()
+
+    assert batch.list_envs(tmp_path) == ["ds310", "geo310", "old39"]
+    assert batch.list_envs(tmp_path, kernel_ver="3.10") == ["ds310", "geo310"]
+
+
+def test_format_summary():
+    results = [{"env": "ds310", "output": Path("lean_envpy311_from_ds310.yml"),
+                "error": None, "seconds": 1.234},
+               {"env": "geo310", "output": None,
+                "error": "FileNotFoundError: typo", "seconds": 0.01}]
+    table = batch.format_summary(results)
+    lines = table.splitlines()
+    assert lines[0].split() == ["env", "status", "time", "(s)", "output", "/", "error"]
+    assert "ok" in lines[2] and "1.23" in lines[2]
+    assert "FAILED" in lines[3] and "typo" in lines[3]
+    assert lines[-1] == "1/2 env(s) done."
+
+
+@pytest.mark.skipif(not HAS_CONDA, reason="needs conda (yaml & specs formatting)")
+def test_clone_targets(tmp_path, fake_basic_info, monkeypatch, make_prefix):
+    make_prefix(tmp_path.joinpath("envs", "ds310"))
+    tmp_path.joinpath("envs", "ds310", "lib", "python3.10", "site-packages").mkdir(parents=True)
+    basic_info = fake_basic_info(tmp_path)
+    calls = []
+    get_export_data = envir.CondaEnvir.get_export_data
+    monkeypatch.setattr(envir.CondaEnvir, "get_export_data",
+                        lambda self: calls.append(1) or get_export_data(self))
+
+    results = batch.clone_targets("ds310", "default", ["3.10", "3.11", "3.12"],
+                                  old_ver="3.10", basic_info=basic_info,
+                                  display_new_yml=False, use_cache=False)
+    assert calls == [1]
+    assert [r["env"] for r in results] == ["ds310 (3.10)", "ds310 (3.11)", "ds310 (3.12)"]
+    for r, ver in zip(results, ["310", "311", "312"]):
+        assert r["error"] is None
+        assert r["output"].name == f"lean_envpy{ver}_from_ds310.yml"
+        assert f"python={ver[0]}.{ver[1:]}" in r["output"].read_text()
+
+    named = batch.clone_targets("ds310", "ds", ["3.11", "3.12"], old_ver="3.10",
+                                basic_info=basic_info, use_cache=False)
+    assert [r["output"].name for r in named] == ["lean_ds_311_from_ds310.yml",
+                                                 "lean_ds_312_from_ds310.yml"]
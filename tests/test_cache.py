@@ -0,0 +1,56 @@
+# test_cache.py
+
+import os
+import time
+
+from new_conda_env import cache
+
+
+def test_env_fingerprint(tmp_path, make_env):
+    prefix = make_env(tmp_path, "3.10")
+    fp = cache.env_fingerprint(prefix)
+    assert fp == cache.env_fingerprint(prefix)
+
+    rec = prefix.joinpath("conda-meta", "numpy-1.24.1-py310_0.json")
+    rec.write_text("{}")
+    fp_conda = cache.env_fingerprint(prefix)
+    assert fp_conda != fp
+
+    # pip install: new dist-info dir in site-packages
+    site = prefix.joinpath("lib", "python3.10", "site-packages")
+    past = time.time() - 100
+    os.utime(site, (past, past))
+    fp_site = cache.env_fingerprint(prefix)
+    site.joinpath("watermark-2.3.1.dist-info").mkdir()
+    assert cache.env_fingerprint(prefix) != fp_site
+
+
+def test_export_cache(tmp_path):
+    ec = cache.ExportCache(tmp_path.joinpath("cache"))
+    key = ec.make_key("/envs/ds310", "fp", True)
+    assert ec.get(key) is None
+
+    data = {"yml_his": {"name": "ds310", "dependencies": ["python=3.10"]},
+            "clean_pips": {"pip": ["watermark"]}}
+    ec.put(key, data)
+    assert ec.get(key) == data
+    assert ec.get(ec.make_key("/envs/ds310", "fp2", True)) is None
+
+
+def test_export_cache_eviction(tmp_path):
+    ec = cache.ExportCache(tmp_path, max_bytes=300, max_age=1000)
+    payload = "x" * 90
+    now = time.time()
+    for i, key in enumerate(["a", "b", "c"]):
+        ec.put(key, payload)
+        os.utime(tmp_path.joinpath(key + ".json"), (now - 30 + i, now - 30 + i))
+    # 'a' is used: 'b' becomes the least recently used
+    assert ec.get("a") == payload
+    ec.put("d", payload)
+    assert sorted(p.stem for p in tmp_path.glob("*.json")) == ["a", "c", "d"]
+
+    # age-based
+    past = now - 2000
+    os.utime(tmp_path.joinpath("c.json"), (past, past))
+    ec.evict()
+    assert sorted(p.stem for p in tmp_path.glob("*.json")) == ["a", "d"]
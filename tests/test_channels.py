@@ -0,0 +1,43 @@
+# test_channels.py
+
+import json
+
+import pytest
+
+from new_conda_env import channels
+
+
+FORGE = "https://conda.anaconda.org/conda-forge"
+MAIN = "https://repo.anaconda.com/pkgs/main"
+BASES = {"conda-forge": {FORGE},
+         "bioconda": {"https://conda.anaconda.org/bioconda"},
+         "defaults": {MAIN, "https://repo.anaconda.com/pkgs/r"}}
+
+
+def test_strip_subdir():
+    assert channels.strip_subdir(f"{FORGE}/linux-64") == FORGE
+    assert channels.strip_subdir(f"{FORGE}/noarch/") == FORGE
+    assert channels.strip_subdir(f"{MAIN}/osx-arm64") == MAIN
+    assert channels.strip_subdir(FORGE) == FORGE
+
+
+def test_read_record_channels(tmp_path, make_prefix):
+    prefix = make_prefix(tmp_path, installed=[])
+    meta = prefix.joinpath("conda-meta")
+    for fn, channel in [("numpy-1.24.1-py310h08bbf29_0", f"{FORGE}/linux-64"),
+                        ("scipy-1.10.0-py310h8deb116_0", f"{MAIN}/linux-64"),
+                        ("libzlib-1.2.13-h166bdaf_4", f"{FORGE}/linux-64")]:
+        meta.joinpath(fn + ".json").write_text(json.dumps({"channel": channel}))
+    assert channels.read_record_channels(prefix, ["numpy", "scipy"]) == {
+        "numpy": FORGE, "scipy": MAIN}
+
+
+@pytest.mark.parametrize("used, expected", [
+    ({FORGE}, (["conda-forge"], ["bioconda", "defaults"], [])),
+    ({MAIN, FORGE}, (["conda-forge", "defaults"], ["bioconda"], [])),
+    ({FORGE, "https://conda.anaconda.org/pyviz"},
+     (["conda-forge"], ["bioconda", "defaults"], ["https://conda.anaconda.org/pyviz"])),
+])
+def test_select_channels(used, expected):
+    configured = ["conda-forge", "bioconda", "defaults"]
+    assert channels.select_channels(configured, BASES, used) == expected
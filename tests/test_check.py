@@ -0,0 +1,63 @@
+# test_check.py
+
+import os
+import json
+import shutil
+from pathlib import Path
+
+import pytest
+
+from new_conda_env import check
+
+
+def test_get_check_cmd(monkeypatch):
+    monkeypatch.setenv("CONDA_EXE", "conda")
+    cmd = check.get_check_cmd(["python=3.11", "numpy"], ["conda-forge"], Path("p"))
+    assert cmd == ["conda", "create", "--dry-run", "--json", "--yes",
+                   "--prefix", "p", "--offline", "--override-channels",
+                   "-c", "conda-forge", "python=3.11", "numpy"]
+    # local channels only: no network anyway
+    cmd = check.get_check_cmd(["foo"], ["file:///tmp/channel"], Path("p"))
+    assert "--offline" not in cmd
+
+
+def test_parse_check_output():
+    ok = json.dumps({"success": True, "dry_run": True, "actions": {}})
+    assert check.parse_check_output(ok) == {"ok": True, "missing": [], "message": ""}
+
+    not_found = json.dumps({"exception_name": "PackagesNotFoundError",
+                            "packages": ["foo=9"],
+                            "message": "The following packages are not available"})
+    report = check.parse_check_output(not_found)
+    assert report["ok"] is False and report["missing"] == ["foo=9"]
+
+    unsat = json.dumps({"exception_name": "UnsatisfiableError",
+                        "error": "UnsatisfiableError: conflicts"})
+    report = check.parse_check_output(unsat)
+    assert report == {"ok": False, "missing": [], "message": "UnsatisfiableError: conflicts"}
+    assert "FAILED" in check.format_report(report)
+
+
+def make_channel(root: Path) -> str:
+    """A stand-in channel with a single noarch package: foo 1.0."""
+    pkgs = {"foo-1.0-0.tar.bz2": {"name": "foo", "version": "1.0", "build": "0",
+                                  "build_number": 0, "depends": [],
+                                  "subdir": "noarch", "md5": "0" * 32}}
+    for subdir in ("noarch", "linux-64", "osx-64", "osx-arm64", "win-64"):
+        d = root.joinpath(subdir)
+        d.mkdir(parents=True)
+        data = {"info": {"subdir": subdir},
+                "packages": pkgs if subdir == "noarch" else {}}
+        d.joinpath("repodata.json").write_text(json.dumps(data))
+    return root.as_uri()
+
+
+@pytest.mark.skipif(shutil.which(os.getenv("CONDA_EXE", "conda")) is None,
+                    reason="needs a conda installation")
+def test_check_specs_local_channel(tmp_path):
+    channel = make_channel(tmp_path.joinpath("channel"))
+    assert check.check_specs(["foo"], [channel])["ok"]
+
+    report = check.check_specs(["foo", "bar"], [channel])
+    assert not report["ok"]
+    assert any("bar" in s for s in report["missing"])
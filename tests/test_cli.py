@@ -75,3 +75,18 @@ def test_cli_main(mock_new_yml, mock_get_stream):
     with mock.patch.object(sys, 'argv', argv):
         cli.main(argv)
         assert final.exists()
+
+
+def test_run_client_resolves_prefixes(tmp_path, monkeypatch):
+    from new_conda_env import server
+
+    sent = {}
+    def submit(request, socket_path=None):
+        sent.update(request)
+        return {"error": "not served"}
+
+    monkeypatch.setattr(server, "submit", submit)
+    monkeypatch.chdir(tmp_path)
+    argv = "-old_ver 3.10 -new_ver 3.11 -use_server 1 -prefix envs/ds310 -env_to_clone ds310"
+    assert cli.main(argv.split()) == 1
+    assert sent["envs"] == ["ds310", str(tmp_path.joinpath("envs", "ds310"))]
@@ -9,7 +9,7 @@ import shutil
 import pytest
 from unittest import mock
 
-from new_conda_env import envir, processing as proc
+from new_conda_env import envir, lockfile, pipgraph, processing as proc
 
 #.........................................................
 
@@ -102,9 +102,9 @@ def test_CondaEnvir(mock_new_yml, mock_get_stream):
 
     # test get_export_cmd
     flag = CondaFlag.HIST
-    cmd = "conda env export -n {} {}"
-    export_cmd = cmd.format(dict_ok["env_to_clone"], flag)
-    assert CE.get_export_cmd(dict_ok["env_to_clone"], flag) == export_cmd
+    cmd = "conda env export -p {} {}"
+    export_cmd = cmd.format(CE.old_prefix, flag)
+    assert CE.get_export_cmd(CE.old_prefix, flag) == export_cmd
 
     # test get_lean_yml_pathname
     user_dir = Path().home()
@@ -122,3 +122,213 @@ def test_CondaEnvir(mock_new_yml, mock_get_stream):
     
 
 
+
+
+FORGE = "https://conda.anaconda.org/conda-forge"
+OTHER = "https://conda.anaconda.org/other"
+
+
+@pytest.mark.parametrize("rc_text, expected", [
+    ("add_pip_as_python_dependency: false\n", False),
+    ("add_pip_as_python_dependency: true\n", True),
+    ("channels:\n  - defaults\n", True),
+    ("", True),
+])
+def test_get_rc_python_deps(tmp_path, fake_basic_info, make_prefix, rc_text, expected):
+    pytest.importorskip("ruamel.yaml")
+    make_prefix(tmp_path.joinpath("envs", "ds310"))
+    tmp_path.joinpath(".condarc").write_text(rc_text)
+    ce = envir.CondaEnvir(old_ver="3.10", new_ver="3.11", env_to_clone="ds310",
+                          basic_info=fake_basic_info(tmp_path), display_new_yml=False)
+    assert ce.get_rc_python_deps() is expected
+
+
+def test_provenance_hash_type(tmp_path, fake_basic_info, make_prefix):
+    make_prefix(tmp_path.joinpath("envs", "ds310"))
+    kwargs = dict(old_ver="3.10", new_ver="3.10", env_to_clone="ds310",
+                  basic_info=fake_basic_info(tmp_path), explicit=True)
+    header = envir.CondaEnvir(**kwargs).get_provenance()
+    # the explicit file of another hash is not reused as up to date
+    assert envir.CondaEnvir(hash_type="sha256", **kwargs).get_provenance() != header
+    assert envir.CondaEnvir(**kwargs).get_provenance() == header
+
+
+def test_target_timings(tmp_path, fake_basic_info, make_prefix):
+    make_prefix(tmp_path.joinpath("envs", "ds310"))
+    ce = envir.CondaEnvir(old_ver="3.10", new_ver="3.11", env_to_clone="ds310",
+                          basic_info=fake_basic_info(tmp_path), profile=True)
+    setup = [r["stage"] for r in ce.timings.records]
+    first, second = ce.get_targets(["3.11", "3.12"])
+    with first.timings.stage("merge"):
+        pass
+    with second.timings.stage("merge"):
+        pass
+    # the setup is reported once, & no target reports the stages of another
+    assert [r["stage"] for r in first.timings.records] == setup + ["merge"]
+    assert [r["stage"] for r in second.timings.records] == ["merge"]
+    assert [r["stage"] for r in ce.timings.records] == setup
+
+
+def test_env_fingerprint_once(tmp_path, fake_basic_info, make_prefix, monkeypatch):
+    make_prefix(tmp_path.joinpath("envs", "ds310"))
+    calls = []
+    fingerprint = envir.cache.env_fingerprint
+    monkeypatch.setattr(envir.cache, "env_fingerprint",
+                        lambda prefix: calls.append(prefix) or fingerprint(prefix))
+    ce = envir.CondaEnvir(old_ver="3.10", new_ver="3.11", env_to_clone="ds310",
+                          basic_info=fake_basic_info(tmp_path))
+    monkeypatch.setattr(ce, "get_export_data", lambda: ({"dependencies": []}, {}))
+    ce.get_cached_export_data()
+    ce.for_target("3.12").get_provenance()
+    ce.get_provenance()
+    assert len(calls) == 1
+
+
+@pytest.mark.parametrize("promote_pips, changed", [(True, True), (False, False)])
+def test_provenance_repodata(tmp_path, fake_basic_info, make_prefix, make_repodata,
+                             promote_pips, changed):
+    make_prefix(tmp_path.joinpath("envs", "ds310"))
+    pkgs = tmp_path.joinpath("pkgs")
+    rec = {"name": "numpy", "version": "1.0", "build": "py311h1_0"}
+    make_repodata(pkgs, "forge", [rec], f"{FORGE}/linux-64")
+    kwargs = dict(old_ver="3.10", new_ver="3.10", env_to_clone="ds310",
+                  basic_info=fake_basic_info(tmp_path, pkgs_dirs=[pkgs]),
+                  promote_pips=promote_pips)
+    header = envir.CondaEnvir(**kwargs).get_provenance()
+    # conda refreshed its repodata: the promoted deps may differ
+    make_repodata(pkgs, "forge", [rec, dict(rec, version="1.1")], f"{FORGE}/linux-64")
+    assert (envir.CondaEnvir(**kwargs).get_provenance() != header) is changed
+
+
+def test_owned_distinfos_scanned_once(tmp_path, fake_basic_info, make_prefix,
+                                      make_dist_info, monkeypatch):
+    prefix = make_prefix(tmp_path.joinpath("envs", "ds310"))
+    make_dist_info(prefix.joinpath("lib", "python3.10", "site-packages"), "watermark", "2.3.1")
+    calls = []
+    scan = proc.get_conda_owned_distinfos
+    monkeypatch.setattr(proc, "get_conda_owned_distinfos",
+                        lambda prefix: calls.append(prefix) or scan(prefix))
+    ce = envir.CondaEnvir(old_ver="3.10", new_ver="3.10", env_to_clone="ds310",
+                          basic_info=fake_basic_info(tmp_path), pin_policy="lower")
+    target = ce.for_target("3.10")
+    _, clean_pips = ce.get_site_pip_deps()
+    clean_pips = pipgraph.prune_pip_deps(clean_pips, prefix, target.get_owned_distinfos)
+    _, clean_pips = target.pin_export_data(["numpy"], clean_pips)
+    assert clean_pips == {"pip": ["watermark>=2.3.1"]}
+    assert lockfile.get_requirements_text(prefix, ce.get_owned_distinfos) == "watermark==2.3.1\n"
+    assert calls == [prefix]
+
+
+def test_get_incompatible(tmp_path, fake_basic_info, make_prefix, make_repodata,
+                          monkeypatch):
+    make_prefix(tmp_path.joinpath("envs", "ds310"))
+    pkgs = tmp_path.joinpath("pkgs")
+    rec = lambda name, build: {"name": name, "version": "1.0", "build": build}
+    make_repodata(pkgs, "forge", [rec("numpy", "py311h1_0"), rec("scipy", "py310h1_0")],
+                  f"{FORGE}/linux-64")
+    make_repodata(pkgs, "other", [rec("scipy", "py311h1_0")], f"{OTHER}/linux-64")
+    monkeypatch.setattr(envir.CondaEnvir, "get_channel_urls",
+                        staticmethod(lambda chans: {FORGE}))
+    kwargs = dict(old_ver="3.10", new_ver="3.11", env_to_clone="ds310",
+                  basic_info=fake_basic_info(tmp_path, pkgs_dirs=[pkgs]),
+                  pin_policy="lower")
+
+    # no cache: the index is not built
+    ce = envir.CondaEnvir(use_cache=False, **kwargs)
+    assert ce.get_incompatible(["numpy", "scipy"]) == set()
+    assert not tmp_path.joinpath(".new_conda_env_cache").exists()
+    # scipy has a 3.11 build in a channel of no use
+    ce = envir.CondaEnvir(**kwargs)
+    assert ce.get_incompatible(["numpy", "scipy"]) == {"scipy"}
+    # no cache: the index built above, read-only
+    ce = envir.CondaEnvir(use_cache=False, **kwargs)
+    assert ce.get_incompatible(["numpy", "scipy"]) == {"scipy"}
+
+
+def test_save_new_yml_no_cache(tmp_path, fake_basic_info, make_prefix):
+    pytest.importorskip("ruamel.yaml")
+    from new_conda_env.leanspec import LeanSpec
+
+    make_prefix(tmp_path.joinpath("envs", "ds310"))
+    ce = envir.CondaEnvir(old_ver="3.10", new_ver="3.11", env_to_clone="ds310",
+                          basic_info=fake_basic_info(tmp_path), use_cache=False)
+    data = {"name": "envpy311", "channels": ["conda-forge"],
+            "dependencies": ["python=3.11", "pip", "numpy", "scipy"]}
+    ce.save_new_yml(LeanSpec(data, header=ce.get_provenance()))
+    text = ce.new_yml.read_text().replace("- numpy", "- numpy>=1.24  # by hand")
+    ce.new_yml.write_text(text)
+
+    # the patch base is next to the file, not in the cache
+    data["dependencies"] = ["python=3.11", "pip", "numpy", "pandas"]
+    text = ce.save_new_yml(LeanSpec(data, header=ce.get_provenance()))
+    assert "- numpy>=1.24  # by hand" in text
+    assert "- pandas" in text and "scipy" not in text
+    assert not tmp_path.joinpath(".new_conda_env_cache").exists()
+
+
+def test_up_to_date_reports(tmp_path, fake_basic_info, make_prefix, monkeypatch, capsys):
+    pytest.importorskip("ruamel.yaml")
+    from new_conda_env.leanspec import LeanSpec
+
+    make_prefix(tmp_path.joinpath("envs", "ds310"))
+    kwargs = dict(old_ver="3.10", new_ver="3.11", env_to_clone="ds310",
+                  basic_info=fake_basic_info(tmp_path), display_new_yml=False,
+                  use_cache=False, promote_pips=True)
+    ce = envir.CondaEnvir(**kwargs)
+    ce.promoted = ["networkx>=3.0"]
+    data = {"name": "envpy311", "channels": ["conda-forge"],
+            "dependencies": ["python=3.11", "pip", "networkx>=3.0"]}
+    ce.save_new_yml(LeanSpec(data, header=ce.get_provenance()))
+
+    ce = envir.CondaEnvir(**kwargs)
+    monkeypatch.setattr(ce, "get_lean_spec", lambda header: pytest.fail("regenerated"))
+    ce.get_new_env_yaml()
+    out = capsys.readouterr().out
+    assert "is up to date" in out and "networkx>=3.0" in out
+
+
+def test_auto_new_ver_no_cache(tmp_path, fake_basic_info, make_prefix, make_repodata,
+                               monkeypatch):
+    make_prefix(tmp_path.joinpath("envs", "ds310"))
+    pkgs = tmp_path.joinpath("pkgs")
+
+    def write_repodata(minors):
+        recs = [{"name": "python", "version": f"{v}.1", "build": "h1_0"} for v in minors]
+        recs += [{"name": name, "version": "1.0", "build": f"py{v.replace('.', '')}h1_0",
+                  "depends": [f"python >={v},<{v}.99"]}
+                 for name in ("numpy", "scipy") for v in minors]
+        make_repodata(pkgs, "forge", recs, f"{FORGE}/linux-64")
+
+    monkeypatch.setattr(envir.CondaEnvir, "get_channel_urls",
+                        staticmethod(lambda chans: {FORGE}))
+    kwargs = dict(old_ver="3.10", new_ver="auto", env_to_clone="ds310",
+                  basic_info=fake_basic_info(tmp_path, pkgs_dirs=[pkgs]))
+    write_repodata(["3.11", "3.12"])
+    cache_dir = tmp_path.joinpath(".new_conda_env_cache")
+
+    # no index yet: no file is written
+    with pytest.raises(ValueError, match="-no_cache"):
+        envir.CondaEnvir(use_cache=False, **kwargs)
+    assert not cache_dir.exists()
+    assert envir.CondaEnvir(**kwargs).new_ver == "3.12"
+    # no cache: the index is read as last refreshed
+    write_repodata(["3.11", "3.12", "3.13"])
+    assert envir.CondaEnvir(use_cache=False, **kwargs).new_ver == "3.12"
+    assert envir.CondaEnvir(**kwargs).new_ver == "3.13"
+
+
+def test_shared_export_data(tmp_path, fake_basic_info, make_prefix, make_dist_info,
+                            monkeypatch):
+    import threading
+
+    prefix = make_prefix(tmp_path.joinpath("envs", "ds310"))
+    make_dist_info(prefix.joinpath("lib", "python3.10", "site-packages"), "watermark", "2.3.1")
+    ce = envir.CondaEnvir(old_ver="3.10", new_ver="3.11", env_to_clone="ds310",
+                          basic_info=fake_basic_info(tmp_path), use_cache=False)
+    monkeypatch.setattr(ce, "get_history_yml", lambda: {"dependencies": ["numpy"]})
+    out = []
+    # the pip reader takes the shared lock again (owned dist-infos)
+    t = threading.Thread(target=lambda: out.append(ce.get_shared_export_data()), daemon=True)
+    t.start()
+    t.join(10)
+    assert out == [({"dependencies": ["numpy"]}, {"pip": ["watermark"]})]
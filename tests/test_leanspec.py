@@ -0,0 +1,76 @@
+# test_leanspec.py
+
+import importlib.util
+
+import pytest
+
+from new_conda_env import envir
+from new_conda_env.leanspec import LeanSpec
+
+
+HAS_CONDA = importlib.util.find_spec("conda") is not None
+
+
+def test_lean_spec():
+    data = {"name": "envpy311", "channels": ["conda-forge"],
+            "dependencies": ["python=3.11", "pip", "numpy", {"pip": ["watermark"]}],
+            "prefix": "/envs/envpy311"}
+    spec = LeanSpec(data, header="# new_conda_env", source="ds310")
+    assert spec.conda_deps == ["python=3.11", "pip", "numpy"]
+    assert spec.pip_deps == ["watermark"]
+    assert spec.to_dict() == data
+    assert spec.to_dict()["dependencies"] is not data["dependencies"]
+    assert "3 conda & 1 pip deps" in repr(spec)
+
+
+@pytest.mark.skipif(not HAS_CONDA, reason="needs conda (yaml & specs formatting)")
+def test_get_lean_spec_no_side_effect(tmp_path, fake_basic_info, capsys, make_prefix):
+    make_prefix(tmp_path.joinpath("envs", "ds310"))
+    site = tmp_path.joinpath("envs", "ds310", "lib", "python3.10", "site-packages")
+    site.mkdir(parents=True)
+    basic_info = fake_basic_info(tmp_path)
+    ce = envir.CondaEnvir(old_ver="3.10", new_ver="3.11", env_to_clone="ds310",
+                          basic_info=basic_info, display_new_yml=False,
+                          use_cache=False)
+    before = sorted(tmp_path.rglob("*"))
+    spec = ce.get_lean_spec()
+    assert sorted(tmp_path.rglob("*")) == before
+    assert capsys.readouterr().out == ""
+
+    assert spec.source == "ds310"
+    assert spec.conda_deps[0] == "python=3.11"
+    text = spec.to_yaml()
+    assert text.startswith("# new_conda_env") and "name: envpy311" in text
+    assert spec.write(ce.new_yml).read_text() == text
+
+
+@pytest.mark.skipif(not HAS_CONDA, reason="needs conda (yaml & specs formatting)")
+def test_get_lean_spec_pips_no_side_effect(tmp_path, fake_basic_info, make_prefix,
+                                           make_dist_info, make_repodata):
+    from new_conda_env import cache, repodata
+
+    prefix = make_prefix(tmp_path.joinpath("envs", "ds310"))
+    make_dist_info(prefix.joinpath("lib", "python3.10", "site-packages"), "watermark", "2.3.1")
+    pkgs = tmp_path.joinpath("pkgs")
+    watermark = {"name": "watermark", "version": "2.4.3", "build": "pyhd8ed1ab_0",
+                 "noarch": "python", "depends": ["python >=3.6"]}
+    make_repodata(pkgs, "forge", [watermark], "https://conda.anaconda.org/conda-forge/noarch")
+    basic_info = fake_basic_info(tmp_path, pkgs_dirs=[pkgs])
+    ce = envir.CondaEnvir(old_ver="3.10", new_ver="3.11", env_to_clone="ds310",
+                          basic_info=basic_info, display_new_yml=False,
+                          use_cache=False, promote_pips=True, pin_policy="lower")
+    before = sorted(tmp_path.rglob("*"))
+    # no repodata index: not built, the pip deps stay on pip
+    spec = ce.get_lean_spec()
+    assert sorted(tmp_path.rglob("*")) == before
+    assert spec.pip_deps == ["watermark>=2.3.1"]
+
+    # existing index: only read
+    db = tmp_path.joinpath(cache.CACHE_DIRNAME, repodata.INDEX_FILENAME)
+    index = repodata.RepodataIndex(db, [pkgs])
+    index.refresh()
+    index.close()
+    before = sorted(tmp_path.rglob("*"))
+    spec = ce.get_lean_spec()
+    assert sorted(tmp_path.rglob("*")) == before
+    assert "watermark>=2.3.1" in spec.conda_deps and not spec.pip_deps
@@ -0,0 +1,42 @@
+# test_locator.py
+
+import pytest
+
+from new_conda_env import locator
+
+
+def test_env_locator(tmp_path, make_env):
+    first, second, other = (tmp_path.joinpath(d) for d in ("envs", "envs2", "other"))
+    root = make_env(tmp_path.joinpath("miniconda"))
+    make_env(first.joinpath("ds310"))
+    make_env(second.joinpath("ds310"))
+    make_env(second.joinpath("geo310"))
+    registered = make_env(other.joinpath("proj"))
+    first.joinpath("not_an_env").mkdir()
+    env_txt = tmp_path.joinpath("environments.txt")
+    env_txt.write_text(f"{registered}\n{second.joinpath('ds310')}\n")
+
+    loc = locator.EnvLocator([first, second], env_txt, root_prefix=root)
+    assert loc.locate("ds310") == first.joinpath("ds310")   # first dir wins
+    assert loc.locate("geo310") == second.joinpath("geo310")
+    assert loc.locate("proj") == registered
+    assert loc.locate("base") == root
+    assert loc.locate(str(second.joinpath("ds310"))) == second.joinpath("ds310")
+    assert sorted(loc.envs()) == ["ds310", "geo310", "proj"]
+
+    with pytest.raises(FileNotFoundError, match="Typo"):
+        loc.locate("not_an_env")
+    with pytest.raises(FileNotFoundError):
+        loc.locate(str(first.joinpath("not_an_env")))
+
+    # index reused while the dirs are unchanged, rebuilt on a miss
+    index = loc.get_index()
+    assert loc.get_index() is index
+    make_env(second.joinpath("new310"))
+    assert loc.locate("new310") == second.joinpath("new310")
+
+
+def test_get_locator(tmp_path, fake_basic_info):
+    info = fake_basic_info(tmp_path)
+    assert locator.get_locator(info) is locator.get_locator(dict(info))
+    assert locator.get_locator(info).envs_dirs == [tmp_path.joinpath("envs")]
@@ -0,0 +1,65 @@
+# test_lockfile.py
+
+import json
+
+import pytest
+
+from new_conda_env import lockfile
+
+
+CHANNEL = "https://conda.anaconda.org/conda-forge"
+RECORDS = [
+    # name, version, build, subdir, depends
+    ("numpy", "1.24.1", "py310h08bbf29_0", "linux-64", ["python >=3.10,<3.11.0a0", "libzlib"]),
+    ("python", "3.10.8", "h4a9ceb5_0_cpython", "linux-64", ["libzlib >=1.2.13"]),
+    ("libzlib", "1.2.13", "h166bdaf_4", "linux-64", []),
+    ("watermark", "2.3.1", "pyhd8ed1ab_0", "noarch", ["python >=3.6"]),
+]
+
+
+@pytest.fixture
+def locked_env(make_prefix, make_dist_info):
+    """locked_env(prefix): an env with the full conda-meta records of
+    RECORDS & a pip-installed tqdm.
+    """
+    def make(prefix):
+        make_prefix(prefix, installed=[])
+        for name, ver, build, subdir, depends in RECORDS:
+            fn = f"{name}-{ver}-{build}.conda"
+            rec = {"name": name, "version": ver, "build": build, "subdir": subdir,
+                   "fn": fn, "depends": depends, "md5": "0" * 31 + str(len(name)),
+                   "sha256": "f" * 64,
+                   "url": f"{CHANNEL}/{subdir}/{fn}"}
+            prefix.joinpath("conda-meta", fn[:-len(".conda")] + ".json").write_text(
+                json.dumps(rec))
+        make_dist_info(prefix.joinpath("lib", "python3.10", "site-packages"), "tqdm", "4.64.1")
+        return prefix
+    return make
+
+
+def test_explicit_lines(tmp_path, locked_env):
+    records = lockfile.read_prefix_records(locked_env(tmp_path))
+    lines = lockfile.explicit_lines(records)
+    # dependency order
+    names = [line.rsplit("/", 1)[1].split("-")[0] for line in lines]
+    assert names == ["libzlib", "python", "numpy", "watermark"]
+    assert lines[0] == f"{CHANNEL}/linux-64/libzlib-1.2.13-h166bdaf_4.conda#{'0' * 31}7"
+    assert lockfile.explicit_lines(records, "sha256")[0].endswith("#sha256:" + "f" * 64)
+    assert lockfile.get_platform(records) == "linux-64"
+
+    records[0]["url"] = None
+    assert "# no URL for: libzlib-1.2.13-h166bdaf_4.conda" in lockfile.explicit_lines(records)
+
+
+def test_remove_auth():
+    url = "https://user:pw@conda.anaconda.org/t/tk-123abc/private/linux-64/x-1-0.conda"
+    assert lockfile.remove_auth(url) == "https://conda.anaconda.org/private/linux-64/x-1-0.conda"
+
+
+def test_write_lockfiles(tmp_path, locked_env):
+    prefix = locked_env(tmp_path.joinpath("ds310"))
+    explicit, reqs = tmp_path.joinpath("e.txt"), tmp_path.joinpath("r.txt")
+    assert lockfile.write_lockfiles(prefix, explicit, reqs) == [explicit, reqs]
+    text = explicit.read_text()
+    assert "\n@EXPLICIT\n" in text and "# platform: linux-64" in text
+    assert reqs.read_text() == "tqdm==4.64.1\n"
@@ -0,0 +1,52 @@
+# test_pins.py
+
+import pytest
+
+from new_conda_env import pins
+
+
+SPECS = ["python=3.10", "numpy", "conda-forge::scipy", "pandas>=1.5", "tzdata"]
+VERSIONS = {"python": "3.10.8", "numpy": "1.24.1", "scipy": "1.10.0",
+            "pandas": "1.5.3", "tzdata": "2022g"}
+
+
+@pytest.mark.parametrize("policy, expected", [
+    ("none", SPECS),
+    ("lower", ["python=3.10", "numpy>=1.24.1", "conda-forge::scipy>=1.10.0",
+               "pandas>=1.5", "tzdata>=2022g"]),
+    ("major", ["python=3.10", "numpy=1.*", "conda-forge::scipy=1.*",
+               "pandas>=1.5", "tzdata=2022.*"]),
+    ("exact", ["python=3.10", "numpy==1.24.1", "conda-forge::scipy==1.10.0",
+               "pandas>=1.5", "tzdata==2022g"]),
+])
+def test_pin_specs(policy, expected):
+    assert pins.pin_specs(SPECS, VERSIONS, policy, skip={"python"}) == expected
+
+
+def test_pin_specs_overrides():
+    overrides = pins.parse_overrides(["numpy:none", "scipy:>=1.9,<2", "tzdata:exact"])
+    out = pins.pin_specs(SPECS, VERSIONS, "lower", overrides, skip={"python"},
+                         incompatible={"scipy", "tzdata"})
+    # incompatible: only a constraint override applies
+    assert out == ["python=3.10", "numpy", "conda-forge::scipy>=1.9,<2",
+                   "pandas>=1.5", "tzdata"]
+
+
+def test_parse_overrides_error():
+    with pytest.raises(ValueError):
+        pins.parse_overrides(["numpy=1.24"])
+    with pytest.raises(ValueError):
+        pins.parse_overrides(["numpy:minor"])
+
+
+def test_pip_pins(tmp_path, make_prefix, make_dist_info):
+    prefix = make_prefix(tmp_path)
+    assert pins.read_conda_versions(prefix)["numpy"] == "1.24.1"
+    site = prefix.joinpath("lib", "python3.10", "site-packages")
+    make_dist_info(site, "Matplotlib_Venn", "0.11.7")
+    make_dist_info(site, "requests", "2.28.2")
+    versions = pins.read_pip_versions(prefix)
+    assert versions == {"matplotlib-venn": "0.11.7", "requests": "2.28.2"}
+    pips = ["matplotlib_venn", "requests[socks]; python_version >= '3.8'", "tqdm>=4"]
+    assert pins.pin_specs(pips, versions, "major", pip=True) == [
+        "matplotlib_venn==0.*", "requests[socks]==2.*; python_version >= '3.8'", "tqdm>=4"]
@@ -0,0 +1,40 @@
+# test_pipgraph.py
+
+import pytest
+
+from new_conda_env import pipgraph
+
+
+@pytest.fixture
+def env(tmp_path, make_prefix, make_dist_info):
+    prefix = make_prefix(tmp_path)
+    prefix.joinpath("conda-meta", "tqdm-4.64.1-pyhd8ed1ab_0.json").write_text("{}")
+    site = prefix.joinpath("lib", "python3.10", "site-packages")
+    # conda-owned: its requirements are installed by conda
+    make_dist_info(site, "scipy", "1.10.0", "conda", ["numpy"])
+    make_dist_info(site, "black", "23.1.0", "pip",
+                   ["click>=8.0.0", "Platformdirs>=2",
+                    "colorama>=0.4.3 ; extra == 'colorama'"])
+    make_dist_info(site, "click", "8.1.3", "pip")
+    make_dist_info(site, "platformdirs", "3.0.0", "pip")
+    make_dist_info(site, "colorama", "0.4.6", "pip")
+    make_dist_info(site, "tqdm", "4.64.1", "pip")          # provided by conda
+    # a cycle required by no other dist
+    make_dist_info(site, "cyc_a", "1.0", "pip", ["cyc-b"])
+    make_dist_info(site, "cyc_b", "1.0", "pip", ["cyc_a ; python_version >= '3'"])
+    return prefix
+
+
+def test_get_pip_roots(env):
+    assert pipgraph.get_pip_roots(env) == {"black", "colorama", "cyc-a"}
+
+
+def test_prune_pip_deps(tmp_path, env, make_prefix):
+    pip_deps = {"pip": ["black==23.1.0", "click==8.1.3", "colorama", "cyc-b",
+                        "tqdm", "https://example.com/x.tar.gz"]}
+    expected = {"pip": ["black==23.1.0", "colorama", "https://example.com/x.tar.gz"]}
+    assert pipgraph.prune_pip_deps(pip_deps, env) == expected
+    assert pipgraph.prune_pip_deps({"pip": ["click"]}, env) is None
+    # no site-packages: unchanged
+    no_site = make_prefix(tmp_path.joinpath("other"))
+    assert pipgraph.prune_pip_deps(pip_deps, no_site) is pip_deps
@@ -0,0 +1,66 @@
+# test_pipspec.py
+
+import pytest
+
+from new_conda_env import pipspec
+import new_conda_env.processing as proc
+
+
+PIPS = ["watermark==2.3.1",
+        "requests[security, socks]>=2.28,<3 ; python_version >= '3.8'",
+        "torch==2.0.1+cpu",
+        "foo===1!2.0",
+        "bar~=1.4.2",
+        "pkg @ https://example.com/pkg-1.0-py3-none-any.whl",
+        "https://example.com/dl/tool-0.3.1.tar.gz",
+        "-e git+https://github.com/org/proj.git@main#egg=proj",
+        "numpy",
+        ]
+
+
+def test_parse_requirements():
+    reqs = pipspec.parse_requirements(PIPS + ["", "# comment"])
+    assert len(reqs) == len(PIPS)
+    r = reqs[1]
+    assert r["name"] == "requests"
+    assert r["extras"] == ["security", "socks"]
+    assert r["specifier"] == ">=2.28,<3"
+    assert r["marker"] == "python_version >= '3.8'"
+    assert reqs[2]["specifier"] == "==2.0.1+cpu"
+    assert reqs[5]["url"] == "https://example.com/pkg-1.0-py3-none-any.whl"
+    assert reqs[6]["name"] == "tool"
+    assert reqs[7]["editable"] and reqs[7]["name"] == "proj"
+    assert reqs[8]["specifier"] == ""
+
+
+@pytest.mark.parametrize("policy, expected", [
+    ("strip", ["watermark",
+               "requests[security,socks]; python_version >= '3.8'",
+               "torch", "foo", "bar"]),
+    ("keep", ["watermark==2.3.1",
+              "requests[security,socks]>=2.28,<3; python_version >= '3.8'",
+              "torch==2.0.1+cpu", "foo===1!2.0", "bar~=1.4.2"]),
+    ("major", ["watermark==2.*",
+               "requests[security,socks]>=2.28,<3; python_version >= '3.8'",
+               "torch==2.*", "foo==1!2.*", "bar==1.*"]),
+])
+def test_normalize_requirements(policy, expected):
+    out = pipspec.normalize_requirements(PIPS, policy)
+    assert out[:5] == expected
+    # urls & editables are kept
+    assert out[5:] == ["pkg @ https://example.com/pkg-1.0-py3-none-any.whl",
+                       "https://example.com/dl/tool-0.3.1.tar.gz",
+                       "-e git+https://github.com/org/proj.git@main#egg=proj",
+                       "numpy"]
+
+
+def test_policy_error():
+    with pytest.raises(ValueError):
+        pipspec.normalize_requirements(PIPS, "minor")
+
+
+def test_get_pip_deps_policy():
+    data = {"dependencies": ["python=3.10", {"pip": ["tqdm==4.64.1", "black==23.1.0"]}]}
+    assert proc.get_pip_deps(data) == {"pip": ["tqdm", "black"]}
+    assert proc.get_pip_deps(data, policy="major") == {"pip": ["tqdm==4.*", "black==23.*"]}
+    assert proc.get_pip_deps(data, strip_ver=False) is data["dependencies"][1]
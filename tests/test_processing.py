@@ -1,4 +1,13 @@
+import io
+import os
+import sys
+import json
+import shutil
+import subprocess
 from pathlib import Path
+
+import pytest
+
 from new_conda_env import processing as proc
 
 
@@ -7,3 +16,181 @@ def test_path2str():
     to_str_win = proc.path2str(some_user_dir, win_os=True)
     to_str_other = proc.path2str(some_user_dir, win_os=False)
     assert to_str_win == str(to_str_other).replace("/", "\\")
+
+
+def test_spec_name():
+    assert proc.spec_name("numpy") == "numpy"
+    assert proc.spec_name("python=3.10") == "python"
+    assert proc.spec_name("numpy >=1.20,<2") == "numpy"
+    assert proc.spec_name("conda-forge::scipy[build=py310*]") == "scipy"
+    assert proc.spec_name("https://conda.anaconda.org/conda-forge::pandas>=1") == "pandas"
+
+
+def test_get_history_specs(tmp_path, make_prefix):
+    prefix = make_prefix(tmp_path)
+    # as per `conda env export --from-history`: pandas was removed, seaborn
+    # is not installed & the request without '# cmd' is not a user request
+    expected = ["python=3.10", "numpy>=1.24", "conda-forge::scipy"]
+    assert proc.get_history_specs(prefix, canonical=False) == expected
+
+
+@pytest.mark.skipif(shutil.which("conda") is None or not os.getenv("CONDA_PREFIX"),
+                    reason="needs a conda installation")
+def test_get_history_specs_parity():
+    prefix = Path(os.getenv("CONDA_PREFIX"))
+    cmd = ["conda", "env", "export", "-p", str(prefix), "--from-history", "--json"]
+    out = subprocess.run(cmd, capture_output=True, text=True, check=True).stdout
+    exported = json.loads(out)["dependencies"]
+    assert proc.get_history_specs(prefix) == exported
+
+
+def test_get_site_pip_deps(tmp_path, make_prefix, make_dist_info):
+    prefix = make_prefix(tmp_path)
+    site = tmp_path.joinpath("lib", "python3.10", "site-packages")
+    rel = "lib/python3.10/site-packages"
+
+    make_dist_info(site, "numpy", "1.24.1", "conda")
+    make_dist_info(site, "scipy", "1.10.0")    # conda-built with pip: owned
+    make_dist_info(site, "Matplotlib_Venn", "0.11.7")
+    make_dist_info(site, "watermark", "2.3.1")
+    rec = {"files": [f"{rel}/scipy-1.10.0.dist-info/METADATA"]}
+    tmp_path.joinpath("conda-meta", "scipy-1.10.0-py310h8deb116_0.json").write_text(json.dumps(rec))
+
+    expected = {"pip": ["matplotlib-venn==0.11.7", "watermark==2.3.1"]}
+    assert proc.get_site_pip_deps(prefix, strip_ver=False) == expected
+    expected = {"pip": ["matplotlib-venn", "watermark"]}
+    assert proc.get_site_pip_deps(prefix) == expected
+
+    with pytest.raises(FileNotFoundError):
+        proc.get_site_pip_deps(tmp_path.joinpath("no_env"))
+
+
+def test_run_exports():
+    import time
+
+    def runner(cmd):
+        if cmd == "slow":
+            raise subprocess.TimeoutExpired(cmd, 0.5)
+        if cmd == "bad":
+            raise subprocess.CalledProcessError(1, cmd)
+        time.sleep(0.3)
+        return {"name": cmd}
+
+    t0 = time.perf_counter()
+    ymls = proc.run_exports(["a", "b"], runner=runner)
+    assert time.perf_counter() - t0 < 0.55
+    assert ymls == {"a": {"name": "a"}, "b": {"name": "b"}}
+
+    with pytest.raises(proc.ExportError) as err:
+        proc.run_exports(["a", "bad", "slow"], timeout=0.5, runner=runner)
+    errors = err.value.errors
+    assert set(errors) == {"bad", "slow"}
+    assert isinstance(errors["bad"], subprocess.CalledProcessError)
+    assert isinstance(errors["slow"], subprocess.TimeoutExpired)
+
+
+def py_cmd(code: str) -> list:
+    return [sys.executable, "-c", code]
+
+
+def test_stream_export():
+    code = "import sys\nfor i in range(100000): print(f'- pkg{i}')\n" \
+           "print('done', file=sys.stderr)"
+    # the parser consumes the stream line by line
+    n = proc.stream_export(py_cmd(code), parse=lambda f: sum(1 for _ in f))
+    assert n == 100000
+    assert proc.run_export(py_cmd("print('name: x')")) == "name: x\n"
+
+    with pytest.raises(subprocess.CalledProcessError) as err:
+        proc.stream_export(py_cmd("import sys; sys.exit('boom')"))
+    assert "boom" in err.value.stderr
+
+
+@pytest.mark.skipif(proc.winOS, reason="POSIX process group")
+def test_stream_export_timeout():
+    import time
+    # the child spawns a grandchild holding the pipes open: the whole
+    # process group must be killed for the call to return
+    code = "import subprocess, sys, time\n" \
+           "subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(30)'])\n" \
+           "print('partial', flush=True); time.sleep(30)"
+    t0 = time.perf_counter()
+    with pytest.raises(subprocess.TimeoutExpired):
+        proc.stream_export(py_cmd(code), timeout=0.5)
+    assert time.perf_counter() - t0 < 5
+
+
+EXPORT = """\
+name: ds310
+channels:
+  - conda-forge
+  - defaults
+dependencies:
+  - python=3.10.8
+  - conda-forge::numpy=1.24.1
+  - 'zlib=1.2.13'
+  - pip:
+    - matplotlib-venn==0.11.7
+    - watermark==2.3.1
+prefix: /home/user/miniconda3/envs/ds310
+"""
+
+
+def test_parse_export():
+    expected = {"name": "ds310",
+                "channels": ["conda-forge", "defaults"],
+                "dependencies": ["python=3.10.8", "conda-forge::numpy=1.24.1",
+                                 "zlib=1.2.13",
+                                 {"pip": ["matplotlib-venn==0.11.7",
+                                          "watermark==2.3.1"]}],
+                "prefix": "/home/user/miniconda3/envs/ds310"}
+    assert proc.parse_export(EXPORT) == expected
+    # streamed
+    assert proc.parse_export(io.StringIO(EXPORT)) == expected
+    assert proc.load_as_yml(EXPORT, round_trip=False) == expected
+    assert proc.get_pip_deps(proc.parse_export(EXPORT)) == \
+        {"pip": ["matplotlib-venn", "watermark"]}
+
+
+def test_parse_export_fallback(monkeypatch):
+    # other yaml constructs go to the yaml loader, with the whole stream
+    text = EXPORT.replace("prefix:", "variables:\n  FOO: bar\nprefix:")
+    monkeypatch.setattr(proc, "yaml_safe_load", lambda t: t)
+    assert proc.parse_export(io.StringIO(text)) == text
+
+
+def test_merge_deps():
+    deps = ["numpy", "python>=3.10", "pandas", "conda-forge::python=3.10.4",
+            "wheel", "numpy>=1.24", "pip", {"pip": ["watermark==2.3.1"]}]
+    pips = {"pip": ["watermark", "matplotlib-venn"]}
+    expected = ["python=3.11", "pip", "numpy", "pandas", "wheel", "setuptools",
+                {"pip": ["watermark==2.3.1", "matplotlib-venn"]}]
+    assert proc.merge_deps(deps, "python", "3.11", True, pips) == expected
+
+    expected = ["python=3.9", "pip", "numpy"]
+    assert proc.merge_deps(["python=3.10", "numpy"], "python", "3.9", False) == expected
+    assert proc.merge_deps([], "python", "3.9", False) == ["python=3.9", "pip"]
+
+
+def test_merge_deps_pip_urls():
+    pips = ["-e git+https://github.com/u/x.git#egg=x",
+            "-e git+https://github.com/u/y.git#egg=y",
+            "https://example.com/dists/a.tar.gz",
+            "https://example.com/dists/b.tar.gz",
+            "Watermark @ https://example.com/dists/watermark-2.3.1-py3-none-any.whl"]
+    deps = ["numpy", {"pip": pips}]
+    more = {"pip": ["watermark==2.3.1", "-e git+https://github.com/u/x.git#egg=x",
+                    "https://example.com/dists/b.tar.gz"]}
+    merged = proc.merge_deps(deps, "python", "3.11", False, more)
+    assert merged == ["python=3.11", "pip", "numpy", {"pip": pips}]
+
+
+def test_merge_deps_many():
+    import time
+    deps = [f"pkg{i}" for i in range(20000)] + ["python=3.10"] \
+        + [f"pkg{i}>=1" for i in range(0, 20000, 2)]
+    t0 = time.perf_counter()
+    merged = proc.merge_deps(deps, "python", "3.11", True)
+    assert time.perf_counter() - t0 < 1
+    assert len(merged) == 20000 + 4
+    assert merged[:3] == ["python=3.11", "pip", "pkg0"]
@@ -0,0 +1,33 @@
+# test_profiling.py
+
+import json
+
+from new_conda_env.profiling import Timings
+
+
+def test_timings_disabled():
+    timings = Timings()
+    # the same no-op context manager: nothing allocated or recorded
+    assert timings.stage("a") is timings.stage("b")
+    with timings.stage("a"):
+        pass
+    assert timings.records == []
+    assert timings.report()["total"] == 0
+
+
+def test_timings_enabled():
+    timings = Timings(enabled=True)
+    with timings.stage("export_data"):
+        with timings.stage("history"):
+            pass
+        with timings.stage("pip"):
+            pass
+    with timings.stage("save"):
+        pass
+
+    names = [r["stage"] for r in timings.records]
+    assert names == ["export_data.history", "export_data.pip", "export_data", "save"]
+    report = json.loads(timings.to_json(env="ds310"))
+    assert report["env"] == "ds310"
+    top = report["stages"][2]["seconds"] + report["stages"][3]["seconds"]
+    assert abs(report["total"] - top) < 1e-9
@@ -0,0 +1,82 @@
+# test_provenance.py
+
+from new_conda_env import provenance
+
+
+YML = """name: envpy311
+channels:
+  - conda-forge
+dependencies:
+  - python=3.11
+  - pip
+  - numpy>=1.24  # pinned by hand
+  - scipy
+  - pip:
+      - watermark
+      - plotly
+prefix: /envs/envpy311
+"""
+
+BASE = ["python=3.11", "pip", "numpy", "scipy", {"pip": ["watermark", "plotly"]}]
+
+
+def test_header(tmp_path):
+    header = provenance.format_header("0.1.0", "ds310", "3.10", "3.11", "0123abcd")
+    assert header == "# new_conda_env 0.1.0: ds310 (3.10 -> 3.11), fingerprint 0123abcd"
+    yml = tmp_path.joinpath("lean.yml")
+    assert provenance.read_header(yml) is None
+    yml.write_text(YML)
+    assert provenance.read_header(yml) is None
+    yml.write_text(header + "\n" + YML)
+    assert provenance.read_header(yml) == header
+
+
+def test_sidecar(tmp_path):
+    header = provenance.format_header("0.1.0", "ds310", "3.10", "3.11", "0123abcd")
+    yml = tmp_path.joinpath("lean.yml")
+    assert provenance.read_sidecar(yml) is None
+    yml.write_text(header + "\n" + YML)
+    path = provenance.write_sidecar(yml, header, BASE, promoted=["networkx"])
+    assert path == tmp_path.joinpath(".lean.yml.base.json")
+    record = provenance.read_sidecar(yml)
+    assert record["dependencies"] == BASE and record["promoted"] == ["networkx"]
+    # the yml file of another generation
+    yml.write_text(header.replace("0123abcd", "4567ef01") + "\n" + YML)
+    assert provenance.read_sidecar(yml) is None
+
+
+def test_patch_deps_unchanged():
+    lines = YML.splitlines()
+    assert provenance.patch_deps(lines, BASE, BASE) == lines
+    assert provenance.patch_deps(["name: x"], BASE, BASE) is None
+
+
+def test_patch_deps():
+    # the user pinned numpy: their line is kept though numpy was removed;
+    # scipy & plotly removed, pandas & a pip dep added, new kernel version
+    new = ["python=3.12", "pip", "pandas", {"pip": ["watermark", "tqdm"]}]
+    patched = provenance.patch_deps(YML.splitlines(), BASE, new)
+    assert "\n".join(patched) + "\n" == """name: envpy311
+channels:
+  - conda-forge
+dependencies:
+  - python=3.12
+  - pip
+  - numpy>=1.24  # pinned by hand
+  - pandas
+  - pip:
+      - watermark
+      - tqdm
+prefix: /envs/envpy311
+"""
+
+
+def test_patch_deps_pip_block():
+    lines = YML.splitlines()
+    new = ["python=3.11", "pip", "numpy", "scipy"]
+    patched = provenance.patch_deps(lines, BASE, new)
+    assert not any("pip:" in line or "watermark" in line for line in patched)
+
+    back = provenance.patch_deps(patched, new, BASE)
+    assert back[-4:] == ["  - pip:", "      - watermark", "      - plotly",
+                         "prefix: /envs/envpy311"]
@@ -0,0 +1,71 @@
+# test_pypimap.py
+
+import pytest
+
+from new_conda_env import pypimap, repodata
+
+
+ROWS = [("networkx", ">=3.8"), ("typing_extensions", "*"), ("pytorch", "3.10"),
+        ("pytorch", "3.11"), ("graphviz", "*"), ("scikit-learn", "3.10"),
+        ("ruamel.yaml", "3.11")]
+
+
+def test_lookup():
+    name_map = pypimap.CondaNameMap(ROWS)
+    assert name_map.lookup("networkx", "3.11") == "networkx"
+    assert name_map.lookup("Typing-Extensions", "3.12") == "typing_extensions"
+    assert name_map.lookup("ruamel_yaml", "3.11") == "ruamel.yaml"
+    assert name_map.lookup("torch", "3.11") == "pytorch"
+    # no build for the target
+    assert name_map.lookup("torch", "3.12") is None
+    assert name_map.lookup("scikit-learn", "3.11") is None
+    # aliased to a name absent from the index: not graphviz (the C library)
+    assert name_map.lookup("graphviz", "3.11") is None
+    assert name_map.lookup("watermark", "3.11") is None
+
+
+def test_promote_pip_deps():
+    name_map = pypimap.CondaNameMap(ROWS)
+    pip_deps = {"pip": ["networkx>=3.0", "torch==2.*", "watermark",
+                        "typing-extensions~=4.4", "ruamel.yaml; python_version > '3'"]}
+    conda_specs, pips = pypimap.promote_pip_deps(pip_deps, name_map, "3.11")
+    # the wildcard equality in its conda form
+    assert conda_specs == ["networkx>=3.0", "pytorch=2.*"]
+    assert pips == {"pip": ["watermark", "typing-extensions~=4.4",
+                            "ruamel.yaml; python_version > '3'"]}
+    assert pypimap.promote_pip_deps({"pip": ["networkx"]}, name_map, "3.11") == (
+        ["networkx"], None)
+
+
+@pytest.mark.parametrize("specifier, expected", [
+    ("", ""),
+    (">=3.0", ">=3.0"),
+    ("==2.*", "=2.*"),
+    ("==2.1.*", "=2.1.*"),
+    (">=2.1,!=2.3.*", ">=2.1,!=2.3.*"),
+    ("==2.1", "==2.1"),
+    ("~=4.4", None),
+    ("===1.0", None),
+    (">=2.*", None),
+])
+def test_conda_specifier(specifier, expected):
+    assert pypimap.conda_specifier(specifier) == expected
+
+
+def test_get_name_map(tmp_path, make_repodata):
+    rec = {"name": "networkx", "version": "3.0", "build": "pyhd8ed1ab_0",
+           "noarch": "python", "depends": ["python >=3.8"]}
+    make_repodata(tmp_path.joinpath("pkgs"), "abc", [rec],
+                  "https://conda.anaconda.org/conda-forge/noarch")
+    index = repodata.RepodataIndex(tmp_path.joinpath("idx.sqlite"), [tmp_path.joinpath("pkgs")])
+    try:
+        index.refresh()
+        name_map = pypimap.get_name_map(index)
+        assert name_map.lookup("networkx", "3.11") == "networkx"
+        # unchanged index: same map
+        assert pypimap.get_name_map(index) is name_map
+        # the repodata of another channel only
+        other = pypimap.get_name_map(index, {"https://conda.anaconda.org/other"})
+        assert other.lookup("networkx", "3.11") is None
+    finally:
+        index.close()
@@ -0,0 +1,129 @@
+# test_repodata.py
+
+import json
+import os
+
+from new_conda_env import repodata
+
+
+def rec(name, version, build, depends=(), noarch=None):
+    d = {"name": name, "version": version, "build": build,
+         "depends": list(depends)}
+    if noarch:
+        d["noarch"] = noarch
+    return d
+
+
+LINUX = [
+    rec("python", "3.10.13", "hd12c33a_0"),
+    rec("python", "3.11.7", "hab00c5b_1"),
+    rec("python", "3.12.1", "hab00c5b_1"),
+    rec("numpy", "1.26.3", "py310hb13e2d6_0", ["python >=3.10,<3.11.0a0"]),
+    rec("numpy", "1.26.3", "py311h64a7726_0", ["python >=3.11,<3.12.0a0"]),
+    rec("numpy", "1.26.3", "py312heda63a1_0", ["python >=3.12,<3.13.0a0"]),
+    rec("scipy", "1.11.4", "py310hb13e2d6_0", ["python >=3.10,<3.11.0a0"]),
+    rec("scipy", "1.11.4", "py311h64a7726_0", ["python >=3.11,<3.12.0a0"]),
+    rec("libzlib", "1.2.13", "hd590300_5", ["libgcc-ng >=12"]),
+]
+NOARCH = [
+    rec("watermark", "2.4.3", "pyhd8ed1ab_0", ["python >=3.6"], noarch="python"),
+    rec("new_lib", "1.0", "pyhd8ed1ab_0", ["python >=3.12"], noarch="python"),
+]
+
+
+FORGE = "https://conda.anaconda.org/conda-forge"
+MAIN = "https://repo.anaconda.com/pkgs/main"
+
+
+def write_repodata(cache_dir, name, records, url=f"{FORGE}/linux-64"):
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    data = {"info": {}, "packages": {},
+            "packages.conda": {f"{r['name']}-{r['version']}-{r['build']}.conda": r
+                               for r in records}}
+    f = cache_dir.joinpath(f"{name}.json")
+    f.write_text(json.dumps(data))
+    cache_dir.joinpath(f"{name}.info.json").write_text(json.dumps({"url": url}))
+    return f
+
+
+def test_record_pymins():
+    assert repodata.record_pymins(LINUX[0]) == {"3.10"}
+    assert repodata.record_pymins(LINUX[3]) == {"3.10"}
+    assert repodata.record_pymins(LINUX[-1]) == {repodata.ANY}
+    assert repodata.record_pymins(NOARCH[0]) == {">=3.6"}
+    abi = rec("pkg", "1", "h123_0", ["python_abi 3.11.* *_cp311"])
+    assert repodata.record_pymins(abi) == {"3.11"}
+    assert repodata.supports({">=3.6"}, "3.12")
+    assert not repodata.supports({">=3.12"}, "3.11")
+    assert not repodata.supports({"3.10", "3.11"}, "3.12")
+
+
+def test_best_python_version(tmp_path):
+    pkgs = tmp_path.joinpath("pkgs")
+    cache_dir = pkgs.joinpath("cache")
+    write_repodata(cache_dir, "linux", LINUX)
+    noarch = write_repodata(cache_dir, "noarch", NOARCH[:1])
+
+    index = repodata.RepodataIndex(tmp_path.joinpath("idx.sqlite"), [pkgs])
+    assert len(index.refresh()) == 2
+    assert index.python_minors() == ["3.12", "3.11", "3.10"]
+
+    best, unknown = index.best_python_version(["numpy", "watermark", "libzlib"])
+    assert (best, unknown) == ("3.12", [])
+    best, unknown = index.best_python_version(["numpy", "scipy", "notthere"])
+    assert (best, unknown) == ("3.11", ["notthere"])
+    assert index.best_python_version(["scipy"], candidates=["3.12"])[0] is None
+
+    # unchanged files are not re-indexed
+    assert index.refresh() == []
+
+    # changed file: re-indexed, stale rows dropped
+    write_repodata(cache_dir, "noarch", NOARCH[1:])
+    st = noarch.stat()
+    os.utime(noarch, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    assert index.refresh() == [noarch]
+    assert index.get_pymins(["watermark", "new_lib"]) == {"new_lib": {">=3.12"}}
+    assert index.best_python_version(["new_lib", "numpy"])[0] == "3.12"
+
+    # removed file
+    noarch.unlink()
+    assert index.refresh() == []
+    assert index.get_pymins(["new_lib"]) == {}
+    index.close()
+
+
+def test_channel_filter(tmp_path):
+    pkgs = tmp_path.joinpath("pkgs")
+    cache_dir = pkgs.joinpath("cache")
+    write_repodata(cache_dir, "forge", LINUX)
+    write_repodata(cache_dir, "main", [rec("python", "3.13.1", "h123_0"),
+                                       rec("numpy", "2.1.0", "py313h123_0")],
+                   url=f"{MAIN}/linux-64")
+    write_repodata(cache_dir, "token", NOARCH[:1],
+                   url="https://conda.anaconda.org/t/abc-123/private/noarch/repodata.json")
+
+    index = repodata.RepodataIndex(tmp_path.joinpath("idx.sqlite"), [pkgs])
+    index.refresh()
+    assert index.best_python_version(["numpy"])[0] == "3.13"
+    assert index.best_python_version(["numpy"], channels={FORGE})[0] == "3.12"
+    assert index.python_minors(channels={MAIN}) == ["3.13"]
+    assert index.get_pymins(["watermark"], channels={FORGE, MAIN}) == {}
+    private = {"https://conda.anaconda.org/private"}
+    assert index.get_pymins(["watermark"], channels=private) == {"watermark": {">=3.6"}}
+    assert len(index.get_sig(channels={MAIN})) == 1
+    index.close()
+
+
+def test_schema_upgrade(tmp_path):
+    import sqlite3
+
+    db = tmp_path.joinpath("idx.sqlite")
+    con = sqlite3.connect(str(db))
+    con.execute("CREATE TABLE sources (id INTEGER PRIMARY KEY, path TEXT)")
+    con.commit()
+    con.close()
+    write_repodata(tmp_path.joinpath("pkgs", "cache"), "forge", LINUX)
+    index = repodata.RepodataIndex(db, [tmp_path.joinpath("pkgs")])
+    assert len(index.refresh()) == 1
+    assert index.python_minors(channels={FORGE}) == ["3.12", "3.11", "3.10"]
+    index.close()
@@ -0,0 +1,55 @@
+# test_server.py
+
+import threading
+
+import pytest
+
+from new_conda_env import server
+
+
+@pytest.fixture
+def info(tmp_path, fake_basic_info):
+    info = fake_basic_info(tmp_path)
+    info["user_condarc"].write_text("channels:\n  - conda-forge\n")
+    info["env_dir"].mkdir()
+    return info
+
+
+class CondaInfoNoReset(server.CondaInfo):
+    resets = 0
+
+    def reset_context(self):
+        self.resets += 1
+
+
+def test_conda_info_reload(info):
+    holder = CondaInfoNoReset(loader=lambda: info)
+    assert holder.get() is info
+    assert holder.resets == 0
+    info["user_condarc"].write_text("channels:\n  - defaults\n  - conda-forge\n")
+    holder.get()
+    assert holder.resets == 1
+
+
+@pytest.mark.skipif(not hasattr(server.socket, "AF_UNIX"), reason="needs Unix sockets")
+def test_serve_and_submit(tmp_path, info):
+    sock = tmp_path.joinpath("s.sock")
+    with pytest.raises(ConnectionError):
+        server.submit({"envs": ["ds310"]}, sock)
+
+    with server.EnvServer(sock, CondaInfoNoReset(loader=lambda: info)) as srv:
+        t = threading.Thread(target=srv.serve_forever, daemon=True)
+        t.start()
+        assert server.is_serving(sock)
+        with pytest.raises(RuntimeError):
+            server.EnvServer(sock)
+
+        assert "error" in server.submit({"envs": []}, sock, timeout=10)
+        kwargs = {"old_ver": "3.10", "new_ver": "3.11"}
+        response = server.submit({"envs": [["nope", "default"]], "kwargs": kwargs},
+                                 sock, timeout=10)
+        [result] = response["results"]
+        assert result["env"] == "nope" and result["output"] is None
+        assert result["error"].startswith("FileNotFoundError")
+        srv.shutdown()
+    assert not sock.exists()
@@ -0,0 +1,57 @@
+# test_startup.py
+"""Startup benchmark: the cli must reach its first output (help, argument
+errors) without importing conda or ruamel, which are deferred until needed.
+"""
+import sys
+import subprocess
+
+import pytest
+
+
+HEAVY = ("conda", "ruamel")
+# generous bound on the cumulative import time of new_conda_env.cli
+MAX_IMPORT_US = 500_000
+
+
+def run_py(code: str, *xopts) -> subprocess.CompletedProcess:
+    cmd = [sys.executable, *xopts, "-c", code]
+    return subprocess.run(cmd, capture_output=True, text=True)
+
+
+def parse_importtime(stderr: str) -> dict:
+    """Return {module: cumulative us} from `python -X importtime` output."""
+    times = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumul, name = line[len("import time:"):].split("|")
+        times[name.strip()] = int(cumul)
+    return times
+
+
+def test_import_time():
+    proc = run_py("import new_conda_env.cli", "-X", "importtime")
+    assert proc.returncode == 0, proc.stderr
+    times = parse_importtime(proc.stderr)
+
+    heavy = [m for m in times if m.split(".")[0] in HEAVY]
+    assert heavy == []
+    assert times["new_conda_env.cli"] < MAX_IMPORT_US
+
+
+@pytest.mark.parametrize("argv", [["--help"],
+                                  ["-old_ver", "310", "-new_ver", "3.11",
+                                   "-env_to_clone", "ds310"]])
+def test_first_output_without_conda(argv):
+    code = f"""
+import sys
+from new_conda_env import cli
+try:
+    cli.main({argv!r})
+except (SystemExit, ValueError):
+    pass
+print(sorted(m for m in sys.modules if m.split(".")[0] in {HEAVY!r}))
+"""
+    proc = run_py(code)
+    assert proc.returncode == 0, proc.stderr
+    assert proc.stdout.strip().splitlines()[-1] == "[]"
@@ -0,0 +1,64 @@
+# test_watch.py
+
+import sys
+import time
+import threading
+
+import pytest
+
+from new_conda_env import watch
+
+
+def append_history(prefix, line="# cmd: conda install numpy\n"):
+    with open(watch.history_path(prefix), "a") as f:
+        f.write(line)
+
+
+def test_polling_watcher(tmp_path, make_env):
+    envs = {"ds310": make_env(tmp_path.joinpath("ds310")),
+            "geo310": make_env(tmp_path.joinpath("geo310"))}
+    w = watch.PollingWatcher(envs, interval=0.01)
+    assert w.wait(0) == set()
+    append_history(envs["geo310"])
+    assert w.wait(1) == {"geo310"}
+    assert w.wait(0.05) == set()
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="inotify is Linux only")
+def test_inotify_watcher(tmp_path, make_env):
+    envs = {"ds310": make_env(tmp_path.joinpath("ds310"))}
+    w = watch.InotifyWatcher(envs)
+    try:
+        assert w.wait(0) == set()
+        envs["ds310"].joinpath("conda-meta", "numpy-1.24.1-py310_0.json").write_text("{}")
+        assert w.wait(1) == set()   # not the history
+        append_history(envs["ds310"])
+        assert w.wait(1) == {"ds310"}
+    finally:
+        w.close()
+
+
+@pytest.mark.parametrize("backend", ["poll", "auto"])
+def test_watch_envs_debounce(tmp_path, backend, make_env):
+    envs = {"ds310": make_env(tmp_path.joinpath("ds310")),
+            "geo310": make_env(tmp_path.joinpath("geo310"))}
+    calls = []
+    stop = threading.Event()
+    t = threading.Thread(target=watch.watch_envs,
+                         args=(envs, calls.append),
+                         kwargs=dict(debounce=0.3, interval=0.02,
+                                     backend=backend, stop=stop))
+    t.start()
+    try:
+        time.sleep(0.1)
+        for _ in range(3):   # a burst: one regeneration
+            append_history(envs["ds310"])
+            time.sleep(0.05)
+        deadline = time.monotonic() + 5
+        while not calls and time.monotonic() < deadline:
+            time.sleep(0.05)
+        time.sleep(0.4)
+    finally:
+        stop.set()
+        t.join(5)
+    assert calls == ["ds310"]